@@ -0,0 +1,318 @@
+# ✅ Router benchmark – drive /ask traffic and report latency, throughput, cache hits and stage timings
+#
+#   python benchmark/run_benchmark.py --stack local --scenario mixed --concurrency 16 --duration 30
+#   python benchmark/run_benchmark.py --stack external --url http://localhost:8000 --requests 500
+#   python benchmark/run_benchmark.py --save-baseline benchmark/baselines/mixed.json
+#   python benchmark/run_benchmark.py --baseline benchmark/baselines/mixed.json   # exit 1 on regression
+#
+# Run from backend/. Stacks and stand-ins are described in stack.py, traffic mixes in workloads.py.
+# Mock latency and throughput come from the MOCK_LLM_* variables (common/llm_provider.py).
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stack import ComposeStack, ExternalStack, LocalStack  # noqa: E402
+from workloads import SCENARIOS, Workload  # noqa: E402
+
+# Relative change allowed before a metric counts as a regression (--tolerance overrides)
+DEFAULT_TOLERANCE = 0.15
+# metric path -> direction ("lower" or "higher" is better)
+COMPARED_METRICS = {
+    "latency_ms.p50": "lower",
+    "latency_ms.p95": "lower",
+    "latency_ms.p99": "lower",
+    "throughput_rps": "higher",
+    "error_rate": "lower",
+    "cache_hit_rate": "higher",
+}
+# Absolute slack for rates, so 0.0 -> 0.004 is not a regression
+RATE_SLACK = 0.02
+
+SERVER_TIMING = re.compile(r"([\w-]+)(?:;[^,]*?dur=([\d.]+))?")
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return round(ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower), 1)
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": round(statistics.fmean(values), 1) if values else 0.0,
+        "max": round(max(values), 1) if values else 0.0,
+    }
+
+
+def stage_timings(response: httpx.Response, body: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Per-stage timings: the tool's own "timings" (search, RAG) and any Server-Timing header.
+    """
+    stages = {}
+    reply = (body.get("data") or {}).get("reply")
+    if isinstance(reply, dict) and isinstance(reply.get("timings"), dict):
+        stages.update({key: value for key, value in reply["timings"].items() if isinstance(value, (int, float))})
+    for name, duration in SERVER_TIMING.findall(response.headers.get("server-timing", "")):
+        if duration:
+            stages[name] = float(duration)
+    return stages
+
+
+async def send(client: httpx.AsyncClient, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    record = {"ok": False, "cached": False, "routed_by": None, "stages": {}, "ttft_ms": None}
+    try:
+        if payload["stream"]:
+            async with client.stream("POST", url, json=payload) as response:
+                body: Dict[str, Any] = {}
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event.get("type") == "done":
+                        body = event.get("result") or {}
+                        record["ttft_ms"] = event.get("ttft_ms")
+                    elif event.get("type") == "error":
+                        body = {"status": "error"}
+                    elif "type" not in event:  # plain JSON reply (e.g. an error body)
+                        body = event
+        else:
+            response = await client.post(url, json=payload)
+            body = response.json()
+        record["ok"] = response.status_code == 200 and body.get("status") == "success"
+        record["cached"] = bool(body.get("cached"))
+        record["routed_by"] = (body.get("data") or {}).get("routed_by")
+        record["stages"] = stage_timings(response, body)
+    except (httpx.HTTPError, ValueError) as e:
+        record["error"] = str(e) or type(e).__name__
+    record["latency_ms"] = (time.perf_counter() - started) * 1000
+    return record
+
+
+async def run_load(url: str, workload: Workload, concurrency: int, duration: Optional[float],
+                   total_requests: Optional[int], warmup: int, stream: bool, timeout: float) -> Dict[str, Any]:
+    """
+    Closed loop: `concurrency` workers send /ask requests back to back until the
+    duration or request count is reached. Warmup requests are sent first and not recorded.
+    """
+    records: List[Dict[str, Any]] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        for i in range(warmup):
+            kind, message = workload.next()
+            await send(client, url, {"session_id": "bench-warmup", "message": message, "stream": stream})
+
+        issued = 0
+        deadline = time.monotonic() + duration if duration else None
+
+        async def worker(worker_id: int):
+            nonlocal issued
+            while (deadline is None or time.monotonic() < deadline) and (total_requests is None or issued < total_requests):
+                issued += 1
+                kind, message = workload.next()
+                record = await send(client, url, {"session_id": f"bench-{worker_id}", "message": message, "stream": stream})
+                records.append({**record, "kind": kind})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {"records": records, "elapsed": elapsed}
+
+
+def summarize(records: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    ok = [record for record in records if record["ok"]]
+    latencies = [record["latency_ms"] for record in ok]
+    stages = defaultdict(list)
+    for record in ok:
+        for name, value in record["stages"].items():
+            stages[name].append(value)
+
+    by_kind = defaultdict(list)
+    for record in records:
+        by_kind[record["kind"]].append(record)
+
+    summary = {
+        "requests": len(records),
+        "errors": len(records) - len(ok),
+        "error_rate": round((len(records) - len(ok)) / len(records), 4) if records else 0.0,
+        "duration_s": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "cache_hit_rate": round(sum(record["cached"] for record in ok) / len(ok), 4) if ok else 0.0,
+        "routed_by": dict(Counter(record["routed_by"] for record in ok)),
+        "kinds": {
+            kind: {
+                "requests": len(kind_records),
+                "errors": sum(not record["ok"] for record in kind_records),
+                "cache_hit_rate": round(
+                    sum(record["cached"] for record in kind_records if record["ok"])
+                    / max(1, sum(record["ok"] for record in kind_records)), 4
+                ),
+                "latency_ms": latency_summary([record["latency_ms"] for record in kind_records if record["ok"]]),
+            }
+            for kind, kind_records in sorted(by_kind.items())
+        },
+        "stages_ms": {name: latency_summary(values) for name, values in sorted(stages.items())},
+    }
+    ttfts = [record["ttft_ms"] for record in ok if record["ttft_ms"] is not None]
+    if ttfts:
+        summary["ttft_ms"] = latency_summary(ttfts)
+    return summary
+
+
+def collect_server_stats(urls: Dict[str, str]) -> Dict[str, Any]:
+    stats = {}
+    for name, url in urls.items():
+        try:
+            stats[name] = httpx.get(url, timeout=5.0).json()
+        except (httpx.HTTPError, ValueError) as e:
+            stats[name] = {"error": str(e)}
+    return stats
+
+
+def metric(summary: Dict[str, Any], path: str) -> float:
+    value: Any = summary
+    for key in path.split("."):
+        value = value[key]
+    return float(value)
+
+
+def compare(summary: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """
+    Each compared metric against the baseline; "regressed" when it got worse by more than the tolerance.
+    """
+    rows = []
+    for path, better in COMPARED_METRICS.items():
+        current, previous = metric(summary, path), metric(baseline, path)
+        if path.endswith("rate"):
+            worse_by = (current - previous) if better == "lower" else (previous - current)
+            regressed = worse_by > RATE_SLACK
+        else:
+            change = (current - previous) / previous if previous else 0.0
+            regressed = change > tolerance if better == "lower" else change < -tolerance
+        rows.append({"metric": path, "baseline": previous, "current": current, "regressed": regressed})
+    return rows
+
+
+def print_report(summary: Dict[str, Any], comparison: Optional[List[Dict[str, Any]]] = None):
+    latency = summary["latency_ms"]
+    print(f"\n{summary['requests']} requests in {summary['duration_s']}s "
+          f"({summary['throughput_rps']} req/s, {summary['errors']} errors, "
+          f"cache hit rate {summary['cache_hit_rate']:.0%})")
+    print(f"latency ms   p50 {latency['p50']}   p95 {latency['p95']}   p99 {latency['p99']}   max {latency['max']}")
+    if "ttft_ms" in summary:
+        print(f"ttft ms      p50 {summary['ttft_ms']['p50']}   p95 {summary['ttft_ms']['p95']}")
+    print(f"routed by    {summary['routed_by']}")
+
+    print(f"\n{'kind':<10}{'requests':>10}{'errors':>8}{'hit rate':>10}{'p50':>10}{'p95':>10}")
+    for kind, row in summary["kinds"].items():
+        print(f"{kind:<10}{row['requests']:>10}{row['errors']:>8}{row['cache_hit_rate']:>10.0%}"
+              f"{row['latency_ms']['p50']:>10}{row['latency_ms']['p95']:>10}")
+
+    if summary["stages_ms"]:
+        print(f"\n{'stage':<16}{'p50':>10}{'p95':>10}")
+        for name, row in summary["stages_ms"].items():
+            print(f"{name:<16}{row['p50']:>10}{row['p95']:>10}")
+
+    if comparison:
+        print(f"\n{'metric':<18}{'baseline':>12}{'current':>12}")
+        for row in comparison:
+            flag = "  REGRESSED" if row["regressed"] else ""
+            print(f"{row['metric']:<18}{row['baseline']:>12}{row['current']:>12}{flag}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the router stack with configurable /ask traffic mixes.")
+    parser.add_argument("--stack", choices=["local", "compose", "external"], default="local")
+    parser.add_argument("--url", default=None, help="Router base URL (compose/external stacks).")
+    parser.add_argument("--base-port", type=int, default=18000, help="First port of the local stack.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--unique-ratio", type=float, default=None, help="Share of uncacheable requests.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to run (default: use --requests).")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--stream", action="store_true", help="Use streamed /ask and report time to first token.")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the full report (summary + server stats) as JSON.")
+    parser.add_argument("--save-baseline", help="Store this run's summary as the baseline.")
+    parser.add_argument("--baseline", help="Compare against a stored baseline; exit 1 on regression.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.stack == "local":
+        stack = LocalStack(args.base_port)
+    elif args.stack == "compose":
+        stack = ComposeStack(args.url or "http://localhost:8000")
+    else:
+        stack = ExternalStack(args.url or "http://localhost:8000")
+
+    print(f"Starting {args.stack} stack…")
+    stack.start()
+    try:
+        workload = Workload(args.scenario, args.unique_ratio, args.seed)
+        result = asyncio.run(run_load(
+            f"{stack.url}/ask", workload, args.concurrency, args.duration,
+            None if args.duration else args.requests, args.warmup, args.stream, args.timeout,
+        ))
+        server_stats = collect_server_stats(stack.stats_urls())
+    finally:
+        stack.stop()
+
+    summary = {
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "stream": args.stream,
+        **summarize(result["records"], result["elapsed"]),
+    }
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key in ("scenario", "concurrency", "stream"):
+            if baseline.get(key) != summary[key]:
+                print(f"Warning: baseline {key} is {baseline.get(key)!r}, this run used {summary[key]!r}.")
+        comparison = compare(summary, baseline, args.tolerance)
+    print_report(summary, comparison)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "server_stats": server_stats, "comparison": comparison}, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if comparison and any(row["regressed"] for row in comparison):
+        print("\nPerformance regression against the baseline.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+# ✅ Benchmark stacks – bring the router and tool servers up against local stand-ins
+#
+#   local     every server as a uvicorn subprocess on 127.0.0.1 (base port + offset), with
+#             LLM_PROVIDER=mock, SEARCH_BACKEND=fake, fake_openweather, and the in-memory
+#             cache/session backends standing in for Redis; needs each server's requirements
+#   compose   docker compose with docker-compose.yaml + benchmark/docker-compose.bench.yaml
+#             (same stand-ins, plus the real Redis container)
+#   external  nothing is started: benchmark whatever already serves --url
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (server directory, module, port offset); the chat server is not behind /ask
+LOCAL_SERVERS = {
+    "fake-openweather": ("weather-server", "fake_openweather", 9),
+    "weather": ("weather-server", "5_weather_server", 5),
+    "search": ("search-server", "2_search_server", 2),
+    "think": ("think-server", "3_thinking_server", 3),
+    "rag": ("rag-server", "4_rag_server", 4),
+    "router": ("router-server", "0_mcp_router_true", 0),
+}
+
+# Routes each tool endpoint in config.json is served on
+ENDPOINT_PATHS = {
+    "search": ("search", "/search"),
+    "think": ("think", "/think"),
+    "weather": ("weather", "/query-weather"),
+    "rag": ("rag", "/query"),
+    "query": ("rag", "/query"),
+    "upload": ("rag", "/upload"),
+}
+
+# Stand-in settings shared by the local and compose stacks
+STACK_ENV = {
+    "LLM_PROVIDER": "mock",
+    "SEARCH_BACKEND": "fake",
+    "OPENWEATHER_API_KEY": "benchmark",
+    # The mock has no quota: keep the shared client's bucket out of the measurement
+    "GEMINI_REQUESTS_PER_MINUTE": "600000",
+    "GEMINI_BURST": "10000",
+}
+
+
+def wait_until_ready(url: str, timeout: float = 90.0, process: Optional[subprocess.Popen] = None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} before becoming ready.")
+        try:
+            if httpx.get(url, timeout=2.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} was not ready within {timeout:.0f}s.")
+
+
+class LocalStack:
+    def __init__(self, base_port: int = 18000, workdir: Optional[str] = None):
+        self.base_port = base_port
+        self.workdir = workdir or tempfile.mkdtemp(prefix="router-bench-")
+        self.processes: Dict[str, subprocess.Popen] = {}
+        self.url = f"http://127.0.0.1:{base_port}"
+
+    def port(self, name: str) -> int:
+        return self.base_port + LOCAL_SERVERS[name][2]
+
+    def stats_urls(self) -> Dict[str, str]:
+        return {
+            name: f"http://127.0.0.1:{self.port(name)}/stats"
+            for name in LOCAL_SERVERS if name != "fake-openweather"
+        }
+
+    def write_config(self):
+        """
+        The repo's config.json with every tool endpoint pointed at the local servers.
+        """
+        with open(os.path.join(BACKEND_DIR, "config.json")) as f:
+            config = json.load(f)
+        for key, (server, path) in ENDPOINT_PATHS.items():
+            config[key] = f"http://127.0.0.1:{self.port(server)}{path}"
+        with open(os.path.join(self.workdir, "config.json"), "w") as f:
+            json.dump(config, f, indent=2)
+
+    def start(self):
+        self.write_config()
+        os.makedirs(os.path.join(self.workdir, "logs"), exist_ok=True)
+        os.makedirs(os.path.join(self.workdir, "index"), exist_ok=True)
+        env = {
+            **os.environ,
+            **STACK_ENV,
+            "WEATHER_API_ROOT": f"http://127.0.0.1:{self.port('fake-openweather')}",
+            "RAG_INDEX_DIR": os.path.join(self.workdir, "index"),
+            "SESSION_BACKEND": "memory",
+            "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])),
+        }
+        try:
+            for name, (server_dir, module, _) in LOCAL_SERVERS.items():
+                log = open(os.path.join(self.workdir, "logs", f"{name}.log"), "w")
+                self.processes[name] = subprocess.Popen(
+                    [
+                        sys.executable, "-m", "uvicorn", f"{module}:app",
+                        "--app-dir", os.path.join(BACKEND_DIR, server_dir),
+                        "--host", "127.0.0.1", "--port", str(self.port(name)), "--log-level", "warning",
+                    ],
+                    cwd=self.workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+                )
+            for name, process in self.processes.items():
+                wait_until_ready(f"http://127.0.0.1:{self.port(name)}/health", process=process)
+        except Exception:
+            self.stop()
+            raise RuntimeError(f"Local stack failed to start; see the logs in {self.workdir}/logs.")
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes.clear()
+
+
+class ComposeStack:
+    def __init__(self, url: str = "http://localhost:8000"):
+        self.url = url
+        self.command: List[str] = [
+            "docker", "compose",
+            "-f", os.path.join(BACKEND_DIR, "docker-compose.yaml"),
+            "-f", os.path.join(BACKEND_DIR, "benchmark", "docker-compose.bench.yaml"),
+        ]
+
+    def stats_urls(self) -> Dict[str, str]:
+        # Only the router is reachable from the host for every service
+        return {"router": f"{self.url}/stats"}
+
+    def start(self):
+        subprocess.run(self.command + ["up", "-d", "--build"], check=True, env={**os.environ, **STACK_ENV})
+        wait_until_ready(f"{self.url}/health", timeout=300)
+
+    def stop(self):
+        subprocess.run(self.command + ["down"], check=False)
+
+
+class ExternalStack:
+    def __init__(self, url: str):
+        self.url = url
+
+    def stats_urls(self) -> Dict[str, str]:
+        return {"router": f"{self.url}/stats"}
+
+    def start(self):
+        wait_until_ready(f"{self.url}/health", timeout=10)
+
+    def stop(self):
+        pass
@@ -0,0 +1,82 @@
+# ✅ Workloads – /ask traffic mixes for the benchmark
+#
+# A scenario is a weighted mix of request kinds plus the share of requests made unique
+# (so they cannot be served from the tool cache). Each kind produces messages that take
+# a known path through the router:
+#
+#   weather   rule-routed            -> weather server -> (fake) OpenWeather
+#   search    rule-routed            -> search server  -> (fake) search + LLM
+#   think     rule-routed            -> think server   -> LLM
+#   query     rule-routed            -> RAG server     -> retrieval + LLM
+#   chat      rule-routed            -> router's own chat model
+#   open      classifier / LLM-routed (exercises the router model and the routing stages)
+
+import random
+import uuid
+from typing import Dict, List, Optional
+
+# Cities known to weather-server/fake_openweather.py
+CITIES = ["Kolkata", "Delhi", "Mumbai", "London", "Paris", "New York", "Tokyo", "Sydney"]
+TOPICS = [
+    "electric cars", "solar power", "the stock market", "space launches", "football", "climate policy",
+    "chip manufacturing", "public transport", "vaccines", "open source software", "housing prices", "robotics",
+]
+TASKS = [
+    "plan a two week trip", "pick a database for a chat app", "split a monolith into services",
+    "budget for a small team offsite", "schedule exams for a semester", "reduce a cloud bill",
+]
+
+TEMPLATES: Dict[str, List[str]] = {
+    "weather": ["weather in {city}", "what's the temperature in {city}", "{city} weather"],
+    "search": ["latest news about {topic}", "search the web for {topic}", "look up {topic}"],
+    "think": ["think through how to {task} step by step", "reason through how to {task}"],
+    "query": ["what does the uploaded document say about {topic}", "summarize my pdf on {topic}"],
+    "chat": ["hello", "thanks", "good morning"],
+    "open": ["tell me something interesting about {topic}", "I keep wondering about {topic}, any thoughts"],
+}
+
+SCENARIOS: Dict[str, Dict] = {
+    "mixed": {
+        "mix": {"weather": 30, "search": 25, "chat": 15, "think": 10, "open": 10, "query": 10},
+        "unique_ratio": 0.3,
+    },
+    "cached": {
+        "mix": {"weather": 50, "search": 50},
+        "unique_ratio": 0.0,
+    },
+    "cold": {
+        "mix": {"search": 40, "think": 30, "open": 30},
+        "unique_ratio": 1.0,
+    },
+    "llm": {
+        "mix": {"open": 100},
+        "unique_ratio": 0.5,
+    },
+}
+
+
+class Workload:
+    """
+    Deterministic (seeded) stream of (kind, message) pairs for one scenario.
+    """
+
+    def __init__(self, scenario: str, unique_ratio: Optional[float] = None, seed: int = 7):
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{scenario}'; choose from {', '.join(SCENARIOS)}.")
+        spec = SCENARIOS[scenario]
+        self.scenario = scenario
+        self.kinds = list(spec["mix"])
+        self.weights = [spec["mix"][kind] for kind in self.kinds]
+        self.unique_ratio = spec["unique_ratio"] if unique_ratio is None else unique_ratio
+        self.rng = random.Random(seed)
+
+    def next(self):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        template = self.rng.choice(TEMPLATES[kind])
+        message = template.format(
+            city=self.rng.choice(CITIES), topic=self.rng.choice(TOPICS), task=self.rng.choice(TASKS)
+        )
+        # Weather lookups stay cacheable per city: a suffix would break location extraction
+        if kind not in ("weather", "chat") and self.rng.random() < self.unique_ratio:
+            message = f"{message} ({uuid.UUID(int=self.rng.getrandbits(128)).hex[:8]})"
+        return kind, message
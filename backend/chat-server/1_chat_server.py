@@ -1,31 +1,51 @@
 # ✅ MCP Server 1 – Chat + Memory (Gemini Flash 1.5)
 
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import google.generativeai as genai
-import os
+from common.gemini_client import get_gemini_client
+from common.session_store import SessionMemory, make_gemini_summarizer, to_gemini_contents
+from common.telemetry import install_telemetry
+from common.streaming import NDJSON_MEDIA_TYPE, gemini_text_chunks, ndjson_stream
 
-# Configure the API key
-genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-
-# Initialize the model
-model = genai.GenerativeModel('gemini-1.5-flash')
+# Initialize the model through the shared Gemini client (rate limit, retries, deadlines)
+gemini = get_gemini_client()
+model = gemini.model('gemini-1.5-flash')
 
 app = FastAPI()
-memory_store = {}
+install_telemetry(app, "chat")
+
+# Token-budgeted per-session history: in-process by default; with SESSION_BACKEND=redis
+# (and REDIS_URL) it is shared by every worker and replica, as docker-compose sets it up
+memory_store = SessionMemory(summarizer=make_gemini_summarizer(model))
+
+@app.on_event("shutdown")
+async def close_memory_store():
+    await memory_store.close()
 
 class ChatRequest(BaseModel):
     session_id: str
     message: str
+    stream: bool = False
 
 @app.post("/chat")
-def chat(req: ChatRequest):
-    history = memory_store.get(req.session_id, [])
-    history.append({"role": "user", "parts": [req.message]})
+async def chat(req: ChatRequest):
+    summary, history = await memory_store.add_and_context(req.session_id, "user", req.message)
 
-    response = model.generate_content(history)
+    if req.stream:
+        async def finish(reply: str):
+            await memory_store.add(req.session_id, "model", reply)
+            return {"reply": reply}
+
+        response = await model.generate_content_async(to_gemini_contents(summary, history), stream=True)
+        return StreamingResponse(ndjson_stream(gemini_text_chunks(response), finish), media_type=NDJSON_MEDIA_TYPE)
+
+    response = await model.generate_content_async(to_gemini_contents(summary, history))
     reply = response.text
-    history.append({"role": "model", "parts": [reply]})
+    await memory_store.add(req.session_id, "model", reply)
 
-    memory_store[req.session_id] = history
     return {"reply": reply}
+
+@app.get("/stats")
+async def chat_stats():
+    return {"sessions": await memory_store.stats(), "gemini": gemini.stats()}
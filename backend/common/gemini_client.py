@@ -0,0 +1,286 @@
+# ✅ Shared Gemini client – one place for rate limiting, concurrency, retries, deadlines and accounting
+#
+# Every server gets its models from get_gemini_client().model(...). Each call:
+#   1. takes a token from a token bucket sized to the quota (GEMINI_REQUESTS_PER_MINUTE / GEMINI_BURST),
+#   2. waits for one of GEMINI_MAX_CONCURRENCY in-flight slots,
+#   3. runs with a per-attempt timeout, retrying 429/5xx and timeouts with jittered exponential backoff,
+#   4. never runs past its overall deadline (GEMINI_DEADLINE, or per call).
+# The bucket is per process: give each server its share of the project quota.
+# Calls go to the provider picked by LLM_PROVIDER (see llm_provider.py); with "mock" the same
+# limits apply to a local model, so nothing needs GEMINI_API_KEY or the network.
+#
+# Streamed calls are limited and retried up to the first response; their tokens are counted from
+# the usage metadata of the last chunk read, once the stream ends (or is abandoned).
+
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from common.llm_provider import provider_from_env
+from common import telemetry
+
+logger = logging.getLogger(__name__)
+
+# === Defaults (overridable through GEMINI_* environment variables) ===
+DEFAULT_GEMINI_SETTINGS = {
+    "model": "gemini-1.5-flash",
+    "requests_per_minute": 60,  # token bucket refill rate (split across WEB_CONCURRENCY workers)
+    "burst": 10,                # bucket size: calls allowed back to back
+    "max_concurrency": 8,       # calls in flight at once
+    "timeout": 30.0,            # seconds per attempt
+    "deadline": 60.0,           # seconds per call, including queueing and retries
+    "max_retries": 3,
+    "retry_backoff": 0.5,       # seconds, doubled per attempt, with jitter
+    "max_backoff": 8.0,
+}
+
+# HTTP statuses worth retrying: rate limited, or a transient server error
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+# Per-model call metrics on each server's /metrics (streams: until the first response)
+llm_call_seconds = telemetry.registry.histogram(
+    "llm_call_duration_seconds", "Model calls, including rate-limit waits and retries.",
+    ("service", "model", "status"),
+)
+llm_tokens = telemetry.registry.counter(
+    "llm_tokens_total", "Tokens reported by the model, by direction.", ("service", "model", "direction"),
+)
+
+
+def gemini_settings_from_env() -> Dict[str, Any]:
+    settings = dict(DEFAULT_GEMINI_SETTINGS)
+    for key, default in DEFAULT_GEMINI_SETTINGS.items():
+        value = os.getenv(f"GEMINI_{key.upper()}")
+        if value:
+            settings[key] = type(default)(value)
+    # The quota is per API key: uvicorn workers (WEB_CONCURRENCY) each get their share of it
+    workers = int(os.getenv("WEB_CONCURRENCY", "1") or 1)
+    if workers > 1:
+        settings["requests_per_minute"] = settings["requests_per_minute"] / workers
+        settings["burst"] = max(1, settings["burst"] // workers)
+    return settings
+
+
+class GeminiDeadlineExceeded(asyncio.TimeoutError):
+    """Raised when a call cannot finish (or even start) within its deadline."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, asyncio.TimeoutError) and not isinstance(error, GeminiDeadlineExceeded):
+        return True
+    # google.api_core exceptions carry the HTTP status as .code
+    return getattr(error, "code", None) in RETRYABLE_CODES
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, capacity: int):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None  # created inside the serving event loop
+
+    def _refill(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def try_acquire(self) -> bool:
+        """
+        Take one token if one is available right now.
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def seconds_until_token(self) -> float:
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    async def acquire(self, timeout: float) -> float:
+        """
+        Take one token, waiting for the refill if needed; returns the seconds waited.
+        """
+        started = time.monotonic()
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - started
+                wait = (1 - self.tokens) / self.rate
+                if now + wait - started > timeout:
+                    raise GeminiDeadlineExceeded("Gemini rate limit would exceed the call deadline.")
+                await asyncio.sleep(wait)
+
+
+class GeminiClient:
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, provider: Any = None):
+        self.settings = {**gemini_settings_from_env(), **(settings or {})}
+        self.provider = provider or provider_from_env()
+        self.bucket = TokenBucket(self.settings["requests_per_minute"] / 60, self.settings["burst"])
+        self._slots: Optional[asyncio.Semaphore] = None  # created inside the serving event loop
+        self.in_flight = 0
+        self._attempts = 0
+        self.counters = {
+            "calls": 0, "streams": 0, "retries": 0, "failures": 0, "deadline_exceeded": 0,
+            "prompt_tokens": 0, "output_tokens": 0,
+        }
+        self._latency_ms = 0.0
+        self._max_latency_ms = 0.0
+        self._rate_wait_ms = 0.0
+
+    def model(self, name: Optional[str] = None, **model_kwargs: Any) -> "LimitedModel":
+        name = name or self.settings["model"]
+        return LimitedModel(self, self.provider.model(name, **model_kwargs), name)
+
+    async def call(self, work: Callable[[], Awaitable[Any]], deadline: Optional[float] = None,
+                   stream: bool = False, model: str = "") -> Any:
+        """
+        Run one Gemini request under the rate limit, concurrency bound, retry policy and deadline.
+        """
+        model = model or self.settings["model"]
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await self._call_with_retries(work, deadline)
+            status = "ok"
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            llm_call_seconds.observe(elapsed_ms / 1000, service=telemetry.service_name, model=model, status=status)
+            telemetry.record_stage("llm", elapsed_ms)
+
+        self.counters["streams" if stream else "calls"] += 1
+        if stream:
+            return CountedStream(result, lambda usage: self._count_usage(usage, model))
+        self._count_usage(getattr(result, "usage_metadata", None), model)
+        return result
+
+    async def _call_with_retries(self, work: Callable[[], Awaitable[Any]], deadline: Optional[float]) -> Any:
+        end = time.monotonic() + (deadline or self.settings["deadline"])
+        attempt = 0
+        while True:
+            try:
+                return await self._attempt(work, end)
+            except Exception as e:
+                attempt += 1
+                remaining = end - time.monotonic()
+                backoff = min(self.settings["max_backoff"], self.settings["retry_backoff"] * 2 ** (attempt - 1))
+                backoff *= random.uniform(0.5, 1.5)
+                if not is_retryable(e) or attempt > self.settings["max_retries"] or backoff >= remaining:
+                    self.counters["failures"] += 1
+                    telemetry.count_error("llm_deadline" if isinstance(e, GeminiDeadlineExceeded) else "llm")
+                    if isinstance(e, GeminiDeadlineExceeded):
+                        self.counters["deadline_exceeded"] += 1
+                    raise
+                self.counters["retries"] += 1
+                logger.warning(f"Gemini call failed (attempt {attempt}): {e}; retrying in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+
+    async def _attempt(self, work: Callable[[], Awaitable[Any]], end: float) -> Any:
+        self._rate_wait_ms += await self.bucket.acquire(end - time.monotonic()) * 1000
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.settings["max_concurrency"])
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=max(0.0, end - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise GeminiDeadlineExceeded("No free Gemini slot within the call deadline.")
+        self.in_flight += 1
+        self._attempts += 1
+        started = time.perf_counter()
+        try:
+            timeout = min(self.settings["timeout"], end - time.monotonic())
+            return await asyncio.wait_for(work(), timeout=max(0.0, timeout))
+        except asyncio.TimeoutError:
+            if time.monotonic() >= end:
+                raise GeminiDeadlineExceeded("Gemini call did not finish within its deadline.") from None
+            raise
+        finally:
+            latency_ms = (time.perf_counter() - started) * 1000
+            self._latency_ms += latency_ms
+            self._max_latency_ms = max(self._max_latency_ms, latency_ms)
+            self.in_flight -= 1
+            self._slots.release()
+
+    def _count_usage(self, usage: Any, model: str):
+        if usage is not None:
+            prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+            output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+            self.counters["prompt_tokens"] += prompt_tokens
+            self.counters["output_tokens"] += output_tokens
+            llm_tokens.inc(prompt_tokens, service=telemetry.service_name, model=model, direction="prompt")
+            llm_tokens.inc(output_tokens, service=telemetry.service_name, model=model, direction="output")
+
+    async def embed_content_async(self, deadline: Optional[float] = None, **kwargs: Any) -> Any:
+        return await self.call(lambda: self.provider.embed_content_async(**kwargs), deadline, model=kwargs.get("model", ""))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider.name,
+            **self.counters,
+            "in_flight": self.in_flight,
+            "avg_latency_ms": round(self._latency_ms / self._attempts, 1) if self._attempts else 0.0,
+            "max_latency_ms": round(self._max_latency_ms, 1),
+            "rate_limit_wait_ms": round(self._rate_wait_ms, 1),
+        }
+
+
+class CountedStream:
+    """
+    A streamed response that reports its token usage once iteration stops. Each streamed chunk
+    carries the usage so far, so the last one read holds the total.
+    """
+
+    def __init__(self, response: Any, on_usage: Callable[[Any], None]):
+        self.response = response
+        self.on_usage = on_usage
+
+    async def __aiter__(self):
+        usage = None
+        try:
+            async for chunk in self.response:
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+        finally:
+            self.on_usage(usage)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.response, name)
+
+
+class LimitedModel:
+    """
+    A provider model whose generate_content_async goes through the shared client's limits.
+    """
+
+    def __init__(self, client: GeminiClient, model: Any, name: str):
+        self.client = client
+        self.model = model
+        self.name = name
+
+    async def generate_content_async(self, contents: Any, *, stream: bool = False,
+                                     deadline: Optional[float] = None, **kwargs: Any) -> Any:
+        return await self.client.call(
+            lambda: self.model.generate_content_async(contents, stream=stream, **kwargs), deadline, stream, self.name
+        )
+
+
+_client: Optional[GeminiClient] = None
+
+
+def get_gemini_client() -> GeminiClient:
+    """
+    The process-wide client (created on first use, so importing this module has no side effects).
+    """
+    global _client
+    if _client is None:
+        _client = GeminiClient()
+    return _client
@@ -0,0 +1,204 @@
+# ✅ LLM providers – where model calls actually go
+#
+#   gemini   Google Gemini through google.generativeai (needs GEMINI_API_KEY)
+#   mock     deterministic local model: no key, no network; latency, token throughput and
+#            error rate are configurable (MOCK_LLM_*) so the routing and tool paths can be load-tested
+#
+# LLM_PROVIDER picks one (default "gemini"). A provider offers
+#   model(name, **kwargs)              -> object with async generate_content_async(contents, stream=False, **kwargs)
+#   await embed_content_async(**kwargs) -> {"embedding": [...]}
+# with responses shaped like google.generativeai's: .text and .usage_metadata, and streams
+# that yield chunks with .text.
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from common.session_store import estimate_tokens
+
+# === Mock defaults (overridable through MOCK_LLM_* environment variables) ===
+DEFAULT_MOCK_LLM_SETTINGS = {
+    "latency": 0.05,             # seconds before the first token (time to first response)
+    "tokens_per_second": 200.0,  # output throughput after the first token
+    "output_tokens": 60,         # length of a generated reply
+    "embed_latency": 0.005,      # seconds per embedding call
+    "embedding_dim": 768,
+    "error_rate": 0.0,           # fraction of calls failing with a retryable 503
+}
+
+MOCK_VOCABULARY = (
+    "the system answer request result data model context source value process step detail "
+    "report summary analysis query response latency cache tool route server token budget"
+).split()
+
+
+def mock_settings_from_env() -> Dict[str, Any]:
+    settings = dict(DEFAULT_MOCK_LLM_SETTINGS)
+    for key, default in DEFAULT_MOCK_LLM_SETTINGS.items():
+        value = os.getenv(f"MOCK_LLM_{key.upper()}")
+        if value:
+            settings[key] = type(default)(value)
+    return settings
+
+
+def contents_text(contents: Any) -> str:
+    """
+    Plain text of a prompt given in any of the shapes generate_content accepts.
+    """
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, dict):
+        return contents_text(contents.get("parts", ""))
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(contents_text(part) for part in contents)
+    return str(getattr(contents, "text", contents))
+
+
+def mock_embedding(text: str, dim: int) -> List[float]:
+    """
+    Hashed bag-of-words vector: deterministic, and texts sharing words land close together.
+    """
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", text.lower()):
+        digest = int(hashlib.md5(word.encode()).hexdigest(), 16)
+        vector[digest % dim] += 1.0 if digest & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class MockLLMError(Exception):
+    """
+    Injected failure, shaped like a google.api_core 503 so the retry policy treats it the same.
+    """
+
+    code = 503
+
+
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str] = None):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key or os.environ["GEMINI_API_KEY"])
+        self.genai = genai
+
+    def model(self, name: str, **model_kwargs: Any):
+        return self.genai.GenerativeModel(name, **model_kwargs)
+
+    async def embed_content_async(self, **kwargs: Any) -> Any:
+        return await self.genai.embed_content_async(**kwargs)
+
+
+class MockProvider:
+    name = "mock"
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        self.settings = {**mock_settings_from_env(), **(settings or {})}
+
+    def model(self, name: str, **model_kwargs: Any) -> "MockModel":
+        return MockModel(name, self.settings, model_kwargs.get("system_instruction"))
+
+    async def embed_content_async(self, content: Any = "", **kwargs: Any) -> Dict[str, List[float]]:
+        await asyncio.sleep(self.settings["embed_latency"])
+        return {"embedding": mock_embedding(contents_text(content), self.settings["embedding_dim"])}
+
+
+class MockModel:
+    """
+    Stands in for a GenerativeModel. Replies are a pure function of the prompt; the tool-router
+    prompt gets a routing decision that picks the tool whose name and description best match
+    the user query, so the router's tool paths are exercised too.
+    """
+
+    def __init__(self, name: str, settings: Dict[str, Any], system_instruction: Optional[str] = None):
+        self.model_name = name
+        self.settings = settings
+        self.system_instruction = system_instruction
+
+    async def generate_content_async(self, contents: Any, stream: bool = False, **kwargs: Any):
+        prompt = contents_text(contents)
+        if self.system_instruction:
+            prompt = f"{self.system_instruction}\n\n{prompt}"
+        if random.random() < self.settings["error_rate"]:
+            await asyncio.sleep(self.settings["latency"])
+            raise MockLLMError("Mock model overloaded.")
+        text = self.reply_for(prompt)
+        usage = SimpleNamespace(
+            prompt_token_count=estimate_tokens(prompt),
+            candidates_token_count=estimate_tokens(text),
+            total_token_count=estimate_tokens(prompt) + estimate_tokens(text),
+        )
+
+        await asyncio.sleep(self.settings["latency"])
+        if stream:
+            return MockStream(text, self.settings["tokens_per_second"], usage=usage)
+        await asyncio.sleep(usage.candidates_token_count / self.settings["tokens_per_second"])
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def reply_for(self, prompt: str) -> str:
+        if "intelligent tool router" in prompt:
+            return self.route(prompt)
+        rng = random.Random(hashlib.sha256(prompt.encode()).digest())
+        words = [rng.choice(MOCK_VOCABULARY) for _ in range(self.settings["output_tokens"])]
+        return "Mock reply: " + " ".join(words) + "."
+
+    def route(self, prompt: str) -> str:
+        query_match = re.findall(r'User query: "(.*)"', prompt)
+        query = query_match[-1] if query_match else ""
+        query_words = set(re.findall(r"[a-z]{3,}", query.lower()))
+
+        best, best_score = ("chat", None), 0
+        for name, description, params in re.findall(r"Tool: (\S+)\nDescription: (.*)\nParams: (.*)", prompt):
+            score = 2 * (name in query_words) + len(query_words & set(re.findall(r"[a-z]{3,}", description.lower())))
+            if score > best_score:
+                best, best_score = (name, params), score
+
+        name, params = best
+        parameters = None
+        if name != "chat":
+            parameters = {key.strip(): query for key in params.split(",") if key.strip() not in ("", "none")}
+        return json.dumps({
+            "tool": name,
+            "parameters": parameters,
+            "confidence": "high" if best_score > 1 else "medium",
+            "reply_format": "markdown",
+        })
+
+
+class MockStream:
+    """
+    Async iterable of reply chunks, paced at the configured token throughput; the last chunk
+    carries the usage metadata, as Gemini's final stream chunk does.
+    """
+
+    def __init__(self, text: str, tokens_per_second: float, words_per_chunk: int = 4, usage: Any = None):
+        self.text = text
+        self.tokens_per_second = tokens_per_second
+        self.words_per_chunk = words_per_chunk
+        self.usage = usage
+
+    async def __aiter__(self) -> AsyncIterator[SimpleNamespace]:
+        words = self.text.split(" ")
+        for start in range(0, len(words), self.words_per_chunk):
+            chunk = " ".join(words[start:start + self.words_per_chunk])
+            if start:
+                chunk = " " + chunk
+                await asyncio.sleep(estimate_tokens(chunk) / self.tokens_per_second)
+            last = start + self.words_per_chunk >= len(words)
+            yield SimpleNamespace(text=chunk, usage_metadata=self.usage if last else None)
+
+
+def provider_from_env():
+    """
+    Provider selected by LLM_PROVIDER ("gemini" or "mock").
+    """
+    if os.getenv("LLM_PROVIDER", "gemini").lower() == "mock":
+        return MockProvider()
+    return GeminiProvider()
@@ -0,0 +1,60 @@
+# ✅ Tool self-registration – announce this server's endpoints to the router's tool registry
+#
+# Opt-in: with ROUTER_URL (e.g. http://router:8000) and PUBLIC_URL (how the router reaches this
+# replica, e.g. http://search-2:8002) set, the server registers its tools on startup, re-registers
+# them as a heartbeat well within the router's TTL, and deregisters them on shutdown. Without
+# them, the router only uses the endpoints listed in config.json.
+
+import asyncio
+import logging
+import os
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+async def _register_all(client: httpx.AsyncClient, router_url: str, tools: Dict[str, str]) -> Optional[float]:
+    ttl = None
+    for tool, url in tools.items():
+        try:
+            response = await client.post(f"{router_url}/tools/register", json={"tool": tool, "url": url})
+            response.raise_for_status()
+            ttl = response.json().get("ttl", ttl)
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not register '{tool}' with the router at {router_url}: {e}")
+    return ttl
+
+
+def install_registration(app, paths: Dict[str, str]):
+    """
+    Register tool name -> path on this server (e.g. {"search": "/search"}) with the router.
+    """
+    router_url = os.getenv("ROUTER_URL", "").rstrip("/")
+    public_url = os.getenv("PUBLIC_URL", "").rstrip("/")
+    if not router_url or not public_url:
+        return
+    tools = {tool: public_url + path for tool, path in paths.items()}
+    state: Dict[str, asyncio.Task] = {}
+
+    async def heartbeat():
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            while True:
+                ttl = await _register_all(client, router_url, tools)
+                # Until the router answers, retry quickly; then refresh at a third of its TTL
+                await asyncio.sleep(ttl / 3 if ttl else 5.0)
+
+    @app.on_event("startup")
+    async def start_registration():
+        state["task"] = asyncio.create_task(heartbeat())
+
+    @app.on_event("shutdown")
+    async def stop_registration():
+        state["task"].cancel()
+        async with httpx.AsyncClient(timeout=2.0) as client:
+            for tool, url in tools.items():
+                try:
+                    await client.post(f"{router_url}/tools/deregister", json={"tool": tool, "url": url})
+                except httpx.HTTPError:
+                    pass  # the registration expires on its own
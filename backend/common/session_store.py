@@ -0,0 +1,386 @@
+# ✅ Session memory – bounded, token-budgeted conversation history with pluggable storage
+#
+# With the Redis backend every process (router replicas, uvicorn workers) sees the same
+# sessions; turns are stored compactly as "<role code>|<content>" list entries. Summarizing
+# overflowing turns happens in the background, off the request path.
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "session"
+
+# Stored turns are "<role code>|<content>"; a leading "{" marks the older JSON encoding
+ROLE_CODES = {"user": "u", "model": "m", "tool": "t"}
+CODE_ROLES = {code: role for role, code in ROLE_CODES.items()}
+
+# Seconds one process may hold a session's compaction lock (covers a slow summarizer call)
+COMPACT_LOCK_TTL = 120
+
+# === Defaults (overridable per server, then by environment variables) ===
+DEFAULT_SESSION_SETTINGS = {
+    "backend": "memory",              # "memory" or "redis"
+    "redis_url": "redis://redis:6379/0",
+    "max_tokens": 2000,               # prompt budget for the history window
+    "max_messages": 200,              # hard cap on stored messages per session
+    "idle_ttl": 3600,                 # seconds before an untouched session is evicted
+    "summarize": True,                # fold overflowing turns into a rolling summary
+    "summarize_batch": 8,             # minimum overflowing messages before summarizing
+}
+
+ENV_OVERRIDES = {
+    "backend": ("SESSION_BACKEND", str),
+    "redis_url": ("REDIS_URL", str),
+    "max_tokens": ("SESSION_MAX_TOKENS", int),
+    "max_messages": ("SESSION_MAX_MESSAGES", int),
+    "idle_ttl": ("SESSION_IDLE_TTL", int),
+    "summarize": ("SESSION_SUMMARIZE", lambda value: value.lower() in ("1", "true", "yes")),
+}
+
+Summarizer = Callable[[str, List[Dict[str, str]]], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token) good enough for budgeting.
+    """
+    return max(1, math.ceil(len(text) / 4))
+
+
+def encode_message(message: Dict[str, str]) -> str:
+    code = ROLE_CODES.get(message["role"])
+    if code is None:
+        return json.dumps(message, separators=(",", ":"))
+    return f"{code}|{message['content']}"
+
+
+def decode_message(raw: str) -> Dict[str, str]:
+    if raw.startswith("{"):
+        return json.loads(raw)
+    code, _, content = raw.partition("|")
+    return {"role": CODE_ROLES.get(code, code), "content": content}
+
+
+def summarized_prefix(head: List[Any], overflow: List[Any]) -> int:
+    """
+    How many of the summarized overflow turns are still at the head of the stored list.
+    Appends may have trimmed some of them off the front since they were read, but never
+    anything newer, so the head starts with a suffix of the overflow (possibly empty).
+    """
+    for trimmed in range(len(overflow) + 1):
+        remaining = overflow[trimmed:]
+        if head[:len(remaining)] == remaining:
+            return len(remaining)
+    return 0
+
+
+def format_transcript(messages: List[Dict[str, str]]) -> str:
+    return "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in messages)
+
+
+def to_gemini_contents(summary: str, messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """
+    Convert a summary + window into Gemini's role/parts format (only "user" and "model" roles exist).
+    """
+    contents = []
+    if summary:
+        contents.append({"role": "user", "parts": [f"Summary of the earlier conversation:\n{summary}"]})
+    for msg in messages:
+        if msg["role"] == "model":
+            contents.append({"role": "model", "parts": [msg["content"]]})
+        elif msg["role"] == "tool":
+            contents.append({"role": "user", "parts": [f"Tool result: {msg['content']}"]})
+        else:
+            contents.append({"role": "user", "parts": [msg["content"]]})
+    return contents
+
+
+def make_gemini_summarizer(model) -> Summarizer:
+    """
+    Build a summarizer that folds older turns into the running summary with a Gemini model.
+    """
+    async def summarize(previous_summary: str, messages: List[Dict[str, str]]) -> str:
+        prompt = (
+            "Update the running summary of a conversation with the new turns below. "
+            "Keep names, facts, decisions and open questions; stay under 150 words.\n\n"
+            f"Current summary:\n{previous_summary or '(none)'}\n\n"
+            f"New turns:\n{format_transcript(messages)}"
+        )
+        response = await model.generate_content_async(prompt)
+        return response.text.strip()
+
+    return summarize
+
+
+class MemorySessionStore:
+    """
+    Process-local store; idle sessions are swept lazily on writes.
+    """
+
+    def __init__(self, max_messages: int, idle_ttl: int):
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._locked: set = set()  # sessions being compacted
+        self._last_sweep = time.monotonic()
+        self.evictions = 0
+
+    async def load(self, session_id: str) -> Tuple[str, List[Dict[str, str]]]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return "", []
+        session["last_seen"] = time.monotonic()
+        return session["summary"], list(session["messages"])
+
+    async def append(self, session_id: str, message: Dict[str, str]):
+        session = self._sessions.setdefault(session_id, {"summary": "", "messages": []})
+        session["messages"].append(message)
+        del session["messages"][:-self.max_messages]
+        session["last_seen"] = time.monotonic()
+        self._maybe_sweep()
+
+    async def append_and_load(self, session_id: str, message: Dict[str, str]) -> Tuple[str, List[Dict[str, str]]]:
+        await self.append(session_id, message)
+        return await self.load(session_id)
+
+    async def try_lock(self, session_id: str) -> bool:
+        if session_id in self._locked:
+            return False
+        self._locked.add(session_id)
+        return True
+
+    async def unlock(self, session_id: str):
+        self._locked.discard(session_id)
+
+    async def compact(self, session_id: str, overflow: List[Dict[str, str]], summary: str) -> bool:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return False  # cleared meanwhile: do not bring the summary back
+        del session["messages"][:summarized_prefix(session["messages"], overflow)]
+        session["summary"] = summary
+        return True
+
+    async def delete(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        if now - self._last_sweep < min(60, self.idle_ttl):
+            return
+        self._last_sweep = now
+        idle = [sid for sid, session in self._sessions.items() if now - session["last_seen"] > self.idle_ttl]
+        for sid in idle:
+            del self._sessions[sid]
+        self.evictions += len(idle)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {"sessions": len(self._sessions), "evictions": self.evictions}
+
+    async def close(self):
+        pass
+
+
+class RedisSessionStore:
+    """
+    Redis lists per session so history survives restarts and is shared by replicas and workers.
+    Idle eviction is a key expiry refreshed on every access.
+    """
+
+    def __init__(self, url: str, max_messages: int, idle_ttl: int):
+        import redis.asyncio as aioredis  # only needed when the Redis backend is selected
+
+        self.client = aioredis.Redis.from_url(url, decode_responses=True)
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+
+    def _keys(self, session_id: str) -> Tuple[str, str]:
+        return f"{KEY_PREFIX}:{session_id}:messages", f"{KEY_PREFIX}:{session_id}:summary"
+
+    async def load(self, session_id: str) -> Tuple[str, List[Dict[str, str]]]:
+        messages_key, summary_key = self._keys(session_id)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.get(summary_key)
+            pipe.lrange(messages_key, 0, -1)
+            pipe.expire(messages_key, self.idle_ttl)
+            pipe.expire(summary_key, self.idle_ttl)
+            summary, raw_messages, _, _ = await pipe.execute()
+        return summary or "", [decode_message(raw) for raw in raw_messages]
+
+    async def append(self, session_id: str, message: Dict[str, str]):
+        messages_key, summary_key = self._keys(session_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(messages_key, encode_message(message))
+            pipe.ltrim(messages_key, -self.max_messages, -1)
+            pipe.expire(messages_key, self.idle_ttl)
+            pipe.expire(summary_key, self.idle_ttl)
+            await pipe.execute()
+
+    async def append_and_load(self, session_id: str, message: Dict[str, str]) -> Tuple[str, List[Dict[str, str]]]:
+        """
+        Append a turn and read the session back in one round trip.
+        """
+        messages_key, summary_key = self._keys(session_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(messages_key, encode_message(message))
+            pipe.ltrim(messages_key, -self.max_messages, -1)
+            pipe.expire(messages_key, self.idle_ttl)
+            pipe.expire(summary_key, self.idle_ttl)
+            pipe.get(summary_key)
+            pipe.lrange(messages_key, 0, -1)
+            *_, summary, raw_messages = await pipe.execute()
+        return summary or "", [decode_message(raw) for raw in raw_messages]
+
+    async def try_lock(self, session_id: str) -> bool:
+        return bool(await self.client.set(f"{KEY_PREFIX}:{session_id}:compacting", "1", nx=True, ex=COMPACT_LOCK_TTL))
+
+    async def unlock(self, session_id: str):
+        await self.client.delete(f"{KEY_PREFIX}:{session_id}:compacting")
+
+    async def compact(self, session_id: str, overflow: List[Dict[str, str]], summary: str) -> bool:
+        """
+        Replace the summarized turns with the summary. WATCH makes it a check-and-set: turns
+        appended (and trimmed) meanwhile are taken into account instead of being cut.
+        """
+        from redis.exceptions import WatchError
+
+        messages_key, summary_key = self._keys(session_id)
+        encoded = [encode_message(message) for message in overflow]
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(messages_key)
+                    head = await pipe.lrange(messages_key, 0, len(encoded) - 1)
+                    if not head and not await pipe.exists(messages_key):
+                        return False  # cleared or expired meanwhile: do not bring the summary back
+                    drop = summarized_prefix(head, encoded)
+                    pipe.multi()
+                    if drop:
+                        pipe.ltrim(messages_key, drop, -1)
+                    pipe.set(summary_key, summary, ex=self.idle_ttl)
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    continue  # the list changed between the check and the write: check again
+
+    async def delete(self, session_id: str):
+        await self.client.delete(*self._keys(session_id))
+
+    async def stats(self) -> Dict[str, Any]:
+        sessions = 0
+        async for _ in self.client.scan_iter(match=f"{KEY_PREFIX}:*:messages", count=500):
+            sessions += 1
+        return {"sessions": sessions}
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class SessionMemory:
+    """
+    Keeps each session's history within a token budget: the newest turns that fit are
+    returned verbatim, older turns are folded into a rolling summary (or dropped).
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, summarizer: Optional[Summarizer] = None):
+        settings = {**DEFAULT_SESSION_SETTINGS, **(config or {})}
+        for key, (env_name, cast) in ENV_OVERRIDES.items():
+            if os.getenv(env_name):
+                settings[key] = cast(os.environ[env_name])
+        self.settings = settings
+        self.summarizer = summarizer if settings["summarize"] else None
+
+        if settings["backend"] == "redis":
+            self.store = RedisSessionStore(settings["redis_url"], settings["max_messages"], settings["idle_ttl"])
+        else:
+            self.store = MemorySessionStore(settings["max_messages"], settings["idle_ttl"])
+
+        self.summaries = 0
+        self._compactions: set = set()  # background summarization tasks
+
+    def _split(self, messages: List[Dict[str, str]]) -> int:
+        """
+        Index of the first message inside the token budget (the newest message always fits).
+        """
+        budget = self.settings["max_tokens"]
+        used = 0
+        for index in range(len(messages) - 1, -1, -1):
+            used += estimate_tokens(messages[index]["content"])
+            if used > budget and index < len(messages) - 1:
+                return index + 1
+        return 0
+
+    async def add(self, session_id: str, role: str, content: str):
+        await self.store.append(session_id, {"role": role, "content": str(content)})
+
+    async def context(self, session_id: str) -> Tuple[str, List[Dict[str, str]]]:
+        """
+        Return (summary, window) for prompting; starts folding the overflow into the summary once it is large enough.
+        """
+        summary, messages = await self.store.load(session_id)
+        return await self._window(session_id, summary, messages)
+
+    async def add_and_context(self, session_id: str, role: str, content: str) -> Tuple[str, List[Dict[str, str]]]:
+        """
+        add() followed by context(), with a single store round trip in the common case.
+        """
+        summary, messages = await self.store.append_and_load(session_id, {"role": role, "content": str(content)})
+        return await self._window(session_id, summary, messages)
+
+    async def _window(self, session_id: str, summary: str, messages: List[Dict[str, str]]) -> Tuple[str, List[Dict[str, str]]]:
+        start = self._split(messages)
+        if start == 0:
+            return summary, messages
+        window = messages[start:]
+        if self.summarizer is not None and start < self.settings["summarize_batch"]:
+            return summary, window
+
+        # One compaction per session at a time (across workers with Redis). It runs in the
+        # background: this request, and any until it finishes, use the window, which fits the
+        # budget either way
+        if await self.store.try_lock(session_id):
+            task = asyncio.create_task(self._compact(session_id))
+            self._compactions.add(task)
+            task.add_done_callback(self._compactions.discard)
+        return summary, window
+
+    async def _compact(self, session_id: str):
+        """
+        Fold the session's overflow into its summary; runs holding the session's compaction lock.
+        """
+        try:
+            # Re-read under the lock: another process may have compacted since our load
+            summary, messages = await self.store.load(session_id)
+            overflow = messages[:self._split(messages)]
+            if not overflow or (self.summarizer is not None and len(overflow) < self.settings["summarize_batch"]):
+                return
+            if self.summarizer is not None:
+                summary = await self.summarizer(summary, overflow)
+                self.summaries += 1
+            await self.store.compact(session_id, overflow, summary)
+        except Exception as e:
+            logger.warning(f"Session summarization failed: {e}")
+        finally:
+            await self.store.unlock(session_id)
+
+    async def wait_compactions(self):
+        """
+        Wait for the background compactions started so far.
+        """
+        if self._compactions:
+            await asyncio.gather(*self._compactions, return_exceptions=True)
+
+    async def clear(self, session_id: str):
+        await self.store.delete(session_id)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {"backend": self.settings["backend"], "summaries": self.summaries, **await self.store.stats()}
+
+    async def close(self):
+        await self.wait_compactions()
+        await self.store.close()
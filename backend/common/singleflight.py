@@ -0,0 +1,53 @@
+# ✅ Single-flight – concurrent identical requests share one in-flight upstream call
+
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Lower-case and collapse whitespace (and trailing punctuation) so trivial variations coalesce.
+    """
+    return re.sub(r"\s+", " ", text).strip().lower().rstrip("?!.")
+
+
+class SingleFlight:
+    """
+    The first caller for a key starts the work; callers arriving while it runs await the same
+    result (or exception). The work runs as its own task, so a caller that disconnects does not
+    cancel it for the others.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, work: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(work())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+            "coalescing_ratio": round(self.coalesced / self.calls, 3) if self.calls else 0.0,
+        }
@@ -0,0 +1,77 @@
+# ✅ Streaming helpers – NDJSON token events shared by the router and tool servers
+#
+# Every streamed response is newline-delimited JSON:
+#   {"type": "token", "text": "..."}                       zero or more times
+#   {"type": "done", "result": {...}, "ttft_ms": .., "total_ms": ..}
+#   {"type": "error", "message": "..."}                    instead of "done" on failure
+# "result" is the same body the endpoint returns when not streaming.
+
+import inspect
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def ndjson_event(event_type: str, **fields: Any) -> str:
+    return json.dumps({"type": event_type, **fields}, default=str) + "\n"
+
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+async def gemini_text_chunks(response) -> AsyncIterator[str]:
+    """
+    Yield text from a streamed generate_content_async(..., stream=True) response.
+    """
+    async for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:  # chunk without text parts (e.g. safety metadata)
+            continue
+        if text:
+            yield text
+
+
+async def ndjson_stream(
+    tokens: AsyncIterator[str],
+    build_result: Callable[[str], Any],
+    started: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """
+    Relay text chunks as token events, then a done event whose result is build_result(full_text).
+    build_result may be a coroutine function (e.g. to persist the reply first).
+    """
+    started = started if started is not None else time.perf_counter()
+    ttft_ms = None
+    parts = []
+    try:
+        async for text in tokens:
+            if ttft_ms is None:
+                ttft_ms = elapsed_ms(started)
+            parts.append(text)
+            yield ndjson_event("token", text=text)
+
+        result = build_result("".join(parts))
+        if inspect.isawaitable(result):
+            result = await result
+    except Exception as e:
+        logger.error(f"Streaming failed: {e}")
+        yield ndjson_event("error", message=str(e))
+        return
+
+    yield ndjson_event("done", result=result, ttft_ms=ttft_ms, total_ms=elapsed_ms(started))
+
+
+async def single_event_stream(result: Dict[str, Any], text: str, started: float) -> AsyncIterator[str]:
+    """
+    Stream an already complete result (cache hits, non-streaming tools) as one token + done.
+    """
+    yield ndjson_event("token", text=text)
+    ttft_ms = elapsed_ms(started)
+    yield ndjson_event("done", result=result, ttft_ms=ttft_ms, total_ms=ttft_ms)
@@ -0,0 +1,224 @@
+# ✅ Telemetry – request ids, per-stage timings, Server-Timing headers and Prometheus /metrics
+#
+# install_telemetry(app, "router") gives a server:
+#   - an X-Request-ID on every request (the caller's, or a new one); the router forwards it on
+#     tool calls, so one /ask can be followed through every server's logs
+#   - stage timings: `with stage("router_llm"):` (or record_stage) adds the stage to the request's
+#     Server-Timing header and to the stage_duration_seconds histogram
+#   - GET /metrics in the Prometheus text format (no client library needed)
+#   - GET /health, which the router's tool registry probes
+# Stages that finish after a streamed response has started reach /metrics but not the header.
+# Requests slower than SLOW_REQUEST_MS are logged with their request id and stage breakdown.
+
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+# Seconds; spans cache hits (ms) to slow LLM calls (tens of seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+# Label for every metric this process records (set by install_telemetry)
+service_name = os.getenv("SERVICE_NAME", "app")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        self.values[tuple(str(labels.get(name, "")) for name in self.label_names)] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., +Inf count, sum]
+        self.values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        series = self.values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, series):
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {count:g}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {series[-2]:g}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {series[-2]:g}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str]) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str],
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# === Metrics shared by every server ===
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Time to produce a response (headers, for streams).",
+    ("service", "method", "route", "status"),
+)
+stage_seconds = registry.histogram(
+    "stage_duration_seconds", "Time spent in one stage of handling a request.", ("service", "stage"),
+)
+cache_requests = registry.counter(
+    "cache_requests_total", "Cache lookups by cache and result (hit, miss, stale).", ("service", "cache", "result"),
+)
+errors_total = registry.counter("errors_total", "Errors by kind.", ("service", "kind"))
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def record_stage(name: str, duration_ms: float):
+    """
+    Add a stage to the current request's Server-Timing and to the stage histogram.
+    A stage recorded several times in one request (e.g. one per tool) is summed.
+    """
+    stage_seconds.observe(duration_ms / 1000, service=service_name, stage=name)
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + duration_ms
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, (time.perf_counter() - started) * 1000)
+
+
+def count_cache(cache: str, result: str):
+    cache_requests.inc(service=service_name, cache=cache, result=result)
+
+
+def count_error(kind: str):
+    errors_total.inc(service=service_name, kind=kind)
+
+
+async def forward_request_id(request):
+    """
+    httpx request hook: pass the current request id on to the called server.
+    """
+    request_id = _request_id.get()
+    if request_id and REQUEST_ID_HEADER not in request.headers:
+        request.headers[REQUEST_ID_HEADER] = request_id
+
+
+def server_timing(timings: Dict[str, float], total_ms: float) -> str:
+    entries = [f"{name};dur={duration:.1f}" for name, duration in timings.items()]
+    entries.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(entries)
+
+
+def install_telemetry(app, service: str):
+    """
+    Add the request-id / timing middleware, GET /metrics and GET /health to a FastAPI app.
+    """
+    from fastapi.responses import PlainTextResponse
+
+    global service_name
+    service_name = service
+
+    @app.middleware("http")
+    async def telemetry_middleware(request, call_next):
+        request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex[:16]
+        timings: Dict[str, float] = {}
+        id_token = _request_id.set(request_id)
+        timings_token = _stage_timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        except Exception:
+            count_error("unhandled")
+            raise
+        finally:
+            total_ms = (time.perf_counter() - started) * 1000
+            # The route template (e.g. /jobs/{job_id}) keeps the label set bounded
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            http_request_seconds.observe(
+                total_ms / 1000, service=service_name, method=request.method, route=route, status=str(status)
+            )
+            _request_id.reset(id_token)
+            _stage_timings.reset(timings_token)
+
+        response.headers[REQUEST_ID_HEADER] = request_id
+        response.headers["Server-Timing"] = server_timing(timings, total_ms)
+        if total_ms >= SLOW_REQUEST_MS:
+            logger.warning(f"Slow request {request_id}: {request.method} {request.url.path} "
+                           f"{total_ms:.0f}ms ({server_timing(timings, total_ms)})")
+        return response
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    @app.get("/health", include_in_schema=False)
+    def health():
+        return {"status": "ok", "service": service_name}
@@ -0,0 +1,38 @@
+import asyncio
+
+from common.gemini_client import GeminiClient
+from common.llm_provider import MockProvider
+from common.streaming import gemini_text_chunks
+
+MOCK_SETTINGS = {"latency": 0.0, "tokens_per_second": 1e6, "error_rate": 0.0}
+
+
+def test_streamed_calls_count_their_tokens():
+    async def run():
+        client = GeminiClient(provider=MockProvider(MOCK_SETTINGS))
+        model = client.model("mock-model")
+
+        plain = await model.generate_content_async("explain tides")
+        after_plain = dict(client.counters)
+        assert after_plain["output_tokens"] > 0
+
+        response = await model.generate_content_async("explain tides", stream=True)
+        text = "".join([chunk async for chunk in gemini_text_chunks(response)])
+        assert text == plain.text
+        assert client.counters["streams"] == 1
+        assert client.counters["prompt_tokens"] == 2 * after_plain["prompt_tokens"]
+        assert client.counters["output_tokens"] == 2 * after_plain["output_tokens"]
+
+    asyncio.run(run())
+
+
+def test_abandoned_stream_counts_the_usage_read_so_far():
+    async def run():
+        client = GeminiClient(provider=MockProvider(MOCK_SETTINGS))
+        response = await client.model("mock-model").generate_content_async("explain tides", stream=True)
+        chunks = response.__aiter__()
+        await chunks.__anext__()
+        await chunks.aclose()  # no chunk with usage metadata was read yet
+        assert client.counters["output_tokens"] == 0
+
+    asyncio.run(run())
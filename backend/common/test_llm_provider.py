@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from common.llm_provider import MockLLMError, MockProvider, mock_embedding
+
+FAST = {"latency": 0.0, "tokens_per_second": 1e6, "embed_latency": 0.0, "error_rate": 0.0}
+
+# Same shape as the router's system instruction (tool_selection.build_system_instruction)
+ROUTER_INSTRUCTION = (
+    "You are an intelligent tool router for an AI system.\n\n"
+    "Tool: search\nDescription: Real-time web search using DuckDuckGo.\nParams: q\n\n"
+    "Tool: weather\nDescription: Get current weather information for a specified location.\nParams: query\n\n"
+    "Tool: think\nDescription: For deep thinking and reasoning about complex tasks.\nParams: task"
+)
+
+
+def route(query: str) -> dict:
+    model = MockProvider(FAST).model("gemini-1.5-flash", system_instruction=ROUTER_INSTRUCTION)
+    response = asyncio.run(model.generate_content_async(f'Conversation history:\n\n\nUser query: "{query}"'))
+    return json.loads(response.text)
+
+
+def test_router_prompt_gets_the_best_matching_tool_with_its_params():
+    decision = route("what is the weather in Paris")
+    assert decision["tool"] == "weather" and decision["parameters"] == {"query": "what is the weather in Paris"}
+    assert route("search the web for python news")["tool"] == "search"
+    assert route("reasoning about a complex plan")["parameters"] == {"task": "reasoning about a complex plan"}
+
+
+def test_router_prompt_without_a_matching_tool_goes_to_chat():
+    decision = route("hello there")
+    assert decision["tool"] == "chat" and decision["parameters"] is None
+
+
+def test_replies_are_deterministic_and_report_usage():
+    model = MockProvider({**FAST, "output_tokens": 8}).model("mock")
+
+    async def run():
+        first = await model.generate_content_async("summarize the report")
+        again = await model.generate_content_async("summarize the report")
+        other = await model.generate_content_async("summarize the invoice")
+        return first, again, other
+
+    first, again, other = asyncio.run(run())
+    assert first.text == again.text != other.text
+    assert first.text.startswith("Mock reply:")
+    assert first.usage_metadata.prompt_token_count > 0 and first.usage_metadata.candidates_token_count > 0
+
+
+def test_streams_rebuild_the_reply_with_usage_on_the_last_chunk():
+    model = MockProvider({**FAST, "output_tokens": 20}).model("mock")
+
+    async def run():
+        full = await model.generate_content_async("explain caching")
+        stream = await model.generate_content_async("explain caching", stream=True)
+        return full, [chunk async for chunk in stream]
+
+    full, chunks = asyncio.run(run())
+    assert "".join(chunk.text for chunk in chunks) == full.text
+    assert chunks[-1].usage_metadata is not None
+    assert all(chunk.usage_metadata is None for chunk in chunks[:-1])
+
+
+def test_injected_errors_look_like_a_retryable_503():
+    model = MockProvider({**FAST, "error_rate": 1.0}).model("mock")
+    with pytest.raises(MockLLMError) as error:
+        asyncio.run(model.generate_content_async("anything"))
+    assert error.value.code == 503
+
+
+def test_mock_embeddings_are_deterministic_unit_vectors():
+    first = np.asarray(mock_embedding("weather in paris", 64))
+    assert np.allclose(first, mock_embedding("weather in paris", 64))
+    assert np.isclose(np.linalg.norm(first), 1.0)
+    related = first @ np.asarray(mock_embedding("paris weather today", 64))
+    unrelated = first @ np.asarray(mock_embedding("invoice number overdue", 64))
+    assert related > unrelated
+
+    provider = MockProvider({**FAST, "embedding_dim": 64})
+    result = asyncio.run(provider.embed_content_async(content="weather in paris"))
+    assert np.allclose(result["embedding"], first)
@@ -0,0 +1,101 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from common.session_store import MemorySessionStore, RedisSessionStore, SessionMemory, summarized_prefix
+
+
+def turns(*contents):
+    return [{"role": "user", "content": content} for content in contents]
+
+
+def memory_store(max_messages: int) -> MemorySessionStore:
+    return MemorySessionStore(max_messages=max_messages, idle_ttl=3600)
+
+
+def redis_store(max_messages: int) -> RedisSessionStore:
+    store = RedisSessionStore("redis://localhost:6379/0", max_messages=max_messages, idle_ttl=3600)
+    store.client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return store
+
+
+STORES = [memory_store, redis_store]
+
+
+def test_summarized_prefix_accounts_for_turns_trimmed_meanwhile():
+    assert summarized_prefix(list("abcxy"), list("abc")) == 3
+    assert summarized_prefix(list("bcxy"), list("abc")) == 2
+    assert summarized_prefix(list("xy"), list("abc")) == 0
+
+
+@pytest.mark.parametrize("make_store", STORES)
+def test_compaction_keeps_turns_appended_during_summarization(make_store):
+    async def run():
+        store = make_store(5)
+        for content in "abcd":
+            await store.append("s1", turns(content)[0])
+        _, messages = await store.load("s1")
+        overflow = messages[:3]  # "a", "b", "c" go to the summarizer
+
+        # While it runs, two more turns arrive and the cap trims "a" off the front
+        for content in "ef":
+            await store.append("s1", turns(content)[0])
+
+        assert await store.compact("s1", overflow, "summary of a, b, c")
+        summary, messages = await store.load("s1")
+        assert summary == "summary of a, b, c"
+        assert [message["content"] for message in messages] == ["d", "e", "f"]
+        await store.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("make_store", STORES)
+def test_compaction_of_a_cleared_session_does_not_restore_it(make_store):
+    async def run():
+        store = make_store(10)
+        for content in "abc":
+            await store.append("s1", turns(content)[0])
+        _, messages = await store.load("s1")
+        await store.delete("s1")
+        assert not await store.compact("s1", messages[:2], "stale summary")
+        assert await store.load("s1") == ("", [])
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_memory_backend_is_the_default(monkeypatch):
+    monkeypatch.delenv("SESSION_BACKEND", raising=False)
+    assert isinstance(SessionMemory().store, MemorySessionStore)
+    monkeypatch.setenv("SESSION_BACKEND", "redis")
+    assert isinstance(SessionMemory().store, RedisSessionStore)
+
+
+def test_summarization_runs_off_the_request_path():
+    async def run():
+        calls = []
+
+        async def slow_summarizer(previous: str, messages):
+            calls.append([message["content"] for message in messages])
+            await asyncio.sleep(0.3)
+            return "summary"
+
+        memory = SessionMemory({"backend": "memory", "max_tokens": 1, "summarize_batch": 2}, summarizer=slow_summarizer)
+        for content in ("aaaa", "bbbb", "cccc"):
+            await memory.add("s1", "user", content)
+
+        started = asyncio.get_running_loop().time()
+        summary, window = await memory.add_and_context("s1", "user", "dddd")
+        assert asyncio.get_running_loop().time() - started < 0.1
+        assert summary == "" and [message["content"] for message in window] == ["dddd"]
+
+        # A request while the summary is being written gets the same window, without a second summarization
+        assert await memory.context("s1") == ("", window)
+        await memory.wait_compactions()
+        assert calls == [["aaaa", "bbbb", "cccc"]]
+        assert await memory.context("s1") == ("summary", window)
+        await memory.close()
+
+    asyncio.run(run())
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from common.singleflight import SingleFlight, normalize_text
+
+
+def test_normalize_text_collapses_trivial_variations():
+    assert normalize_text("  Weather   in PARIS?! ") == "weather in paris"
+
+
+def test_concurrent_callers_share_one_call():
+    async def run():
+        flights = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("k", work) for _ in range(5)))
+        assert results == ["result"] * 5 and len(calls) == 1
+        assert flights.stats()["coalesced"] == 4 and flights.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+def test_errors_reach_every_waiter_and_are_not_remembered():
+    async def run():
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        outcomes = await asyncio.gather(flights.do("k", fail), flights.do("k", fail), return_exceptions=True)
+        assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+        async def succeed():
+            return "ok"
+
+        assert await flights.do("k", succeed) == "ok"
+
+    asyncio.run(run())
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_call():
+    async def run():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.create_task(flights.do("k", work))
+        second = asyncio.create_task(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == "done"
+
+    asyncio.run(run())
@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+from common.streaming import ndjson_stream, single_event_stream
+
+
+async def collect(stream):
+    return [json.loads(line) async for line in stream]
+
+
+async def tokens(*parts, fail: bool = False):
+    for part in parts:
+        yield part
+    if fail:
+        raise RuntimeError("upstream went away")
+
+
+def test_ndjson_stream_relays_tokens_then_the_result():
+    async def run():
+        async def persist(text: str):
+            return {"reply": text}
+
+        events = await collect(ndjson_stream(tokens("Hel", "lo"), persist))
+        assert [event["type"] for event in events] == ["token", "token", "done"]
+        assert events[-1]["result"] == {"reply": "Hello"}
+        assert events[-1]["ttft_ms"] is not None
+
+    asyncio.run(run())
+
+
+def test_a_failing_stream_ends_with_an_error_event():
+    async def run():
+        events = await collect(ndjson_stream(tokens("partial", fail=True), lambda text: {"reply": text}))
+        assert [event["type"] for event in events] == ["token", "error"]
+        assert events[-1]["message"] == "upstream went away"
+
+    asyncio.run(run())
+
+
+def test_single_event_stream_wraps_a_complete_result():
+    async def run():
+        events = await collect(single_event_stream({"reply": "cached"}, "cached", 0.0))
+        assert [event["type"] for event in events] == ["token", "done"]
+        assert events[0]["text"] == "cached"
+
+    asyncio.run(run())
@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from common import telemetry
+from common.telemetry import REQUEST_ID_HEADER, Counter, Histogram, install_telemetry, stage
+
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    histogram = Histogram("job_seconds", "Job time.", ("kind",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, kind="a")
+    histogram.observe(0.5, kind="a")
+    histogram.observe(5.0, kind="a")
+    assert histogram.render() == [
+        "# HELP job_seconds Job time.",
+        "# TYPE job_seconds histogram",
+        'job_seconds_bucket{kind="a",le="0.1"} 1',
+        'job_seconds_bucket{kind="a",le="1"} 2',
+        'job_seconds_bucket{kind="a",le="+Inf"} 3',
+        'job_seconds_sum{kind="a"} 5.550000',
+        'job_seconds_count{kind="a"} 3',
+    ]
+
+
+def test_counter_escapes_label_values():
+    counter = Counter("errors_seen_total", "Errors.", ("kind",))
+    counter.inc(kind='bad "quote"\n')
+    counter.inc(2, kind='bad "quote"\n')
+    assert counter.render()[-1] == 'errors_seen_total{kind="bad \\"quote\\"\\n"} 3'
+
+
+def telemetry_app(monkeypatch, service: str) -> FastAPI:
+    monkeypatch.setattr(telemetry, "service_name", telemetry.service_name)  # restored after the test
+    app = FastAPI()
+    install_telemetry(app, service)  # metrics are process-wide: a service name per test keeps series apart
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        with stage("lookup"):
+            time.sleep(0.002)
+        forwarded = httpx.Request("GET", "http://tool/")
+        await telemetry.forward_request_id(forwarded)
+        return {"item": item_id, "forwarded": forwarded.headers.get(REQUEST_ID_HEADER)}
+
+    return app
+
+
+def get(app: FastAPI, *paths: str, headers=None):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.get(path, headers=headers) for path in paths]
+
+    return asyncio.run(run())
+
+
+def test_requests_get_an_id_and_a_server_timing_header(monkeypatch):
+    app = telemetry_app(monkeypatch, "timing-test")
+    given, generated = get(app, "/items/1", headers={REQUEST_ID_HEADER: "abc123"})[0], get(app, "/items/2")[0]
+
+    assert given.headers[REQUEST_ID_HEADER] == "abc123"
+    assert given.json()["forwarded"] == "abc123"  # passed on to tool calls
+    assert generated.headers[REQUEST_ID_HEADER] and generated.headers[REQUEST_ID_HEADER] != "abc123"
+
+    entries = dict(entry.split(";dur=") for entry in given.headers["Server-Timing"].split(", "))
+    assert set(entries) == {"lookup", "total"}
+    assert float(entries["lookup"]) >= 2.0 and float(entries["total"]) >= float(entries["lookup"])
+
+
+def test_metrics_use_route_templates_and_health_reports_the_service(monkeypatch):
+    app = telemetry_app(monkeypatch, "metrics-test")
+    _, _, metrics, health = get(app, "/items/1", "/items/2", "/metrics", "/health")
+
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = metrics.text
+    assert (
+        'http_request_duration_seconds_count{service="metrics-test",method="GET",route="/items/{item_id}",status="200"} 2'
+        in body
+    )
+    assert 'stage_duration_seconds_count{service="metrics-test",stage="lookup"}' in body
+    assert health.json() == {"status": "ok", "service": "metrics-test"}
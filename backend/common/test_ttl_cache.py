@@ -0,0 +1,22 @@
+import time
+
+from common.ttl_cache import TTLCache
+
+
+def test_entries_report_their_age_and_expire():
+    cache = TTLCache(max_entries=10, max_age=0.05)
+    cache.set("k", "v")
+    value, age = cache.get("k")
+    assert value == "v" and 0 <= age < 0.05
+    time.sleep(0.06)
+    assert cache.get("k") is None and len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = TTLCache(max_entries=2, max_age=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a")[0] == 1 and cache.get("c")[0] == 3
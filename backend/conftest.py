@@ -0,0 +1,9 @@
+# ✅ Test setup – lets each server's tests import the shared "common" package the way the servers do
+#
+# Tests sit next to the modules they cover (e.g. rag-server/test_index_store.py); pytest puts
+# that server's directory on sys.path, and this file puts backend/ there for "common".
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -1,21 +1,31 @@
 # # ✅ MCP Server 4 – RAG (Docs + Gemini Flash 1.5)
 
 import os
+import shutil
 import tempfile
-from fastapi import FastAPI, UploadFile
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain.chains import RetrievalQA
+import time
+from fastapi import FastAPI, Form, HTTPException, UploadFile
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Optional
+from common.streaming import NDJSON_MEDIA_TYPE, ndjson_stream, single_event_stream
+from common.telemetry import install_telemetry
+from common.registration import install_registration
 from redis import Redis
 import pickle
-
-# Set Google API key
-os.environ["GOOGLE_API_KEY"] = os.environ.get("GEMINI_API_KEY")
+from namespaces import DEFAULT_NAMESPACE, NamespaceIndexes, namespace_for
+from retrieval import RetrievalPipeline
+from rerank import reranker_from_env
+from providers import models_from_env
+from ingest import IngestPipeline, QueueFullError, ingest_settings_from_env
+from embedding_cache import EmbeddingCache
 
 app = FastAPI()
+install_telemetry(app, "rag")
+install_registration(app, {"query": "/query", "rag": "/query", "upload": "/upload"})  # opt-in: ROUTER_URL + PUBLIC_URL
 
 # Add CORS middleware
 app.add_middleware(
@@ -26,86 +36,187 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 📌 Initialize models
-embedding_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
+# 📌 Initialize models (LLM_PROVIDER=mock runs without Gemini)
+embedding_model, llm = models_from_env()
 
-# Initialize Redis connection
-redis_client = Redis(host="redis", port=6379, decode_responses=True)
+# Initialize Redis connection (only used to migrate the legacy pickled index)
+redis_client = Redis(host="redis", port=6379)
 
-# Global variable to hold the FAISS vector store in memory
-vectorstore = None
+# On-disk segmented FAISS indexes, one per namespace (session or collection id),
+# memory-mapped on first use and unloaded again when idle
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", "/data/index")
+RAG_MAX_SEGMENTS = int(os.getenv("RAG_MAX_SEGMENTS", "16"))
+RAG_MAX_LOADED_NAMESPACES = int(os.getenv("RAG_MAX_LOADED_NAMESPACES", "32"))
+indexes = NamespaceIndexes(RAG_INDEX_DIR, max_loaded=RAG_MAX_LOADED_NAMESPACES, max_segments=RAG_MAX_SEGMENTS)
 
 @app.on_event("startup")
 async def load_vectorstore():
     """
-    Load the FAISS vector store from Redis on server startup.
+    Open the default namespace; on first start, migrate the legacy whole-index pickle from Redis into it.
     """
-    global vectorstore
+    vector_index = await indexes.open(DEFAULT_NAMESPACE)
+    if vector_index.ntotal:
+        print(f"Loaded index with {vector_index.ntotal} vectors from {RAG_INDEX_DIR}.")
+        return
     try:
-        # Load FAISS index from Redis
         faiss_data = redis_client.get("faiss_index")
-        if (faiss_data):
-            vectorstore = pickle.loads(faiss_data)
-            print("FAISS vector store loaded from Redis.")
+        if faiss_data:
+            migrate_pickled_vectorstore(vector_index, pickle.loads(faiss_data))
+            print(f"Migrated FAISS vector store from Redis to {RAG_INDEX_DIR}.")
         else:
-            print("No FAISS vector store found in Redis.")
+            print("No documents indexed yet.")
     except Exception as e:
-        print(f"Failed to load FAISS vector store from Redis: {e}")
-        vectorstore = None
+        print(f"Failed to migrate FAISS vector store from Redis: {e}")
 
 @app.on_event("shutdown")
-async def save_vectorstore():
+async def close_indexes():
+    await indexes.close()
+
+def migrate_pickled_vectorstore(vector_index, vectorstore):
     """
-    Save the FAISS vector store to Redis on server shutdown.
+    Copy a LangChain FAISS vector store into a segmented index as one segment.
     """
-    global vectorstore
-    if vectorstore:
-        try:
-            # Save FAISS index to Redis
-            redis_client.set("faiss_index", pickle.dumps(vectorstore))
-            print("FAISS vector store saved to Redis.")
-        except Exception as e:
-            print(f"Failed to save FAISS vector store to Redis: {e}")
-
-@app.post("/upload")
-async def upload_pdf(file: UploadFile):
-    global vectorstore
-
-    # Save uploaded file to temp location
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(await file.read())
-        tmp_path = tmp.name
+    vectors = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal)
+    documents = [
+        vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+        for i in range(vectorstore.index.ntotal)
+    ]
+    vector_index.append(vectors, documents)
+
+# Background ingestion: /upload queues a job, workers parse, chunk, embed and index it
+RAG_UPLOAD_DIR = os.getenv("RAG_UPLOAD_DIR", tempfile.gettempdir())
+splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+embedding_cache = EmbeddingCache(os.path.join(RAG_INDEX_DIR, "embedding_cache.sqlite"))
+ingest_pipeline = IngestPipeline(
+    indexes, embedding_model, splitter, ingest_settings_from_env(), embedding_cache=embedding_cache
+)
 
-    # 📄 Load PDF using LangChain loader
-    loader = PyMuPDFLoader(tmp_path)
-    documents = loader.load()
+@app.on_event("startup")
+async def start_ingest_workers():
+    await ingest_pipeline.start()
 
-    # 📚 Split into chunks
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    chunks = splitter.split_documents(documents)
+@app.on_event("shutdown")
+async def stop_ingest_workers():
+    await ingest_pipeline.stop()
 
-    # 🧠 Create or extend FAISS vector store
-    if vectorstore is None:
-        vectorstore = FAISS.from_documents(chunks, embedding=embedding_model)
-    else:
-        vectorstore.add_documents(chunks)
+# Retrieval + QA pipeline built once for the server's lifetime
+# (RAG_RERANKER picks the optional reranking stage: lexical, cross-encoder or none)
+retrieval_pipeline = RetrievalPipeline(embedding_model, llm, reranker=reranker_from_env())
 
-    return {"status": "uploaded", "chunks": len(chunks)}
+@app.post("/upload", status_code=202)
+async def upload_pdf(file: UploadFile, session_id: Optional[str] = Form(None), collection: Optional[str] = Form(None)):
+    """
+    Spool the PDF to disk and queue it for ingestion into the session's (or collection's)
+    namespace; poll /jobs/{job_id} for progress.
+    """
+    namespace = namespace_for(session_id, collection)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=RAG_UPLOAD_DIR) as tmp:
+        await run_in_threadpool(shutil.copyfileobj, file.file, tmp)
+        tmp_path = tmp.name
 
-@app.post("/query")
-async def query_rag(q: dict):
-    global vectorstore
-    question = q["question"]
+    try:
+        job = ingest_pipeline.submit(tmp_path, file.filename, namespace)
+    except QueueFullError as e:
+        os.remove(tmp_path)
+        raise HTTPException(status_code=503, detail=str(e))
 
-    if vectorstore is None:
-        return {"error": "No documents uploaded yet."}
+    return {"status": "queued", "job_id": job.id, "namespace": namespace}
 
-    # 🔎 Setup QA chain with FAISS retriever
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        retriever=vectorstore.as_retriever()
-    )
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """
+    Progress of an ingestion job: pages and chunks done, throughput in pages/sec and chunks/sec.
+    """
+    job = ingest_pipeline.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    return job.to_dict()
+
+@app.get("/jobs")
+def list_jobs(session_id: Optional[str] = None, collection: Optional[str] = None):
+    jobs = ingest_pipeline.jobs.values()
+    if session_id or collection:
+        namespace = namespace_for(session_id, collection)
+        jobs = [job for job in jobs if job.namespace == namespace]
+    return {
+        "queue_depth": ingest_pipeline.queue_depth(),
+        "jobs": [job.to_dict() for job in jobs],
+    }
+
+class QueryRequest(BaseModel):
+    question: str
+    stream: bool = False
+    # Namespace to search: an explicit collection, else the session's own uploads
+    session_id: Optional[str] = None
+    collection: Optional[str] = None
+    # Retrieval tuning (defaults in retrieval.DEFAULT_RETRIEVAL_SETTINGS)
+    k: Optional[int] = None
+    search_type: Optional[str] = None  # "similarity", "mmr" or "hybrid"
+    fetch_k: Optional[int] = None
+    lambda_mult: Optional[float] = None
+    score_threshold: Optional[float] = None
+    rrf_k: Optional[int] = None
+    rerank: Optional[bool] = None
 
-    answer = qa_chain.run(question)
-    return {"answer": answer}
+@app.post("/query")
+async def query_rag(q: QueryRequest):
+    own_namespace = namespace_for(q.session_id, q.collection)
+    namespace = indexes.query_namespace(q.session_id, q.collection)
+    # Answers can still change while uploads to this namespace are indexing, so callers shouldn't cache them
+    cacheable = ingest_pipeline.pending_jobs(own_namespace) == 0 and ingest_pipeline.pending_jobs(namespace) == 0
+    if not indexes.exists(namespace):
+        return no_documents(q)
+
+    # 🔎 Retrieve from this namespace only, with the per-request settings, off the event loop
+    async with indexes.lease(namespace) as vector_index:
+        if vector_index.ntotal == 0:
+            return no_documents(q)
+        documents, timings = await retrieval_pipeline.retrieve(
+            vector_index, q.question, k=q.k, search_type=q.search_type, fetch_k=q.fetch_k,
+            lambda_mult=q.lambda_mult, score_threshold=q.score_threshold, rrf_k=q.rrf_k, rerank=q.rerank,
+        )
+
+    if q.stream:
+        finish = lambda answer: {"answer": answer, "timings": timings, "cacheable": cacheable}
+        tokens = retrieval_pipeline.stream_answer(q.question, documents)
+        return StreamingResponse(ndjson_stream(tokens, finish), media_type=NDJSON_MEDIA_TYPE)
+
+    answer = await retrieval_pipeline.answer(q.question, documents, timings)
+    return {"answer": answer, "timings": timings, "cacheable": cacheable}
+
+def no_documents(q: QueryRequest):
+    body = {"error": "No documents uploaded yet.", "cacheable": False}
+    if q.stream:  # streaming callers expect NDJSON events, not a plain JSON body
+        return StreamingResponse(single_event_stream(body, body["error"], time.perf_counter()), media_type=NDJSON_MEDIA_TYPE)
+    return body
+
+@app.get("/index/stats")
+async def index_stats(session_id: Optional[str] = None, collection: Optional[str] = None):
+    """
+    Stats for one namespace (the default one unless session_id/collection is given).
+    """
+    namespace = namespace_for(session_id, collection)
+    stats = {
+        "namespace": namespace,
+        "namespaces": len(indexes.names()),
+        **indexes.stats(),
+        "cached_embeddings": embedding_cache.count(),
+        **retrieval_pipeline.stats(),
+    }
+    if indexes.exists(namespace):
+        async with indexes.lease(namespace) as vector_index:
+            stats.update(await run_in_threadpool(vector_index.stats))
+    return stats
+
+@app.post("/index/compact")
+async def compact_index(session_id: Optional[str] = None, collection: Optional[str] = None):
+    """
+    Merge a namespace's smallest segments into one (also happens automatically past RAG_MAX_SEGMENTS).
+    """
+    namespace = namespace_for(session_id, collection)
+    if not indexes.exists(namespace):
+        raise HTTPException(status_code=404, detail="Unknown namespace.")
+    async with indexes.lease(namespace) as vector_index:
+        merged = await run_in_threadpool(vector_index.compact)
+        stats = await run_in_threadpool(vector_index.stats)
+        return {"status": "compacted", "namespace": namespace, "merged_segments": merged, **stats}
@@ -0,0 +1,93 @@
+# ✅ Chunk deduplication – content hashes, a persistent embedding cache and an indexed-chunk registry
+
+import hashlib
+import re
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+
+
+def chunk_hash(text: str) -> str:
+    """
+    Hash of a chunk's text with whitespace normalised, so re-extracted copies match.
+    """
+    return hashlib.sha256(re.sub(r"\s+", " ", text).strip().encode()).hexdigest()
+
+
+class _SqliteStore:
+    def __init__(self, path: str, schema: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(schema)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def _select_in(self, sql: str, params: List[str], values: List[str]) -> list:
+        rows = []
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(values), 500):
+                chunk = values[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows.extend(self._conn.execute(sql.format(placeholders=placeholders), params + chunk).fetchall())
+        return rows
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache(_SqliteStore):
+    """
+    Persistent (model, chunk hash) -> vector cache, so re-uploads never pay for the same embedding twice.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path, (
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        ))
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        rows = self._select_in(
+            "SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+            [model], list(hashes),
+        )
+        return {h: np.frombuffer(blob, dtype="float32") for h, blob in rows}
+
+    def put_many(self, model: str, items: Dict[str, np.ndarray]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, h, np.asarray(v, dtype="float32").tobytes()) for h, v in items.items()],
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class ChunkRegistry(_SqliteStore):
+    """
+    Hashes of every chunk already committed to an index, used to skip duplicate inserts.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path, "CREATE TABLE IF NOT EXISTS chunks (hash TEXT PRIMARY KEY)")
+
+    def existing(self, hashes: Iterable[str]) -> Set[str]:
+        rows = self._select_in("SELECT hash FROM chunks WHERE hash IN ({placeholders})", [], list(hashes))
+        return {h for (h,) in rows}
+
+    def add(self, hashes: Iterable[str]):
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO chunks (hash) VALUES (?)", [(h,) for h in hashes])
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
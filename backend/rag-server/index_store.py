@@ -0,0 +1,381 @@
+# ✅ Segmented on-disk FAISS index – append-only segments, mmap loading, compaction
+#
+# Layout of an index directory:
+#   manifest.json            {"dim": 768, "segments": ["000001", "000002", ...]}
+#   segments/<name>.faiss    native FAISS index holding the segment's vectors
+#   segments/<name>.jsonl    docstore: one {"page_content", "metadata"} line per vector
+#   segments/<name>.offsets.npy  byte offset of each docstore line (for random access)
+#   chunks.sqlite            content hashes of every committed chunk (duplicate detection)
+#   sparse.sqlite            FTS5 keyword index over every chunk (BM25 side of hybrid search)
+#
+# Every upload writes a new segment (each file fsynced, then renamed into place) and then
+# atomically rewrites the manifest, so a crash never loses committed uploads and never
+# exposes a half-written segment. Searches pin the segments they read, so a compaction
+# deletes the files it replaced only once they are released.
+
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from embedding_cache import ChunkRegistry, chunk_hash
+from sparse_index import SparseIndex
+
+logger = logging.getLogger(__name__)
+
+
+def _fsync_path(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_durable(path: str, write: Callable[[str], None]):
+    """
+    write(tmp_path) the file's contents, fsync them and only then rename the file into place;
+    the caller fsyncs the directory once its renames are done.
+    """
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    _fsync_path(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_json_atomic(path: str, data: dict):
+    def write(tmp_path: str):
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+
+    _write_durable(path, write)
+    _fsync_path(os.path.dirname(path))
+
+
+class IndexSegment:
+    """
+    One immutable segment: a memory-mapped FAISS index plus a docstore read on demand.
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        base = os.path.join(directory, name)
+        self.index_path = f"{base}.faiss"
+        self.docstore_path = f"{base}.jsonl"
+        self.offsets_path = f"{base}.offsets.npy"
+        # IO_FLAG_MMAP_IFC maps the flat vectors themselves; IO_FLAG_MMAP alone still copies them to the heap
+        self.index = faiss.read_index(self.index_path, faiss.IO_FLAG_MMAP_IFC)
+        self.offsets = np.load(self.offsets_path, mmap_mode="r")
+        # Held open for the segment's lifetime, so a compaction cannot pull the docstore from under a reader
+        self._docstore = open(self.docstore_path, "rb")
+        self._lock = threading.Lock()
+        self._readers = 0
+        self._retired = False
+        self._delete_on_release = False
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @classmethod
+    def write(cls, directory: str, name: str, vectors: np.ndarray, documents: List[Document]) -> "IndexSegment":
+        records = (
+            json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}, default=str).encode() + b"\n"
+            for doc in documents
+        )
+        return cls._write(directory, name, [vectors], records)
+
+    @classmethod
+    def merge(cls, directory: str, name: str, segments: List["IndexSegment"]) -> "IndexSegment":
+        """
+        Write one segment holding the vectors and docstore lines of the given ones, a segment at a time.
+        """
+        return cls._write(
+            directory, name,
+            (segment.vectors() for segment in segments),
+            (line for segment in segments for line in segment.records()),
+        )
+
+    @classmethod
+    def _write(cls, directory: str, name: str, vector_batches, records) -> "IndexSegment":
+        base = os.path.join(directory, name)
+        index = None
+        for vectors in vector_batches:
+            if index is None:
+                index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(vectors)
+        # Every file is on disk (and renamed into place) before the manifest can name the segment
+        _write_durable(f"{base}.faiss", lambda path: faiss.write_index(index, path))
+
+        offsets = []
+
+        def write_docstore(path: str):
+            with open(path, "wb") as f:
+                for record in records:
+                    offsets.append(f.tell())
+                    f.write(record)
+
+        def write_offsets(path: str):
+            with open(path, "wb") as f:  # a file object, so np.save doesn't append another ".npy"
+                np.save(f, np.asarray(offsets, dtype="int64"))
+
+        _write_durable(f"{base}.jsonl", write_docstore)
+        _write_durable(f"{base}.offsets.npy", write_offsets)
+        _fsync_path(directory)
+        return cls(directory, name)
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[float, int]]:
+        distances, ids = self.index.search(vector.reshape(1, -1), min(k, self.ntotal))
+        return [(float(d), int(i)) for d, i in zip(distances[0], ids[0]) if i >= 0]
+
+    def document(self, local_id: int) -> Document:
+        with self._lock:
+            self._docstore.seek(int(self.offsets[local_id]))
+            line = self._docstore.readline()
+        record = json.loads(line)
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def records(self) -> Iterator[bytes]:
+        """
+        The raw docstore lines, in vector order.
+        """
+        with open(self.docstore_path, "rb") as f:
+            yield from f
+
+    def documents(self) -> List[Document]:
+        return [
+            Document(page_content=record["page_content"], metadata=record["metadata"])
+            for record in map(json.loads, self.records())
+        ]
+
+    def vectors(self) -> np.ndarray:
+        return self.index.reconstruct_n(0, self.ntotal)
+
+    # === Reader pinning ===
+    def acquire(self):
+        with self._lock:
+            self._readers += 1
+
+    def release(self):
+        with self._lock:
+            self._readers -= 1
+            drained = self._retired and not self._readers
+        if drained:
+            self._dispose()
+
+    def retire(self, delete_files: bool):
+        """
+        Close the segment (and delete its files if asked) once no search holds it any more.
+        """
+        with self._lock:
+            self._retired = True
+            self._delete_on_release = self._delete_on_release or delete_files
+            drained = not self._readers
+        if drained:
+            self._dispose()
+
+    def _dispose(self):
+        if self._docstore.closed:
+            return
+        self._docstore.close()
+        if self._delete_on_release:
+            for path in (self.index_path, self.docstore_path, self.offsets_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class SegmentedIndex:
+    """
+    Append-only vector index made of immutable segments; searches fan out over every segment.
+    """
+
+    def __init__(self, directory: str, max_segments: int = 16, merge_factor: int = 4):
+        self.directory = directory
+        self.segment_dir = os.path.join(directory, "segments")
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.max_segments = max_segments
+        self.merge_factor = max(2, merge_factor)
+        self.dim: Optional[int] = None
+        self.segments: List[IndexSegment] = []
+        self._next_id = 1
+        self._write_lock = threading.Lock()
+        self._segments_lock = threading.Lock()  # publishing a segment list vs. pinning it for a search
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self.registry = ChunkRegistry(os.path.join(directory, "chunks.sqlite"))
+        self.sparse = SparseIndex(os.path.join(directory, "sparse.sqlite"))
+
+    @property
+    def ntotal(self) -> int:
+        return sum(segment.ntotal for segment in self.segments)
+
+    def load(self):
+        """
+        Open every segment listed in the manifest (memory-mapped, so startup cost is flat).
+        """
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        self.dim = manifest.get("dim")
+        self.segments = [IndexSegment(self.segment_dir, name) for name in manifest["segments"]]
+        self._next_id = manifest.get("next_id", len(self.segments) + 1)
+        self._remove_orphans()
+        if self.sparse.count() < self.ntotal:
+            self._rebuild_sparse()
+        logger.info(f"Loaded {len(self.segments)} index segments ({self.ntotal} vectors).")
+
+    def _rebuild_sparse(self):
+        """
+        Backfill the keyword index for segments written before it existed.
+        """
+        for segment in self.segments:
+            documents = segment.documents()
+            for doc in documents:
+                doc.metadata.setdefault("chunk_hash", chunk_hash(doc.page_content))
+            self.sparse.add(documents)
+        logger.info(f"Rebuilt keyword index ({self.sparse.count()} chunks).")
+
+    def _remove_orphans(self):
+        """
+        Delete files of segments that were written but never committed (e.g. a crash mid-upload).
+        """
+        live = {segment.name for segment in self.segments}
+        for filename in os.listdir(self.segment_dir):
+            if filename.split(".")[0] not in live:
+                os.remove(os.path.join(self.segment_dir, filename))
+
+    def _commit(self, segments: List[IndexSegment]):
+        _write_json_atomic(self.manifest_path, {
+            "dim": self.dim,
+            "next_id": self._next_id,
+            "segments": [segment.name for segment in segments],
+        })
+        with self._segments_lock:
+            self.segments = segments
+
+    @contextmanager
+    def _pinned(self) -> Iterator[List[IndexSegment]]:
+        """
+        The current segments, kept open (files included) until the block exits.
+        """
+        with self._segments_lock:
+            segments = list(self.segments)
+            for segment in segments:
+                segment.acquire()
+        try:
+            yield segments
+        finally:
+            for segment in segments:
+                segment.release()
+
+    def _new_name(self) -> str:
+        name = f"{self._next_id:06d}"
+        self._next_id += 1
+        return name
+
+    def append(self, vectors: np.ndarray, documents: List[Document]) -> Optional[str]:
+        """
+        Persist one batch as a new segment and publish it; compacts when there are too many segments.
+        """
+        if len(documents) == 0:
+            return None
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        for doc in documents:
+            doc.metadata.setdefault("chunk_hash", chunk_hash(doc.page_content))
+        with self._write_lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            segment = IndexSegment.write(self.segment_dir, self._new_name(), vectors, documents)
+            self._commit(self.segments + [segment])
+            self.registry.add(doc.metadata["chunk_hash"] for doc in documents)
+            self.sparse.add(documents)
+            needs_compaction = len(self.segments) > self.max_segments
+        if needs_compaction:
+            self.compact()
+        return segment.name
+
+    def compact(self) -> int:
+        """
+        Merge the smallest segments (at most merge_factor of them) into one; the replaced files are
+        deleted once no search still reads them. Returns the number of segments merged.
+        """
+        with self._write_lock:
+            if len(self.segments) < 2:
+                return 0
+            # Small segments are cheap to rewrite; large ones are only merged once few small ones are left
+            tier = sorted(self.segments, key=lambda segment: segment.ntotal)[:self.merge_factor]
+            merged = IndexSegment.merge(self.segment_dir, self._new_name(), tier)
+            self._commit([segment for segment in self.segments if segment not in tier] + [merged])
+        for segment in tier:
+            segment.retire(delete_files=True)
+        logger.info(f"Compacted {len(tier)} segments into {merged.name} ({merged.ntotal} vectors).")
+        return len(tier)
+
+    @staticmethod
+    def _nearest(segments: List[IndexSegment], vector: np.ndarray, k: int) -> List[Tuple[float, IndexSegment, int]]:
+        vector = np.ascontiguousarray(vector, dtype="float32")
+        hits = [
+            (distance, segment, local_id)
+            for segment in segments
+            for distance, local_id in segment.search(vector, k)
+        ]
+        hits.sort(key=lambda hit: hit[0])
+        return hits[:k]
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[Document, float]]:
+        """
+        Top-k (document, L2 distance) pairs across every segment, nearest first.
+        """
+        with self._pinned() as segments:
+            return [
+                (segment.document(local_id), distance)
+                for distance, segment, local_id in self._nearest(segments, vector, k)
+            ]
+
+    def search_with_vectors(self, vector: np.ndarray, k: int) -> List[Tuple[Document, float, np.ndarray]]:
+        """
+        Like search, but also returns each hit's stored vector (for MMR re-ranking).
+        """
+        with self._pinned() as segments:
+            return [
+                (segment.document(local_id), distance, segment.index.reconstruct(local_id))
+                for distance, segment, local_id in self._nearest(segments, vector, k)
+            ]
+
+    def keyword_search(self, text: str, k: int) -> List[Tuple[Document, float]]:
+        """
+        Top-k (document, BM25 score) pairs from the keyword index, best first.
+        """
+        return self.sparse.search(text, k)
+
+    def close(self):
+        """
+        Release the memory-mapped segments and database handles (the files stay on disk).
+        """
+        with self._write_lock:
+            with self._segments_lock:
+                segments, self.segments = self.segments, []
+            for segment in segments:
+                segment.retire(delete_files=False)
+            self.registry.close()
+            self.sparse.close()
+
+    def stats(self) -> dict:
+        return {
+            "segments": len(self.segments),
+            "vectors": self.ntotal,
+            "dim": self.dim,
+            "unique_chunks": self.registry.count(),
+            "keyword_indexed_chunks": self.sparse.count(),
+            "bytes_on_disk": sum(
+                os.path.getsize(os.path.join(self.segment_dir, name))
+                for name in os.listdir(self.segment_dir)
+            ),
+        }
+
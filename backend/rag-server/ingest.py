@@ -0,0 +1,282 @@
+# ✅ Background ingestion – queued upload jobs, streamed pages, batched and retried embedding
+
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_community.document_loaders import PyMuPDFLoader
+from langchain_core.documents import Document
+
+from embedding_cache import EmbeddingCache, chunk_hash
+from namespaces import DEFAULT_NAMESPACE
+
+logger = logging.getLogger(__name__)
+
+# === Defaults (overridable through RAG_INGEST_* environment variables) ===
+DEFAULT_INGEST_SETTINGS = {
+    "workers": 2,              # jobs processed concurrently
+    "max_queue": 100,          # queued jobs before /upload is rejected
+    "batch_size": 32,          # chunks per embedding request
+    "embed_concurrency": 4,    # embedding requests in flight per job
+    "commit_chunks": 512,      # embedded chunks buffered before writing an index segment
+    "max_retries": 3,          # per embedding batch
+    "retry_backoff": 1.0,      # seconds, doubled per attempt (with jitter)
+    "max_jobs_kept": 1000,     # finished jobs remembered for /jobs
+}
+
+
+def ingest_settings_from_env() -> Dict[str, Any]:
+    settings = dict(DEFAULT_INGEST_SETTINGS)
+    for key, default in DEFAULT_INGEST_SETTINGS.items():
+        value = os.getenv(f"RAG_INGEST_{key.upper()}")
+        if value:
+            settings[key] = type(default)(value)
+    return settings
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue cannot take another job."""
+
+
+class IngestJob:
+    def __init__(self, path: str, filename: str, namespace: str = DEFAULT_NAMESPACE):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.filename = filename
+        self.namespace = namespace
+        self.status = "queued"
+        self.pages = 0
+        self.chunks = 0
+        self.new_chunks = 0         # embedded for the first time
+        self.reused_chunks = 0      # vector taken from the embedding cache
+        self.duplicate_chunks = 0   # already indexed (or repeated), skipped
+        self.retries = 0
+        self.segments: List[str] = []
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started is not None:
+            elapsed = (self.finished or time.time()) - self.started
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "namespace": self.namespace,
+            "status": self.status,
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "new_chunks": self.new_chunks,
+            "reused_chunks": self.reused_chunks,
+            "duplicate_chunks": self.duplicate_chunks,
+            "retries": self.retries,
+            "segments": self.segments,
+            "error": self.error,
+            "elapsed_sec": round(elapsed, 2) if elapsed is not None else None,
+            "pages_per_sec": round(self.pages / elapsed, 2) if elapsed else None,
+            "chunks_per_sec": round(self.chunks / elapsed, 2) if elapsed else None,
+        }
+
+
+class IngestPipeline:
+    """
+    Upload jobs go on a bounded queue; worker tasks stream pages, chunk them, embed in
+    batches (bounded concurrency, retried with backoff) and commit segments to the job's
+    namespace index. Chunks already in that index are skipped and cached embeddings are reused.
+    Blocking parsing, embedding and disk writes run in threads so the event loop stays free.
+    """
+
+    def __init__(self, indexes, embeddings, splitter, settings: Optional[Dict[str, Any]] = None,
+                 embedding_cache: Optional[EmbeddingCache] = None):
+        self.indexes = indexes
+        self.embeddings = embeddings
+        self.splitter = splitter
+        self.embedding_cache = embedding_cache
+        self._claimed: Set[Tuple[str, str]] = set()  # (namespace, chunk hash) being ingested by running jobs
+        self.settings = {**DEFAULT_INGEST_SETTINGS, **(settings or {})}
+        self.jobs: Dict[str, IngestJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.settings["max_queue"])
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.settings["workers"])]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, path: str, filename: str, namespace: str = DEFAULT_NAMESPACE) -> IngestJob:
+        job = IngestJob(path, filename, namespace)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Ingestion queue is full, please retry later.")
+        self.jobs[job.id] = job
+        self._forget_old_jobs()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.embeddings, "model", type(self.embeddings).__name__)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def pending_jobs(self, namespace: str) -> int:
+        """
+        Queued or running jobs for a namespace (its answers may change once they finish).
+        """
+        return sum(1 for job in self.jobs.values() if job.namespace == namespace and job.status in ("queued", "running"))
+
+    def _forget_old_jobs(self):
+        finished = [job for job in self.jobs.values() if job.status in ("done", "failed")]
+        for job in finished[:max(0, len(self.jobs) - self.settings["max_jobs_kept"])]:
+            del self.jobs[job.id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Ingestion job {job.id} failed: {e}")
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished = time.time()
+                self._queue.task_done()
+                if os.path.exists(job.path):
+                    os.remove(job.path)
+
+    async def _run(self, job: IngestJob):
+        job.status = "running"
+        job.started = time.time()
+        claimed: Set[Tuple[str, str]] = set()
+        try:
+            async with self.indexes.lease(job.namespace) as index:
+                await self._ingest(job, index, claimed)
+        finally:
+            self._claimed -= claimed
+
+    async def _dedupe(self, job: IngestJob, index, chunks: List[Document], claimed: Set[Tuple[str, str]]) -> List[Document]:
+        """
+        Drop chunks that are already indexed or being ingested; claim the rest for this job.
+        """
+        for chunk in chunks:
+            chunk.metadata["chunk_hash"] = chunk_hash(chunk.page_content)
+        # SQLite lookup, off the event loop like every other index access
+        indexed = await asyncio.to_thread(index.registry.existing, [chunk.metadata["chunk_hash"] for chunk in chunks])
+
+        fresh = []
+        for chunk in chunks:
+            key = (job.namespace, chunk.metadata["chunk_hash"])
+            if key[1] in indexed or key in self._claimed:
+                job.duplicate_chunks += 1
+                continue
+            self._claimed.add(key)
+            claimed.add(key)
+            fresh.append(chunk)
+        return fresh
+
+    async def _ingest(self, job: IngestJob, index, claimed: Set[Tuple[str, str]]):
+        semaphore = asyncio.Semaphore(self.settings["embed_concurrency"])
+        pending: List[asyncio.Task] = []
+        batch: List[Document] = []
+        embedded: List[tuple] = []
+
+        async def embed_batch(chunks: List[Document]):
+            async with semaphore:
+                vectors = await self._embed_with_cache(job, chunks)
+            embedded.append((vectors, chunks))
+            job.chunks += len(chunks)
+
+        async def flush(force: bool = False):
+            buffered = sum(len(chunks) for _, chunks in embedded)
+            if embedded and (force or buffered >= self.settings["commit_chunks"]):
+                ready = embedded[:]
+                embedded.clear()
+                vectors = np.concatenate([vectors for vectors, _ in ready])
+                documents = [doc for _, chunks in ready for doc in chunks]
+                segment = await asyncio.to_thread(index.append, vectors, documents)
+                job.segments.append(segment)
+
+        # 📄 Stream pages one at a time instead of loading the whole PDF
+        pages = PyMuPDFLoader(job.path).lazy_load()
+        while True:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                break
+            page.metadata["source"] = job.filename
+            job.pages += 1
+
+            # 📚 Split into chunks and embed full batches in the background
+            batch.extend(await self._dedupe(job, index, self.splitter.split_documents([page]), claimed))
+            while len(batch) >= self.settings["batch_size"]:
+                chunks, batch = batch[:self.settings["batch_size"]], batch[self.settings["batch_size"]:]
+                pending.append(asyncio.create_task(embed_batch(chunks)))
+
+            # Backpressure: stop reading pages while enough batches are waiting to embed
+            in_flight = [task for task in pending if not task.done()]
+            if len(in_flight) >= 2 * self.settings["embed_concurrency"]:
+                await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            await flush()
+
+        if batch:
+            pending.append(asyncio.create_task(embed_batch(batch)))
+        try:
+            await asyncio.gather(*pending)
+        except Exception:
+            for task in pending:
+                task.cancel()
+            raise
+        await flush(force=True)
+        job.status = "done"
+
+    async def _embed_with_cache(self, job: IngestJob, chunks: List[Document]) -> np.ndarray:
+        """
+        Vectors for a batch, taking (model, chunk hash) hits from the embedding cache and embedding the rest.
+        """
+        hashes = [chunk.metadata["chunk_hash"] for chunk in chunks]
+        cached: Dict[str, np.ndarray] = {}
+        if self.embedding_cache is not None:
+            cached = await asyncio.to_thread(self.embedding_cache.get_many, self.model_name, hashes)
+
+        missing = [i for i, h in enumerate(hashes) if h not in cached]
+        if missing:
+            vectors = await self._embed_with_retry(job, [chunks[i].page_content for i in missing])
+            fresh = {hashes[i]: vector for i, vector in zip(missing, vectors)}
+            if self.embedding_cache is not None:
+                await asyncio.to_thread(self.embedding_cache.put_many, self.model_name, fresh)
+            cached.update(fresh)
+
+        job.new_chunks += len(missing)
+        job.reused_chunks += len(chunks) - len(missing)
+        return np.stack([cached[h] for h in hashes])
+
+    async def _embed_with_retry(self, job: IngestJob, texts: List[str]) -> np.ndarray:
+        attempt = 0
+        while True:
+            try:
+                vectors = await asyncio.to_thread(self.embeddings.embed_documents, texts)
+                return np.asarray(vectors, dtype="float32")
+            except Exception as e:
+                attempt += 1
+                if attempt > self.settings["max_retries"]:
+                    raise
+                job.retries += 1
+                delay = self.settings["retry_backoff"] * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                logger.warning(f"Embedding batch failed for job {job.id} (attempt {attempt}): {e}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
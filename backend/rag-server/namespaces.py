@@ -0,0 +1,133 @@
+# ✅ Document namespaces – one segmented index per session or collection, opened lazily and
+# unloaded again (LRU) when idle, so a query only searches its own tenant's documents.
+#
+# Layout under RAG_INDEX_DIR:
+#   manifest.json, segments/, ...     the "default" namespace (uploads without a session/collection)
+#   namespaces/<name>/manifest.json   every other namespace (session-<id> or collection-<id>), same layout
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from index_store import SegmentedIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAMESPACE = "default"
+SAFE_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")  # ids used as-is (after their kind prefix)
+
+
+def namespace_for(session_id: Optional[str] = None, collection: Optional[str] = None) -> str:
+    """
+    Namespace of a request: an explicit collection wins over the session; neither means "default".
+    Collections and sessions get their own prefix, so neither can name the other (or "default").
+    Ids that are not filesystem-safe are replaced by a hash.
+    """
+    if collection:
+        kind, name = "collection", collection
+    elif session_id:
+        kind, name = "session", session_id
+    else:
+        return DEFAULT_NAMESPACE
+    if not SAFE_NAME.fullmatch(name):
+        name = hashlib.sha256(name.encode()).hexdigest()[:32]
+    return f"{kind}-{name}"
+
+
+class NamespaceIndexes:
+    """
+    Opens a namespace's SegmentedIndex on first use and keeps at most max_loaded of them open.
+    Indexes in use (leased by a query or an ingestion job) are never unloaded.
+    """
+
+    def __init__(self, root: str, max_loaded: int = 32, max_segments: int = 16):
+        self.root = root
+        self.max_loaded = max_loaded
+        self.max_segments = max_segments
+        self._loaded: "OrderedDict[str, SegmentedIndex]" = OrderedDict()
+        self._leases: Dict[str, int] = {}
+        self._lock = asyncio.Lock()
+        self.loads = 0
+        self.unloads = 0
+
+    def path(self, namespace: str) -> str:
+        if namespace == DEFAULT_NAMESPACE:
+            return self.root
+        return os.path.join(self.root, "namespaces", namespace)
+
+    def exists(self, namespace: str) -> bool:
+        """
+        Whether the namespace has committed documents on disk (checked without loading it).
+        """
+        return namespace in self._loaded or os.path.exists(os.path.join(self.path(namespace), "manifest.json"))
+
+    def query_namespace(self, session_id: Optional[str] = None, collection: Optional[str] = None) -> str:
+        """
+        Namespace a query searches: its own, or the shared default one (e.g. documents migrated from
+        the legacy index) while the session has no documents of its own.
+        """
+        namespace = namespace_for(session_id, collection)
+        if collection is None and namespace != DEFAULT_NAMESPACE and not self.exists(namespace):
+            return DEFAULT_NAMESPACE
+        return namespace
+
+    def names(self) -> List[str]:
+        names = [DEFAULT_NAMESPACE] if self.exists(DEFAULT_NAMESPACE) else []
+        namespace_dir = os.path.join(self.root, "namespaces")
+        if os.path.isdir(namespace_dir):
+            names.extend(sorted(name for name in os.listdir(namespace_dir) if self.exists(name)))
+        return names
+
+    async def open(self, namespace: str) -> SegmentedIndex:
+        async with self._lock:
+            index = self._loaded.get(namespace)
+            if index is None:
+                started = time.perf_counter()
+                index = SegmentedIndex(self.path(namespace), max_segments=self.max_segments)
+                await asyncio.to_thread(index.load)
+                self._loaded[namespace] = index
+                self.loads += 1
+                logger.info(f"Opened namespace {namespace} in {(time.perf_counter() - started) * 1000:.0f} ms.")
+            self._loaded.move_to_end(namespace)
+            self._unload_cold()
+            return index
+
+    @asynccontextmanager
+    async def lease(self, namespace: str) -> AsyncIterator[SegmentedIndex]:
+        """
+        Use a namespace's index; it stays loaded until the block exits.
+        """
+        self._leases[namespace] = self._leases.get(namespace, 0) + 1
+        try:
+            yield await self.open(namespace)
+        finally:
+            self._leases[namespace] -= 1
+            if not self._leases[namespace]:
+                del self._leases[namespace]
+
+    def _unload_cold(self):
+        idle = [name for name in self._loaded if not self._leases.get(name)]
+        while len(self._loaded) > self.max_loaded and idle:
+            name = idle.pop(0)
+            self._loaded.pop(name).close()
+            self.unloads += 1
+            logger.info(f"Unloaded idle namespace {name}.")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "namespaces_loaded": len(self._loaded),
+            "namespace_loads": self.loads,
+            "namespace_unloads": self.unloads,
+        }
+
+    async def close(self):
+        async with self._lock:
+            for index in self._loaded.values():
+                index.close()
+            self._loaded.clear()
@@ -0,0 +1,91 @@
+# ✅ Model providers – the LangChain embeddings and chat model behind ingest and /query
+#
+#   gemini   GoogleGenerativeAIEmbeddings + ChatGoogleGenerativeAI (needs GEMINI_API_KEY)
+#   mock     the shared deterministic mock model (common/llm_provider.py) wrapped for LangChain
+#
+# Selected by LLM_PROVIDER, like the other servers. LangChain owns these clients, so the shared
+# GEMINI_* limits are applied through its own rate_limiter / max_retries / timeout knobs.
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from pydantic import Field
+
+from common.gemini_client import gemini_settings_from_env
+from common.llm_provider import MockModel, contents_text, mock_embedding, mock_settings_from_env
+
+
+class MockEmbeddings(Embeddings):
+    model = "models/mock-embedding"  # keeps mock vectors apart from real ones in the embedding cache
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        self.settings = {**mock_settings_from_env(), **(settings or {})}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.settings["embed_latency"])
+        return [mock_embedding(text, self.settings["embedding_dim"]) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.settings["embed_latency"])
+        return mock_embedding(text, self.settings["embedding_dim"])
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.settings["embed_latency"])
+        return mock_embedding(text, self.settings["embedding_dim"])
+
+
+class MockChatModel(BaseChatModel):
+    settings: Dict[str, Any] = Field(default_factory=mock_settings_from_env)
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    def _model(self) -> MockModel:
+        return MockModel("mock", self.settings)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = self._model().reply_for(contents_text([message.content for message in messages]))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        response = await self._model().generate_content_async([message.content for message in messages])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response.text))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        stream = await self._model().generate_content_async([message.content for message in messages], stream=True)
+        async for chunk in stream:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk.text))
+
+
+def models_from_env():
+    """
+    (embeddings, llm) for the provider selected by LLM_PROVIDER ("gemini" or "mock").
+    """
+    settings = gemini_settings_from_env()
+    rate_limiter = InMemoryRateLimiter(
+        requests_per_second=settings["requests_per_minute"] / 60,
+        max_bucket_size=settings["burst"],
+    )
+    if os.getenv("LLM_PROVIDER", "gemini").lower() == "mock":
+        return MockEmbeddings(), MockChatModel(rate_limiter=rate_limiter)
+
+    from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+
+    # Set Google API key
+    os.environ["GOOGLE_API_KEY"] = os.environ["GEMINI_API_KEY"]
+    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+    llm = ChatGoogleGenerativeAI(
+        model="gemini-1.5-flash",
+        max_retries=settings["max_retries"],
+        timeout=settings["timeout"],
+        rate_limiter=rate_limiter,
+    )
+    return embeddings, llm
@@ -0,0 +1,85 @@
+# ✅ Rerankers – reorder retrieved candidates before they reach the LLM
+#
+#   lexical        query-term coverage weighted by rarity among the candidates, plus an
+#                  exact-phrase bonus (no extra model, sub-millisecond)
+#   cross-encoder  sentence-transformers CrossEncoder scoring (question, chunk) pairs locally
+#                  (optional dependency; needs `pip install sentence-transformers`)
+
+import logging
+import math
+import os
+import re
+from typing import List
+
+from langchain_core.documents import Document
+
+from sparse_index import query_terms
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # cross-encoder reranking is optional
+    CrossEncoder = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class LexicalReranker:
+    name = "lexical"
+
+    def rerank(self, question: str, documents: List[Document], k: int) -> List[Document]:
+        terms = query_terms(question)
+        if not terms or not documents:
+            return documents[:k]
+        tokenized = [re.findall(r"\w+", doc.page_content.lower()) for doc in documents]
+        phrase = " ".join(terms)
+
+        def idf(term: str) -> float:
+            containing = sum(1 for tokens in tokenized if term in tokens)
+            return math.log(1 + len(documents) / (1 + containing))
+
+        weights = {term: idf(term) for term in terms}
+        scores = []
+        for tokens in tokenized:
+            score = sum(weight * math.log1p(tokens.count(term)) for term, weight in weights.items())
+            if len(terms) > 1 and phrase in " ".join(tokens):
+                score *= 1.5
+            scores.append(score)
+        # Stable sort keeps the incoming (fused) order for ties
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])
+        return [documents[i] for i in order[:k]]
+
+
+class CrossEncoderReranker:
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER_MODEL):
+        self.model = CrossEncoder(model_name)
+
+    def rerank(self, question: str, documents: List[Document], k: int) -> List[Document]:
+        if not documents:
+            return []
+        scores = self.model.predict([(question, doc.page_content) for doc in documents])
+        order = sorted(range(len(documents)), key=lambda i: -float(scores[i]))
+        return [documents[i] for i in order[:k]]
+
+
+def reranker_from_env():
+    """
+    Reranker selected by RAG_RERANKER ("lexical", "cross-encoder" or "none").
+    Falls back to the lexical reranker when the cross-encoder cannot be loaded.
+    """
+    name = os.getenv("RAG_RERANKER", "lexical").lower()
+    if name in ("", "none"):
+        return None
+    if name == "cross-encoder":
+        if CrossEncoder is None:
+            logger.warning("sentence-transformers is not installed; using the lexical reranker.")
+            return LexicalReranker()
+        try:
+            return CrossEncoderReranker(os.getenv("RAG_CROSS_ENCODER_MODEL", DEFAULT_CROSS_ENCODER_MODEL))
+        except Exception as e:
+            logger.warning(f"Could not load the cross-encoder ({e}); using the lexical reranker.")
+            return LexicalReranker()
+    return LexicalReranker()
@@ -0,0 +1,243 @@
+# ✅ Retrieval pipeline – built once, async end to end, with cached query embeddings and tunable search
+#
+# search_type:
+#   similarity   dense FAISS top-k
+#   mmr          dense top fetch_k, diversified with maximal marginal relevance
+#   hybrid       dense and BM25 keyword top fetch_k, merged with reciprocal rank fusion
+# Any mode can pass its candidates through the configured reranker (rerank=true).
+
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+
+from common.streaming import elapsed_ms
+from common.telemetry import record_stage
+
+# Same "stuff" prompt RetrievalQA uses, so answers match the previous chain
+STUFF_PROMPT = """Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+# === Defaults for per-request retrieval settings ===
+DEFAULT_RETRIEVAL_SETTINGS = {
+    "k": 4,                   # documents passed to the LLM
+    "search_type": "hybrid",  # "similarity", "mmr" or "hybrid"
+    "fetch_k": 20,            # candidates considered by MMR, fusion and reranking
+    "lambda_mult": 0.5,       # MMR trade-off: 1 = relevance only, 0 = diversity only
+    "score_threshold": None,  # minimum dense relevance in [0, 1]; None keeps everything
+    "rrf_k": 60,              # reciprocal rank fusion constant (higher flattens rank differences)
+    "rerank": False,          # run the configured reranker over the candidates
+}
+
+
+def relevance_score(distance: float) -> float:
+    """
+    Map an L2 distance between unit vectors to a [0, 1] relevance (same as LangChain's FAISS).
+    """
+    return 1.0 - distance / np.sqrt(2)
+
+
+def maximal_marginal_relevance(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """
+    Greedy MMR over candidate vectors; returns the indexes of the selected candidates.
+    """
+    def normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    query, candidates = normalize(query), normalize(candidates)
+    query_similarity = candidates @ query
+    selected: List[int] = []
+    while len(selected) < min(k, len(candidates)):
+        if selected:
+            redundancy = (candidates @ candidates[selected].T).max(axis=1)
+        else:
+            redundancy = np.zeros(len(candidates))
+        scores = lambda_mult * query_similarity - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(scores.argmax()))
+    return selected
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], rrf_k: int) -> List[Document]:
+    """
+    Merge ranked lists by summing 1 / (rrf_k + rank); the same chunk (by content hash) counts once.
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.metadata.get("chunk_hash") or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    return [documents[key] for key in sorted(scores, key=lambda key: -scores[key])]
+
+
+class QueryEmbeddingCache:
+    """
+    Small thread-safe LRU of question -> embedding, so repeated questions skip the embedding call.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return re.sub(r"\s+", " ", text).strip().lower()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(self._key(text))
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(self._key(text))
+            self.hits += 1
+            return vector
+
+    def put(self, text: str, vector: np.ndarray):
+        with self._lock:
+            self._entries[self._key(text)] = vector
+            self._entries.move_to_end(self._key(text))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RetrievalPipeline:
+    """
+    Holds the QA chain and retrieval settings for the server's lifetime. Each search is given the
+    namespace index to read and uses its current segments, so new uploads are visible without rebuilding.
+    Blocking index work runs in threads; embedding and generation use LangChain's async API.
+    Every stage is timed; per-request timings are returned and running averages kept for /index/stats.
+    """
+
+    def __init__(self, embeddings, llm, reranker=None, query_cache_size: int = 1024):
+        self.embeddings = embeddings
+        self.reranker = reranker
+        self.query_cache = QueryEmbeddingCache(query_cache_size)
+        self.chain = PromptTemplate.from_template(STUFF_PROMPT) | llm | StrOutputParser()
+        self._stage_totals: Dict[str, List[float]] = {}  # stage -> [calls, total ms]
+
+    async def embed_query(self, question: str) -> np.ndarray:
+        vector = self.query_cache.get(question)
+        if vector is None:
+            vector = np.asarray(await self.embeddings.aembed_query(question), dtype="float32")
+            self.query_cache.put(question, vector)
+        return vector
+
+    async def retrieve(self, index, question: str, **overrides: Any) -> Tuple[List[Document], Dict[str, float]]:
+        """
+        Documents for the question from one namespace index, plus a {stage}_ms timing breakdown.
+        """
+        settings = {**DEFAULT_RETRIEVAL_SETTINGS, **{k: v for k, v in overrides.items() if v is not None}}
+        k, search_type = settings["k"], settings["search_type"]
+        rerank = settings["rerank"] and self.reranker is not None
+        # Fetch a wider candidate pool whenever a later stage narrows it down
+        fetch_k = max(settings["fetch_k"], k) if rerank or search_type in ("mmr", "hybrid") else k
+        timings: Dict[str, float] = {}
+        retrieval_started = time.perf_counter()
+
+        async def timed(stage: str, work):
+            started = time.perf_counter()
+            try:
+                return await work
+            finally:
+                timings[f"{stage}_ms"] = elapsed_ms(started)
+
+        if search_type == "hybrid":
+            # Dense and keyword searches run concurrently; embedding only gates the dense side
+            async def dense_search():
+                query = await timed("embed", self.embed_query(question))
+                return await timed("dense", asyncio.to_thread(index.search, query, fetch_k))
+
+            dense, sparse = await asyncio.gather(
+                dense_search(),
+                timed("sparse", asyncio.to_thread(index.keyword_search, question, fetch_k)),
+            )
+            dense = self._apply_threshold(dense, settings["score_threshold"])
+            started = time.perf_counter()
+            candidates = reciprocal_rank_fusion(
+                [[doc for doc, _ in dense], [doc for doc, _ in sparse]], settings["rrf_k"],
+            )[:fetch_k]
+            timings["fuse_ms"] = elapsed_ms(started)
+        elif search_type == "mmr":
+            query = await timed("embed", self.embed_query(question))
+            hits = await timed("dense", asyncio.to_thread(index.search_with_vectors, query, fetch_k))
+            hits = self._apply_threshold(hits, settings["score_threshold"])
+            started = time.perf_counter()
+            candidates = []
+            if hits:
+                chosen = maximal_marginal_relevance(
+                    query, np.stack([v for _, _, v in hits]), k if not rerank else fetch_k, settings["lambda_mult"],
+                )
+                candidates = [hits[i][0] for i in chosen]
+            timings["mmr_ms"] = elapsed_ms(started)
+        else:
+            query = await timed("embed", self.embed_query(question))
+            hits = await timed("dense", asyncio.to_thread(index.search, query, fetch_k))
+            candidates = [doc for doc, *_ in self._apply_threshold(hits, settings["score_threshold"])]
+
+        if rerank:
+            documents = await timed("rerank", asyncio.to_thread(self.reranker.rerank, question, candidates, k))
+        else:
+            documents = candidates[:k]
+
+        timings["retrieval_ms"] = elapsed_ms(retrieval_started)
+        self._record(timings)
+        return documents, timings
+
+    @staticmethod
+    def _apply_threshold(hits: List[Tuple], threshold: Optional[float]) -> List[Tuple]:
+        if threshold is None:
+            return hits
+        return [hit for hit in hits if relevance_score(hit[1]) >= threshold]
+
+    def _record(self, timings: Dict[str, float]):
+        for stage, ms in timings.items():
+            totals = self._stage_totals.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += ms
+            record_stage(stage[:-3], ms)  # embed_ms -> embed, for Server-Timing and /metrics
+
+    @staticmethod
+    def _chain_input(question: str, documents: List[Document]) -> Dict[str, str]:
+        return {"context": "\n\n".join(doc.page_content for doc in documents), "question": question}
+
+    async def answer(self, question: str, documents: List[Document], timings: Optional[Dict[str, float]] = None) -> str:
+        started = time.perf_counter()
+        text = await self.chain.ainvoke(self._chain_input(question, documents))
+        generated = {"generate_ms": elapsed_ms(started)}
+        self._record(generated)
+        if timings is not None:
+            timings.update(generated)
+        return text
+
+    async def stream_answer(self, question: str, documents: List[Document]) -> AsyncIterator[str]:
+        async for text in self.chain.astream(self._chain_input(question, documents)):
+            if text:
+                yield text
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "query_cache_hits": self.query_cache.hits,
+            "query_cache_misses": self.query_cache.misses,
+            "reranker": self.reranker.name if self.reranker is not None else None,
+            "avg_stage_ms": {
+                stage: round(total / calls, 1) for stage, (calls, total) in self._stage_totals.items()
+            },
+        }
@@ -0,0 +1,85 @@
+# ✅ Sparse keyword index – SQLite FTS5 inverted index with BM25 ranking, kept next to the FAISS segments
+
+import json
+import re
+from typing import Iterable, List, Tuple
+
+from langchain_core.documents import Document
+
+from embedding_cache import _SqliteStore
+
+# Words too common to help BM25 but expensive to OR together
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "how", "i", "in",
+    "is", "it", "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where",
+    "which", "who", "why", "with", "you",
+}
+
+
+def query_terms(text: str) -> List[str]:
+    """
+    Lower-cased word tokens of a question, without stopwords (split like FTS5's unicode61 tokenizer).
+    """
+    terms = [term for term in re.findall(r"\w+", text.lower()) if term not in STOPWORDS]
+    return list(dict.fromkeys(terms))
+
+
+class SparseIndex(_SqliteStore):
+    """
+    One row per unique chunk (keyed by content hash) plus an FTS5 index over its text.
+    Chunk hashes survive segment compaction, so the sparse side never needs rewriting.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path, (
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY, hash TEXT UNIQUE NOT NULL,"
+            " page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        ))
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5("
+            " page_content, content='chunks', content_rowid='id')"
+        )
+        self._conn.commit()
+
+    def add(self, documents: Iterable[Document]):
+        """
+        Index documents that carry a metadata["chunk_hash"]; already indexed hashes are skipped.
+        """
+        with self._lock:
+            for doc in documents:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO chunks (hash, page_content, metadata) VALUES (?, ?, ?)",
+                    (doc.metadata["chunk_hash"], doc.page_content, json.dumps(doc.metadata, default=str)),
+                )
+                if cursor.rowcount:
+                    self._conn.execute(
+                        "INSERT INTO chunks_fts (rowid, page_content) VALUES (?, ?)",
+                        (cursor.lastrowid, doc.page_content),
+                    )
+            self._conn.commit()
+
+    def search(self, text: str, k: int) -> List[Tuple[Document, float]]:
+        """
+        Top-k (document, BM25 score) pairs for any of the question's terms, best first.
+        """
+        terms = query_terms(text)
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT c.page_content, c.metadata, bm25(chunks_fts) AS rank"
+                " FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid"
+                " WHERE chunks_fts MATCH ? ORDER BY rank LIMIT ?",
+                (match, k),
+            ).fetchall()
+        # FTS5's bm25() is negated so that smaller sorts first; flip it back to "higher is better"
+        return [
+            (Document(page_content=content, metadata=json.loads(metadata)), -rank)
+            for content, metadata, rank in rows
+        ]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
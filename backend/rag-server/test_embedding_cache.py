@@ -0,0 +1,32 @@
+import numpy as np
+
+from embedding_cache import ChunkRegistry, EmbeddingCache, chunk_hash
+
+
+def test_chunk_hash_ignores_whitespace_differences():
+    assert chunk_hash("a  b\n c ") == chunk_hash("a b c")
+    assert chunk_hash("a b c") != chunk_hash("a b d")
+
+
+def test_embedding_cache_is_keyed_by_model_and_persists(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(path)
+    cache.put_many("model-a", {"h1": np.array([1.0, 2.0]), "h2": np.array([3.0, 4.0])})
+    cache.put_many("model-a", {"h1": np.array([9.0, 9.0])})  # first vector wins
+    cache.close()
+
+    reopened = EmbeddingCache(path)
+    found = reopened.get_many("model-a", ["h1", "h2", "h3"])
+    assert set(found) == {"h1", "h2"} and found["h1"].tolist() == [1.0, 2.0]
+    assert reopened.get_many("model-b", ["h1"]) == {}
+    assert reopened.count() == 2
+    reopened.close()
+
+
+def test_registry_lookups_span_more_than_one_parameter_batch(tmp_path):
+    registry = ChunkRegistry(str(tmp_path / "chunks.sqlite"))
+    hashes = [f"h{i}" for i in range(1200)]
+    registry.add(hashes[::2])
+    assert registry.existing(hashes) == set(hashes[::2])
+    assert registry.count() == 600
+    registry.close()
@@ -0,0 +1,126 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from index_store import IndexSegment, SegmentedIndex
+
+
+def anonymous_rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    pytest.skip("RssAnon is only reported on Linux")
+
+
+def documents(prefix: str, count: int):
+    return [Document(page_content=f"{prefix} chunk {i}", metadata={"source": prefix}) for i in range(count)]
+
+
+def vectors(count: int, dim: int = 8, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((count, dim), dtype="float32")
+
+
+def test_segment_vectors_are_memory_mapped_not_copied(tmp_path):
+    count, dim = 40000, 256  # ~40 MB of float32 vectors
+    IndexSegment.write(str(tmp_path), "000001", vectors(count, dim), documents("big", count)).retire(delete_files=False)
+
+    before = anonymous_rss_mb()
+    segment = IndexSegment(str(tmp_path), "000001")
+    segment.search(vectors(1, dim, seed=1)[0], 5)
+    assert anonymous_rss_mb() - before < 10
+    assert segment.ntotal == count
+    segment.retire(delete_files=False)
+
+
+def test_compaction_keeps_files_until_readers_release(tmp_path):
+    index = SegmentedIndex(str(tmp_path), max_segments=16)
+    for n in range(3):
+        index.append(vectors(4, seed=n), documents(f"doc{n}", 4))
+
+    with index._pinned() as segments:
+        assert index.compact() == 3
+        # A search that started before the compaction still reads the old docstores
+        for segment in segments:
+            assert segment.document(0).page_content.endswith("chunk 0")
+            assert os.path.exists(segment.docstore_path)
+    for segment in segments:
+        assert not os.path.exists(segment.docstore_path)
+        assert not os.path.exists(segment.index_path)
+
+    assert len(index.segments) == 1 and index.ntotal == 12
+    hits = index.search(vectors(4, seed=2)[0], 1)
+    assert hits[0][0].page_content == "doc2 chunk 0"
+    index.close()
+
+
+def test_compaction_merges_a_bounded_tier_of_small_segments(tmp_path):
+    index = SegmentedIndex(str(tmp_path), max_segments=16, merge_factor=3)
+    index.append(vectors(50), documents("large", 50))
+    for n in range(4):
+        index.append(vectors(2, seed=n + 1), documents(f"small{n}", 2))
+
+    assert index.compact() == 3
+    sizes = sorted(segment.ntotal for segment in index.segments)
+    assert sizes == [2, 6, 50]
+    assert index.ntotal == 58
+
+    reloaded = SegmentedIndex(str(tmp_path))
+    reloaded.load()
+    assert sorted(segment.ntotal for segment in reloaded.segments) == sizes
+    assert len(os.listdir(index.segment_dir)) == 3 * 3
+    index.close()
+    reloaded.close()
+
+
+def test_append_compacts_past_max_segments(tmp_path):
+    index = SegmentedIndex(str(tmp_path), max_segments=3, merge_factor=2)
+    for n in range(4):
+        index.append(vectors(2, seed=n), documents(f"doc{n}", 2))
+    assert len(index.segments) == 3
+    assert isinstance(faiss.downcast_index(index.segments[0].index), faiss.IndexFlatL2)
+    index.close()
+
+
+def test_keyword_search_finds_chunks_across_compaction(tmp_path):
+    index = SegmentedIndex(str(tmp_path))
+    index.append(vectors(2), [Document(page_content="tidal forces and the moon", metadata={}),
+                              Document(page_content="a recipe for bread", metadata={})])
+    index.append(vectors(1, seed=1), [Document(page_content="ocean tides explained", metadata={})])
+    index.compact()
+    hits = index.keyword_search("what causes tides", 5)
+    assert [doc.page_content for doc, _ in hits] == ["ocean tides explained"]
+    assert index.keyword_search("the of and", 5) == []
+    index.close()
+
+
+def test_segment_files_are_durable_before_the_manifest_names_them(tmp_path, monkeypatch):
+    events = []
+    real_fsync, real_replace = os.fsync, os.replace
+
+    def fsync(fd):
+        events.append(("fsync", os.readlink(f"/proc/self/fd/{fd}")))
+        real_fsync(fd)
+
+    def replace(src, dst):
+        events.append(("replace", str(src), str(dst)))
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, "fsync", fsync)
+    monkeypatch.setattr(os, "replace", replace)
+    index = SegmentedIndex(str(tmp_path))
+    index.append(vectors(3), documents("doc", 3))
+    index.close()
+
+    manifest = next(i for i, event in enumerate(events) if event[0] == "replace" and event[2].endswith("manifest.json"))
+    segment_dir = str(tmp_path / "segments")
+    for suffix in (".faiss", ".jsonl", ".offsets.npy"):
+        published = next(i for i, event in enumerate(events) if event[0] == "replace" and event[2].endswith(suffix))
+        tmp_name = events[published][1]
+        assert ("fsync", tmp_name) in events[:published]  # contents on disk before the rename
+        assert published < manifest
+    assert ("fsync", segment_dir) in events[:manifest]  # renames on disk before the manifest
+    assert not [name for name in os.listdir(segment_dir) if name.endswith(".tmp")]
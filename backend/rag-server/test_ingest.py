@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+from embedding_cache import EmbeddingCache, chunk_hash
+from index_store import SegmentedIndex
+from ingest import IngestJob, IngestPipeline
+
+
+def test_dedupe_skips_indexed_and_claimed_chunks_off_the_event_loop(tmp_path):
+    async def run():
+        index = SegmentedIndex(str(tmp_path))
+        index.append(np.ones((1, 4), dtype="float32"), [Document(page_content="already indexed", metadata={})])
+        lookups = []
+        existing = index.registry.existing
+
+        def recording_existing(hashes):
+            lookups.append(threading.current_thread())
+            return existing(hashes)
+
+        index.registry.existing = recording_existing
+        pipeline = IngestPipeline(indexes=None, embeddings=None, splitter=None)
+        first, second = IngestJob("a.pdf", "a.pdf"), IngestJob("b.pdf", "b.pdf")
+        chunks = lambda: [Document(page_content=text, metadata={}) for text in ("already indexed", "new text")]
+
+        fresh = await pipeline._dedupe(first, index, chunks(), set())
+        assert [chunk.page_content for chunk in fresh] == ["new text"]
+        assert fresh[0].metadata["chunk_hash"] == chunk_hash("new text")
+        # Another job in the same namespace must not index the chunk the first one has claimed
+        assert await pipeline._dedupe(second, index, chunks(), set()) == []
+        assert second.duplicate_chunks == 2
+        assert lookups and all(thread is not threading.main_thread() for thread in lookups)
+        index.close()
+
+    asyncio.run(run())
+
+
+class CountingEmbeddings:
+    model = "test-model"
+
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_cached_embeddings_are_reused_instead_of_re_embedded(tmp_path):
+    async def run():
+        cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+        embeddings = CountingEmbeddings()
+        pipeline = IngestPipeline(indexes=None, embeddings=embeddings, splitter=None, embedding_cache=cache)
+        chunks = lambda *texts: [
+            Document(page_content=text, metadata={"chunk_hash": chunk_hash(text)}) for text in texts
+        ]
+
+        first = IngestJob("a.pdf", "a.pdf")
+        await pipeline._embed_with_cache(first, chunks("alpha", "beta"))
+        # A re-upload of the same chunks (plus one new one) only embeds the new one
+        second = IngestJob("b.pdf", "b.pdf")
+        vectors = await pipeline._embed_with_cache(second, chunks("alpha", "gamma text", "beta"))
+        cache.close()
+        return embeddings, first, second, vectors
+
+    embeddings, first, second, vectors = asyncio.run(run())
+    assert embeddings.texts == ["alpha", "beta", "gamma text"]
+    assert (first.new_chunks, first.reused_chunks) == (2, 0)
+    assert (second.new_chunks, second.reused_chunks) == (1, 2)
+    assert vectors[:, 0].tolist() == [5.0, 10.0, 4.0]  # in chunk order, cached or not
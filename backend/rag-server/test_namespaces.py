@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+from langchain_core.documents import Document
+
+from index_store import SegmentedIndex
+from namespaces import DEFAULT_NAMESPACE, NamespaceIndexes, namespace_for
+
+
+def add_document(directory: str, text: str):
+    index = SegmentedIndex(directory)
+    index.append(np.ones((1, 4), dtype="float32"), [Document(page_content=text, metadata={})])
+    index.close()
+
+
+def test_namespace_for_prefers_collection_then_session():
+    assert namespace_for("s1", "team") == "collection-team"
+    assert namespace_for("s1") == "session-s1"
+    assert namespace_for() == DEFAULT_NAMESPACE
+    assert namespace_for("a/b").startswith("session-") and "/" not in namespace_for("a/b")
+
+
+def test_sessions_and_collections_never_share_a_namespace():
+    assert namespace_for(session_id="x") != namespace_for(collection="x")
+    assert namespace_for(session_id="default") != DEFAULT_NAMESPACE
+    assert namespace_for(collection="default") != DEFAULT_NAMESPACE
+    assert namespace_for(session_id="a/b") != namespace_for(collection="a/b")
+
+
+def test_session_without_documents_queries_the_default_namespace(tmp_path):
+    indexes = NamespaceIndexes(str(tmp_path))
+    add_document(indexes.path(DEFAULT_NAMESPACE), "migrated legacy document")
+    assert indexes.query_namespace("s1") == DEFAULT_NAMESPACE
+
+    add_document(indexes.path(namespace_for("s1")), "the session's own upload")
+    assert os.path.exists(os.path.join(indexes.path(namespace_for("s1")), "manifest.json"))
+    assert indexes.query_namespace("s1") == namespace_for("s1")
+
+
+def test_explicit_collection_never_falls_back(tmp_path):
+    indexes = NamespaceIndexes(str(tmp_path))
+    add_document(indexes.path(DEFAULT_NAMESPACE), "migrated legacy document")
+    assert indexes.query_namespace("s1", "team") == namespace_for(collection="team")
@@ -0,0 +1,25 @@
+from langchain_core.documents import Document
+
+from rerank import LexicalReranker
+
+
+def docs(*texts: str):
+    return [Document(page_content=text, metadata={}) for text in texts]
+
+
+def test_lexical_reranker_prefers_rare_query_terms():
+    candidates = docs("invoice totals", "invoice number 42 is overdue", "invoice history")
+    ranked = LexicalReranker().rerank("which invoice is overdue", candidates, k=2)
+    assert [doc.page_content for doc in ranked] == ["invoice number 42 is overdue", "invoice totals"]
+
+
+def test_exact_phrase_gets_a_bonus_and_ties_keep_the_incoming_order():
+    candidates = docs("notice the period", "period of notice", "notice period is 30 days", "unrelated")
+    ranked = LexicalReranker().rerank("notice period", candidates, k=4)
+    assert ranked[0].page_content == "notice period is 30 days"
+    assert [doc.page_content for doc in ranked[1:]] == ["notice the period", "period of notice", "unrelated"]
+
+
+def test_questions_without_terms_keep_the_candidates():
+    candidates = docs("a", "b", "c")
+    assert LexicalReranker().rerank("what is it", candidates, k=2) == candidates[:2]
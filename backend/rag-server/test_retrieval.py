@@ -0,0 +1,107 @@
+import asyncio
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from index_store import SegmentedIndex
+from retrieval import RetrievalPipeline, reciprocal_rank_fusion
+
+VECTORS = {
+    "cats": [1.0, 0.0, 0.0, 0.0],
+    "dogs": [0.0, 1.0, 0.0, 0.0],
+    "birds": [0.0, 0.0, 1.0, 0.0],
+}
+
+
+class KeywordEmbeddings:
+    """Embeds a question as the vector of the first known topic it mentions."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def aembed_query(self, text: str):
+        self.calls += 1
+        return next((vector for topic, vector in VECTORS.items() if topic in text.lower()), [0.0, 0.0, 0.0, 1.0])
+
+
+def add_topics(index: SegmentedIndex, *topics: str):
+    index.append(
+        np.asarray([VECTORS[topic] for topic in topics], dtype="float32"),
+        [Document(page_content=f"a note about {topic}", metadata={"topic": topic}) for topic in topics],
+    )
+
+
+def test_pipeline_is_built_once_and_sees_new_segments(tmp_path):
+    async def run():
+        index = SegmentedIndex(str(tmp_path))
+        add_topics(index, "cats", "dogs")
+        pipeline = RetrievalPipeline(KeywordEmbeddings(), FakeListChatModel(responses=["first", "second"]))
+        chain = pipeline.chain
+
+        documents, timings = await pipeline.retrieve(index, "tell me about birds", k=1, search_type="similarity")
+        assert documents[0].metadata["topic"] != "birds"
+        assert await pipeline.answer("tell me about birds", documents, timings) == "first"
+
+        add_topics(index, "birds")  # a new upload, without rebuilding anything
+        documents, _ = await pipeline.retrieve(index, "tell me about birds", k=1, search_type="similarity")
+        assert documents[0].metadata["topic"] == "birds"
+        assert await pipeline.answer("tell me about birds", documents) == "second"
+        assert pipeline.chain is chain
+        assert {"embed_ms", "dense_ms", "retrieval_ms", "generate_ms"} <= set(timings)
+        index.close()
+
+    asyncio.run(run())
+
+
+def test_repeated_questions_reuse_the_query_embedding(tmp_path):
+    async def run():
+        index = SegmentedIndex(str(tmp_path))
+        add_topics(index, "cats", "dogs")
+        embeddings = KeywordEmbeddings()
+        pipeline = RetrievalPipeline(embeddings, FakeListChatModel(responses=["ok"]))
+        await pipeline.retrieve(index, "What about cats?", search_type="similarity")
+        await pipeline.retrieve(index, "  what about   CATS? ", search_type="similarity")
+        index.close()
+        return embeddings, pipeline
+
+    embeddings, pipeline = asyncio.run(run())
+    assert embeddings.calls == 1
+    assert (pipeline.stats()["query_cache_hits"], pipeline.stats()["query_cache_misses"]) == (1, 1)
+
+
+def doc(text: str, chunk_hash: str = None) -> Document:
+    return Document(page_content=text, metadata={"chunk_hash": chunk_hash or text})
+
+
+def test_rrf_prefers_documents_ranked_by_both_lists_and_counts_each_chunk_once():
+    dense = [doc("a"), doc("b"), doc("c")]
+    sparse = [doc("c"), doc("d"), doc("b")]
+    fused = reciprocal_rank_fusion([dense, sparse], rrf_k=60)
+    assert [d.page_content for d in fused] == ["c", "b", "a", "d"]
+
+
+def test_rrf_constant_controls_how_much_the_top_rank_dominates():
+    one_list_top = [doc("top"), doc("both")]
+    other = [doc("x"), doc("y"), doc("z"), doc("v"), doc("w"), doc("both")]
+    # Small k: a single first place (1/2) beats ranks 2 and 6 (1/3 + 1/7); large k flattens that
+    assert reciprocal_rank_fusion([one_list_top, other], rrf_k=1)[0].page_content == "top"
+    assert reciprocal_rank_fusion([one_list_top, other], rrf_k=60)[0].page_content == "both"
+
+
+def test_hybrid_search_surfaces_keyword_matches_the_dense_side_ranks_low(tmp_path):
+    async def run():
+        index = SegmentedIndex(str(tmp_path))
+        index.append(
+            np.asarray([VECTORS["cats"], VECTORS["dogs"], VECTORS["birds"]], dtype="float32"),
+            [Document(page_content=text, metadata={}) for text in
+             ("a note about cats", "a note about dogs", "zebra stripes and cats")],
+        )
+        pipeline = RetrievalPipeline(KeywordEmbeddings(), FakeListChatModel(responses=["ok"]))
+        documents, timings = await pipeline.retrieve(index, "cats and zebra", k=2, search_type="hybrid")
+        index.close()
+        return documents, timings
+
+    documents, timings = asyncio.run(run())
+    assert {d.page_content for d in documents} == {"a note about cats", "zebra stripes and cats"}
+    assert {"dense_ms", "sparse_ms", "fuse_ms"} <= set(timings)
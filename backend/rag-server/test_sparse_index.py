@@ -0,0 +1,30 @@
+from langchain_core.documents import Document
+
+from embedding_cache import chunk_hash
+from sparse_index import SparseIndex, query_terms
+
+
+def chunk(text: str) -> Document:
+    return Document(page_content=text, metadata={"chunk_hash": chunk_hash(text), "source": "t.pdf"})
+
+
+def test_query_terms_drop_stopwords_and_repeats():
+    assert query_terms("What is the warranty period, and the WARRANTY terms?") == ["warranty", "period", "terms"]
+
+
+def test_bm25_ranks_the_chunk_matching_more_and_rarer_terms_first(tmp_path):
+    sparse = SparseIndex(str(tmp_path / "sparse.sqlite"))
+    sparse.add([
+        chunk("the warranty period is two years"),
+        chunk("shipping takes two days"),
+        chunk("the warranty covers parts"),
+    ])
+    sparse.add([chunk("the warranty period is two years")])  # already indexed: skipped
+
+    results = sparse.search("warranty period", k=5)
+    assert [doc.page_content for doc, _ in results] == ["the warranty period is two years", "the warranty covers parts"]
+    assert results[0][1] > results[1][1] > 0
+    assert results[0][0].metadata["source"] == "t.pdf"
+    assert sparse.count() == 3
+    assert sparse.search("the of and", k=5) == []
+    sparse.close()
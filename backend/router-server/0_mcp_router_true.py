@@ -1,21 +1,39 @@
 # # ✅ MCP router server – (Gemini Flash 1.5)
 
 # === Imports ===
+import asyncio
+import hashlib
 import json
-import requests
+import logging
+import math
 import os
-import hashlib
-import re
-from fastapi import FastAPI, HTTPException
+import time
+import httpx
+from fastapi import FastAPI, Form, HTTPException, UploadFile
 from pydantic import BaseModel
-from typing import Dict, Any
-import google.generativeai as genai
+from typing import Dict, Any, Optional
 from fastapi.middleware.cors import CORSMiddleware
-
-# === Configure Gemini ===
-genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-router_model = genai.GenerativeModel("gemini-1.5-flash")
-chat_model = genai.GenerativeModel("gemini-1.5-flash")  # Use the same model for chat
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from tool_client import ToolClient, ToolBusyError
+from tool_registry import ToolUnavailableError
+from admission import AdmissionController, AdmissionRejected
+from fast_router import FastRouter, is_multi_intent
+from tool_cache import ToolCache, make_cache_key
+from semantic_cache import SemanticCache
+from fanout import DEFAULT_FANOUT_SETTINGS, fan_out, merge_replies
+from tool_selection import build_request_prompt, build_system_instruction, decision_schema, validate_decision
+from common.session_store import SessionMemory, format_transcript, make_gemini_summarizer, to_gemini_contents
+from common.streaming import NDJSON_MEDIA_TYPE, gemini_text_chunks, ndjson_stream, single_event_stream
+from common.singleflight import SingleFlight
+from common.gemini_client import get_gemini_client
+from common.telemetry import count_cache, count_error, install_telemetry, record_stage, registry, stage
+
+logger = logging.getLogger(__name__)
+
+# === Configure Gemini (shared client: rate limit, concurrency, retries, deadlines) ===
+gemini = get_gemini_client()
+chat_model = gemini.model("gemini-1.5-flash")
 
 # === Load Tool Endpoint Config ===
 with open("config.json") as f:
@@ -24,6 +42,9 @@ with open("config.json") as f:
 # === FastAPI App ===
 app = FastAPI()
 
+# Request ids (forwarded to the tool servers), Server-Timing on /ask, and GET /metrics
+install_telemetry(app, "router")
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -33,12 +54,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# === Tool Definitions (Descriptions + Dynamic Endpoints) ===
+# === Tool Definitions (endpoints come from config.json and the tool registry) ===
 TOOLS = [
     {
         "name": "chat",
         "description": "General-purpose conversation with memory and prior context.",
-        "endpoint": endpoint_config["chat"],
         "parameters": {
             "type": "object",
             "properties": {
@@ -51,7 +71,6 @@ TOOLS = [
     {
         "name": "search",
         "description": "Real-time web search using DuckDuckGo.",
-        "endpoint": endpoint_config["search"],
         "parameters": {
             "type": "object",
             "properties": {
@@ -63,7 +82,6 @@ TOOLS = [
     {
         "name": "think",
         "description": "For deep thinking and reasoning about complex tasks.",
-        "endpoint": endpoint_config["think"],
         "parameters": {
             "type": "object",
             "properties": {
@@ -75,10 +93,10 @@ TOOLS = [
     {
         "name": "query",
         "description": "Question answering over user-uploaded documents (RAG).",
-        "endpoint": endpoint_config["query"],
         "parameters": {
             "type": "object",
             "properties": {
+                "session_id": {"type": "string"},
                 "question": {"type": "string"}
             },
             "required": ["question"]
@@ -87,7 +105,6 @@ TOOLS = [
     {
         "name": "weather",
         "description": "Get current weather information for a specified location.",
-        "endpoint": endpoint_config["weather"],
         "parameters": {
             "type": "object",
             "properties": {
@@ -99,10 +116,10 @@ TOOLS = [
     {
         "name": "rag",
         "description": "Retrieve answers from uploaded documents.",
-        "endpoint": endpoint_config["rag"],
         "parameters": {
             "type": "object",
             "properties": {
+                "session_id": {"type": "string"},
                 "question": {"type": "string"}
             },
             "required": ["question"]
@@ -110,169 +127,609 @@ TOOLS = [
     }
 ]
 
-# === Session and Cache Stores ===
-session_memory: Dict[str, list] = {}
-tool_cache: Dict[str, Any] = {}
+TOOLS_BY_NAME = {tool["name"]: tool for tool in TOOLS}
+
+# === Router Model (precompiled instructions + schema-constrained JSON decisions) ===
+# The tool catalogue is built once as the system instruction; requests only send history + query.
+router_model = gemini.model(
+    "gemini-1.5-flash",
+    system_instruction=build_system_instruction(TOOLS),
+    generation_config={"response_mime_type": "application/json", "response_schema": decision_schema(TOOLS)},
+)
+# Extra routing calls allowed when the model's output cannot be repaired locally
+ROUTER_MAX_RETRIES = int(os.getenv("ROUTER_MAX_RETRIES", "1"))
+
+# === Pooled Async Tool Dispatch (replicas, health checks, circuit breakers, failover) ===
+CONFIG_PATH = "config.json"
+
+def tool_endpoints(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Tool name -> URL (or list of replica URLs) from config.json.
+    General chat is answered by the router itself, so it has no endpoint.
+    """
+    names = [tool["name"] for tool in TOOLS if tool["name"] != "chat"] + ["upload"]
+    return {name: config[name] for name in names if config.get(name)}
+
+tool_client = ToolClient(tool_endpoints(endpoint_config), endpoint_config.get("http"), endpoint_config.get("registry"))
+
+async def watch_config():
+    """
+    Re-read config.json when it changes and apply the tool endpoints and "http" settings.
+    Other sections (caches, sessions, fan-out) are read once at startup.
+    """
+    global endpoint_config
+    mtime = os.path.getmtime(CONFIG_PATH)
+    while True:
+        await asyncio.sleep(tool_client.registry.settings["reload_interval"])
+        try:
+            current = os.path.getmtime(CONFIG_PATH)
+            if current == mtime:
+                continue
+            mtime = current
+            with open(CONFIG_PATH) as f:
+                config = json.load(f)
+            tool_client.configure(tool_endpoints(config), config.get("http"))
+            endpoint_config = config
+            logger.info(f"Reloaded tool endpoints from {CONFIG_PATH}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Keeping the previous tool endpoints, {CONFIG_PATH} could not be loaded: {e}")
+
+config_watcher: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_tool_client():
+    """
+    Start the tool health probes and the config.json watcher.
+    """
+    global config_watcher
+    tool_client.start()
+    config_watcher = asyncio.create_task(watch_config())
+
+@app.on_event("shutdown")
+async def close_tool_client():
+    """
+    Close the keep-alive pools to the tool servers on shutdown.
+    """
+    if config_watcher is not None:
+        config_watcher.cancel()
+    await tool_client.close()
+
+# === Fast-Path Router (rules + local classifier before the LLM) ===
+fast_router = FastRouter(tool_names=[tool["name"] for tool in TOOLS] + ["chat"])
+routing_stats: Dict[str, int] = {"rules": 0, "classifier": 0, "semantic": 0, "llm": 0}
+
+# === Semantic Cache (embedding lookup of paraphrased queries, optional) ===
+semantic_cache = SemanticCache(endpoint_config.get("semantic_cache"))
+
+# === Multi-Tool Fan-Out ===
+fanout_settings = {**DEFAULT_FANOUT_SETTINGS, **endpoint_config.get("fanout", {})}
+
+# === Session Store (token-budgeted window + rolling summary, memory or Redis) ===
+session_memory = SessionMemory(endpoint_config.get("sessions"), summarizer=make_gemini_summarizer(chat_model))
+
+@app.on_event("shutdown")
+async def close_session_memory():
+    await session_memory.close()
+
+# === Tool Result Cache (LRU + per-tool TTL, optionally shared through Redis) ===
+tool_cache = ToolCache(endpoint_config.get("cache"))
+
+@app.on_event("shutdown")
+async def close_tool_cache():
+    await tool_cache.close()
+
+# === Single-Flight (identical concurrent calls share one upstream request) ===
+tool_flights = SingleFlight()
+router_llm_flights = SingleFlight()
+
+tool_call_seconds = registry.histogram(
+    "tool_call_duration_seconds", "Tool server calls made by the router.", ("tool", "status"),
+)
+
+async def call_tool(tool_name: str, params: Dict[str, Any]) -> Any:
+    """
+    Call a tool; concurrent calls with the same tool + normalized parameters share one request.
+    Tools whose replies are never cached (e.g. chat, which updates session memory) always get their own call.
+    """
+    started = time.perf_counter()
+    status = "error"
+    try:
+        if not tool_cache.is_cacheable(tool_name):
+            reply = await tool_client.call(tool_name, params)
+        else:
+            reply = await tool_flights.do(make_cache_key(tool_name, params), lambda: tool_client.call(tool_name, params))
+        status = "ok"
+        return reply
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        tool_call_seconds.observe(elapsed_ms / 1000, tool=tool_name, status=status)
+        record_stage(f"tool_{tool_name}", elapsed_ms)
 
 # === Input Model ===
 class UserQuery(BaseModel):
     session_id: str
     message: str
+    stream: bool = False
+    deadline: Optional[float] = None  # seconds; overrides the fan-out deadline for this request
+
+# Tool servers that can stream NDJSON tokens back to the router
+STREAMING_TOOLS = {"chat", "think", "search", "query", "rag"}
 
-# === Prompt Builder ===
-def build_router_prompt(session_id: str, user_query: str):
-    history = session_memory.get(session_id, [])
-    
-    # Ensure all entries in history are formatted correctly
-    history_text = "\n".join([
-        f"{msg['role'].capitalize()}: {msg.get('content', ' '.join(msg.get('parts', [])))}"
-        for msg in history
-    ])
-
-    tool_descriptions = "\n\n".join([
-        f"Tool: {tool['name']}\nDescription: {tool['description']}\nParams: {json.dumps(tool['parameters']['properties'])}"
-        for tool in TOOLS
-    ])
-
-    return f"""
-You are an intelligent tool router for an AI system.
-
-Available tools:
-{tool_descriptions}
-
-Conversation history:
-{history_text}
-
-User query: "{user_query}"
-
-Respond in JSON only:
-{{
-  "tool": "tool_name",
-  "parameters": {{...}} | null,
-  "confidence": "high | medium | low",
-  "reply_format": "markdown"
-}}
-"""
+def reply_text(reply: Any) -> str:
+    """
+    The user-facing text of a tool reply (tool servers wrap it in different keys).
+    """
+    if isinstance(reply, dict):
+        for key in ("answer", "thoughts", "reply", "response"):
+            if key in reply:
+                return str(reply[key])
+        return json.dumps(reply)
+    return str(reply)
+
+def respond(req: UserQuery, started: float, body: Dict[str, Any]):
+    """
+    Return an already complete /ask body as JSON, or as a one-shot NDJSON stream when streaming was requested.
+    """
+    if not req.stream:
+        return body
+    text = reply_text(body.get("data", {}).get("reply", ""))
+    return StreamingResponse(single_event_stream(body, text, started), media_type=NDJSON_MEDIA_TYPE)
+
+# === Prompt Builder (per-request part only; the static part is the router model's system instruction) ===
+def build_router_prompt(user_query: str, summary: str, history: list):
+    history_text = format_transcript(history)
+    if summary:
+        history_text = f"Summary: {summary}\n{history_text}"
+    return build_request_prompt(user_query, history_text)
+
+# Outcome of each LLM routing decision
+llm_output_stats: Dict[str, int] = {"valid": 0, "repaired": 0, "retried": 0, "fallback": 0}
+
+async def route_with_llm(message: str, prompt: str) -> Dict[str, Any]:
+    """
+    Ask the router model for a decision. Output is validated against the tool schemas and
+    repaired locally where possible; otherwise the model is asked again with the errors
+    (ROUTER_MAX_RETRIES times), and in the end the query goes to chat instead of failing.
+    """
+    contents = prompt
+    for attempt in range(ROUTER_MAX_RETRIES + 1):
+        prompt_key = hashlib.sha256(contents.encode()).hexdigest()
+        with stage("route_llm"):
+            response = await router_llm_flights.do(prompt_key, lambda: router_model.generate_content_async(contents))
+        with stage("parse"):
+            decision, errors, repaired = validate_decision(response.text, TOOLS_BY_NAME, message)
+        if decision is not None:
+            llm_output_stats["repaired" if repaired else "valid"] += 1
+            return decision
+
+        count_error("router_output_invalid")
+        llm_output_stats["retried"] += 1
+        contents = (
+            f"{prompt}\n\nYour previous answer was invalid ({'; '.join(errors)}). "
+            f"Answer again, choosing only from the listed tools."
+        )
+
+    llm_output_stats["retried"] -= 1  # the last failure was not retried
+    llm_output_stats["fallback"] += 1
+    return {"tool": "chat", "parameters": None, "confidence": "low", "reply_format": "markdown"}
+
+# === Admission Control (per-session + global rate limits, priority queue, load shedding) ===
+admission = AdmissionController(endpoint_config.get("admission"))
 
 # === POST /ask ===
 @app.post("/ask")
-def ask_router(req: UserQuery):
-    history = session_memory.setdefault(req.session_id, [])
-    history.append({"role": "user", "content": req.message})
-
-    # Caching
-    cache_key = hashlib.sha256(f"{req.session_id}:{req.message}".encode()).hexdigest()
-    if cache_key in tool_cache:
-        return {
-            "status": "success",
-            "cached": True,
-            "data": tool_cache[cache_key]
-        }
-
-    # Ask the router model
-    prompt = build_router_prompt(req.session_id, req.message)
-    response = router_model.generate_content(prompt)
-
-    # === Clean LLM output from markdown-style triple backticks ===
-    raw_response = response.text.strip()
-    cleaned = re.sub(r"^```(?:json)?|```$", "", raw_response, flags=re.IGNORECASE | re.MULTILINE).strip()
+async def ask_router(req: UserQuery):
+    started = time.perf_counter()
 
     try:
-        tool_call = json.loads(cleaned)
-    except Exception:
-        return {
-            "status": "error",
-            "message": "Failed to parse LLM output.",
-            "raw_response": raw_response
-        }
+        # A session over its rate is turned away before anything else runs
+        admission.check_session(req.session_id)
+
+        # Try the cheap local router first; only fall back to the LLM when it is unsure or the
+        # message asks for several tools (the LLM can return tool_calls to fan out).
+        # Its guess also sets the request's admission priority (cheap tools before think/RAG).
+        with stage("fast_route"):
+            tool_call = fast_router.route(req.message)
+        priority = admission.priority_for(tool_call["tool"] if tool_call else None)
+
+        with stage("admission"):
+            await admission.admit(priority)
+    except AdmissionRejected as e:
+        count_error(f"admission_{e.reason}")
+        return JSONResponse(
+            status_code=e.status_code,
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+            content={"status": "error", "message": str(e), "details": {"reason": e.reason}},
+        )
+
+    release = admission.release_once()
+    try:
+        response = await answer(req, started, tool_call)
+    except BaseException:
+        release()
+        raise
+    if isinstance(response, StreamingResponse):
+        # Streams hold their admission until the last event is sent. The background task also
+        # runs when the client disconnects before the body generator ever starts.
+        response.body_iterator = release_when_done(response.body_iterator, release)
+        response.background = BackgroundTask(release)
+    else:
+        release()
+    return response
+
+async def release_when_done(body, release):
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        release()
+
+async def answer(req: UserQuery, started: float, tool_call: Optional[Dict[str, Any]]):
+    await session_memory.add(req.session_id, "user", req.message)
+
+    query_vector = None
+    semantic_match = None
+    if tool_call is None and semantic_cache.enabled and not is_multi_intent(req.message):
+        # Reuse the tool picked for a paraphrase, rebuilding its parameters from this message
+        # (a single tool, so messages asking for several go straight to the LLM)
+        with stage("semantic_cache"):
+            query_vector = await semantic_cache.embed(req.message)
+            semantic_match = semantic_cache.lookup(query_vector)
+        count_cache("semantic", "miss" if semantic_match is None else "hit")
+        if semantic_match is not None:
+            cached_call = semantic_match["tool_call"]
+            tool_call = None
+            if len(cached_call.get("tool_calls") or []) <= 1:  # a fan-out can't be rebuilt from this message
+                tool_call = fast_router.decision_for(
+                    cached_call.get("tool") or "chat", req.message, "high", "semantic", semantic_match["similarity"]
+                )
+            if tool_call is None:
+                semantic_match = None
+            else:
+                tool_call["reply_format"] = cached_call.get("reply_format", "text")
+
+    if tool_call is not None:
+        routed_by = tool_call["stage"]
+    else:
+        routed_by = "llm"
+
+        # Ask the router model
+        with stage("session"):
+            summary, history = await session_memory.context(req.session_id)
+        with stage("build_prompt"):
+            prompt = build_router_prompt(req.message, summary, history)
+        tool_call = await route_with_llm(req.message, prompt)
+    routing_stats[routed_by] += 1
 
     # Extract reply format if specified
     reply_format = tool_call.get("reply_format", "text")
 
+    # A close paraphrase of an earlier query to a reply-safe tool reuses that reply
+    if routed_by == "semantic" and semantic_match["reply"] is not None:
+        reply = semantic_match["reply"]
+        await session_memory.add(req.session_id, "tool", reply)
+        return respond(req, started, {
+            "status": "success",
+            "cached": True,
+            "data": {
+                "tool_used": tool_call.get("tool"),
+                "confidence": tool_call.get("confidence", "unknown"),
+                "routed_by": routed_by,
+                "parameters": tool_call.get("parameters"),
+                "reply": f"```\n{reply}\n```" if reply_format == "markdown" else reply
+            }
+        })
+
+    # Several tool calls: run them concurrently and merge the replies
+    tool_calls = [
+        call for call in tool_call.get("tool_calls") or []
+        if isinstance(call, dict) and call.get("tool") in TOOLS_BY_NAME and call["tool"] != "chat"
+    ][:fanout_settings["max_tools"]]
+    if len(tool_calls) > 1:
+        return respond(req, started, await ask_many(req, tool_calls, tool_call, routed_by))
+    if tool_calls:
+        tool_call = {**tool_call, **tool_calls[0]}
+
     tool_name = tool_call.get("tool")
-    params = tool_call.get("parameters", {})
+    params = tool_call.get("parameters") or {}
     confidence = tool_call.get("confidence", "unknown")
 
     # Handle general chat internally
     if tool_name == "chat" or tool_name is None:
-        chat_response = handle_general_chat(req.session_id, req.message)
-        if reply_format == "markdown":
-            chat_response = f"```\n{chat_response}\n```"
-        return {
-            "status": "success",
-            "cached": False,
-            "data": {
-                "tool_used": "chat",
-                "confidence": "high",
-                "reply": chat_response
+        async def finish_chat(chat_response: str):
+            await session_memory.add(req.session_id, "model", chat_response)
+            if query_vector is not None and routed_by == "llm":
+                semantic_cache.add(query_vector, req.message, tool_call)
+            if reply_format == "markdown":
+                chat_response = f"```\n{chat_response}\n```"
+            return {
+                "status": "success",
+                "cached": False,
+                "data": {
+                    "tool_used": "chat",
+                    "confidence": "high",
+                    "routed_by": routed_by,
+                    "reply": chat_response
+                }
             }
-        }
+
+        if req.stream:
+            return StreamingResponse(
+                ndjson_stream(stream_general_chat(req.session_id), finish_chat, started),
+                media_type=NDJSON_MEDIA_TYPE
+            )
+        return await finish_chat(await handle_general_chat(req.session_id))
 
     # Handle external tool calls
-    tool = next((t for t in TOOLS if t["name"] == tool_name), None)
+    tool = TOOLS_BY_NAME.get(tool_name)
     if not tool:
         return {
             "status": "error",
             "message": f"Tool '{tool_name}' not found."
         }
 
-    if "session_id" in tool["parameters"]["properties"]:
-        params["session_id"] = req.session_id
+    params = prepare_params(tool, params, req.session_id)
+
+    # Caching (keyed by tool + normalized parameters, shared across sessions)
+    with stage("tool_cache"):
+        cached = await tool_cache.get(tool_name, params)
+    count_cache("tool", "miss" if cached is None else "hit")
+    if cached is not None:
+        await session_memory.add(req.session_id, "tool", cached["reply"])
+        return respond(req, started, {
+            "status": "success",
+            "cached": True,
+            "data": {
+                **cached,
+                "routed_by": routed_by,
+                "reply": f"```\n{cached['reply']}\n```" if reply_format == "markdown" else cached["reply"]
+            }
+        })
+
+    async def finish_tool(reply: Any):
+        await session_memory.add(req.session_id, "tool", reply)
+
+        if query_vector is not None and routed_by == "llm":
+            semantic_cache.add(query_vector, req.message, tool_call, reply)
+
+        await tool_cache.set(tool_name, params, {
+            "tool_used": tool_name,
+            "parameters": params,
+            "confidence": confidence,
+            "reply": reply
+        })
+
+        return {
+            "status": "success",
+            "cached": False,
+            "data": {
+                "tool_used": tool_name,
+                "confidence": confidence,
+                "routed_by": routed_by,
+                "parameters": params,
+                "reply": f"```\n{reply}\n```" if reply_format == "markdown" else reply
+            }
+        }
+
+    # Streamed Tool Call: relay tokens as the tool server produces them
+    if req.stream and tool_name in STREAMING_TOOLS:
+        tool_done: Dict[str, Any] = {}
+
+        async def tool_tokens():
+            async for event in tool_client.stream(tool_name, params):
+                if event["type"] == "token":
+                    yield event["text"]
+                elif event["type"] == "done":
+                    tool_done.update(event)
+                elif event["type"] == "error":
+                    raise RuntimeError(event.get("message", f"Tool '{tool_name}' failed"))
+
+        async def finish_streamed_tool(text: str):
+            return await finish_tool(tool_done.get("result", text))
+
+        return StreamingResponse(
+            ndjson_stream(tool_tokens(), finish_streamed_tool, started),
+            media_type=NDJSON_MEDIA_TYPE
+        )
 
     # Tool Call
     try:
-        # Ensure the payload matches the expected format for the weather service
-        if tool_name == "weather" and "query" in params:
-            params = {"query": params["query"]}
-
-        res = requests.post(tool["endpoint"], json=params)
-        res.raise_for_status()
+        reply = await call_tool(tool_name, params)
+    except ToolBusyError as e:
+        count_error("tool_busy")
+        return {
+            "status": "error",
+            "message": f"Tool '{tool_name}' is busy, please retry.",
+            "details": str(e)
+        }
+    except ToolUnavailableError as e:
+        count_error("tool_unavailable")
+        return {
+            "status": "error",
+            "message": f"Tool '{tool_name}' is unavailable, please retry later.",
+            "details": str(e)
+        }
     except Exception as e:
+        count_error("tool_failed")
         return {
             "status": "error",
             "message": f"Failed to call tool '{tool_name}'",
             "details": str(e)
         }
 
-    reply = res.json()
-    history.append({"role": "tool", "content": str(reply)})
+    return respond(req, started, await finish_tool(reply))
 
-    tool_cache[cache_key] = {
-        "tool_used": tool_name,
-        "parameters": params,
-        "confidence": confidence,
-        "reply": reply
-    }
+def prepare_params(tool: Dict[str, Any], params: Dict[str, Any], session_id: str) -> Dict[str, Any]:
+    """
+    Shape routed parameters into the payload the tool server expects.
+    """
+    params = dict(params or {})
+    if "session_id" in tool["parameters"]["properties"]:
+        params["session_id"] = session_id
+
+    # Ensure the payload matches the expected format for the weather service
+    if tool["name"] == "weather" and "query" in params:
+        params = {"query": params["query"]}
+    return params
+
+async def run_cached_tool(tool_name: str, params: Dict[str, Any]) -> Any:
+    """
+    One tool call for the fan-out path: served from the tool cache when possible.
+    """
+    cached = await tool_cache.get(tool_name, params)
+    count_cache("tool", "miss" if cached is None else "hit")
+    if cached is not None:
+        return cached["reply"]
+    reply = await call_tool(tool_name, params)
+    await tool_cache.set(tool_name, params, {"tool_used": tool_name, "parameters": params, "reply": reply})
+    return reply
+
+async def ask_many(req: UserQuery, tool_calls: list, tool_call: Dict[str, Any], routed_by: str) -> Dict[str, Any]:
+    """
+    Run several tool calls concurrently under one deadline and merge them into a single reply.
+    Total latency is bounded by the slowest tool (or the deadline), not the sum.
+    """
+    calls = [
+        {"tool": call["tool"], "parameters": prepare_params(TOOLS_BY_NAME[call["tool"]], call.get("parameters"), req.session_id)}
+        for call in tool_calls
+    ]
+    deadline = req.deadline or fanout_settings["deadline"]
+    results = await fan_out(calls, run_cached_tool, deadline)
+
+    reply = merge_replies(results, reply_text)
+    await session_memory.add(req.session_id, "tool", reply)
 
     return {
         "status": "success",
         "cached": False,
         "data": {
-            "tool_used": tool_name,
-            "confidence": confidence,
-            "parameters": params,
-            "reply": f"```\n{reply}\n```" if reply_format == "markdown" else reply
+            "tool_used": [result["tool"] for result in results],
+            "confidence": tool_call.get("confidence", "unknown"),
+            "routed_by": routed_by,
+            "parameters": [result["parameters"] for result in results],
+            "partial": any(result["status"] != "success" for result in results),
+            "results": results,
+            "reply": reply
         }
     }
 
-def handle_general_chat(session_id: str, message: str):
+# === GET /stats ===
+@app.get("/stats")
+async def router_stats():
     """
-    Handle general chat internally using the chat model.
+    Report routing stages, tool cache counters and the state of the tool pools.
     """
-    history = session_memory.get(session_id, [])
-    history.append({"role": "user", "parts": [message]})  # Use 'parts' key for the new message
+    total = sum(routing_stats.values())
+    return {
+        "routing": {
+            **routing_stats,
+            "llm_calls_saved": total - routing_stats["llm"],
+            "llm_output": llm_output_stats,
+        },
+        "cache": await tool_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "sessions": await session_memory.stats(),
+        "tool_pools": tool_client.stats(),
+        "admission": admission.stats(),
+        "coalescing": {
+            "tools": tool_flights.stats(),
+            "router_llm": router_llm_flights.stats(),
+        },
+        "gemini": gemini.stats(),
+    }
 
-    # Ensure all entries in history use the 'parts' key
-    formatted_history = []
-    for entry in history:
-        if "parts" not in entry and "content" in entry:
-            formatted_history.append({"role": entry["role"], "parts": [entry["content"]]})
-        else:
-            formatted_history.append({"role": entry["role"], "parts": entry["parts"]})
+# === POST /cache/invalidate ===
+class CacheInvalidation(BaseModel):
+    tool: str
+    session_id: Optional[str] = None  # only drop this session's replies
+
+@app.post("/cache/invalidate")
+async def invalidate_cache(req: CacheInvalidation):
+    """
+    Drop cached replies for one tool (e.g. RAG answers after documents are re-uploaded).
+    """
+    removed = await tool_cache.invalidate(req.tool, req.session_id)
+    return {"status": "success", "tool": req.tool, "removed": removed}
+
+# === Tool Registry (tool servers register their replicas and heartbeat) ===
+class ToolRegistration(BaseModel):
+    tool: str
+    url: str
+
+@app.post("/tools/register")
+async def register_tool(req: ToolRegistration):
+    """
+    Add (or refresh) a replica for a tool; it expires unless re-registered within the TTL.
+    """
+    if req.tool not in TOOLS_BY_NAME and req.tool != "upload":
+        raise HTTPException(status_code=404, detail=f"Unknown tool '{req.tool}'")
+    ttl = tool_client.registry.register(req.tool, req.url)
+    return {"status": "success", "tool": req.tool, "url": req.url, "ttl": ttl}
+
+@app.post("/tools/deregister")
+async def deregister_tool(req: ToolRegistration):
+    """
+    Remove a registered replica (e.g. on a tool server's shutdown).
+    """
+    removed = tool_client.registry.deregister(req.tool, req.url)
+    return {"status": "success", "tool": req.tool, "url": req.url, "removed": removed}
+
+@app.get("/tools")
+async def list_tools():
+    """
+    Replicas per tool with their health, circuit state, load and latency.
+    """
+    return tool_client.stats()
 
-    response = chat_model.generate_content(formatted_history)
-    reply = response.text
-    history.append({"role": "model", "parts": [reply]})  # Use 'parts' key for the model's response
+# === POST /upload (documents go into the session's own RAG namespace) ===
+@app.post("/upload", status_code=202)
+async def upload_document(file: UploadFile, session_id: str = Form(...)):
+    """
+    Forward a PDF to the RAG server's /upload for this session, then drop the session's cached RAG answers.
+    """
+    try:
+        reply = await tool_client.upload(
+            "upload",
+            {"session_id": session_id},
+            {"file": (file.filename, file.file, file.content_type or "application/pdf")},
+        )
+    except (ToolBusyError, ToolUnavailableError) as e:
+        return JSONResponse(status_code=503, content={
+            "status": "error",
+            "message": "The document service is busy, please retry.",
+            "details": str(e)
+        })
+    except httpx.HTTPStatusError as e:
+        return JSONResponse(status_code=e.response.status_code, content={
+            "status": "error",
+            "message": "The document service rejected the upload.",
+            "details": e.response.text
+        })
+    except Exception as e:
+        return JSONResponse(status_code=502, content={
+            "status": "error",
+            "message": "Failed to upload the document.",
+            "details": str(e)
+        })
 
-    session_memory[session_id] = history
+    for tool_name in ("query", "rag"):
+        await tool_cache.invalidate(tool_name, session_id)
     return reply
+
+async def handle_general_chat(session_id: str):
+    """
+    Handle general chat internally using the chat model.
+    """
+    # The user message was already recorded by /ask
+    summary, history = await session_memory.context(session_id)
+    response = await chat_model.generate_content_async(to_gemini_contents(summary, history))
+    return response.text
+
+async def stream_general_chat(session_id: str):
+    """
+    Streaming variant of handle_general_chat: yields reply text as the chat model produces it.
+    """
+    summary, history = await session_memory.context(session_id)
+    response = await chat_model.generate_content_async(to_gemini_contents(summary, history), stream=True)
+    async for text in gemini_text_chunks(response):
+        yield text
@@ -0,0 +1,235 @@
+# ✅ Admission control – per-session and global rate limits, priority queueing and load shedding
+#
+# Every /ask passes through check_session() and admit() before any real work is done:
+#   1. the session's token bucket: a session over its rate gets an immediate 429, so a burst
+#      from one client cannot use up the shared capacity
+#   2. a global token bucket (requests/sec) and a cap on requests handled at once: when either
+#      is exhausted the request waits in a bounded priority queue (cheap tools first)
+#   3. load shedding: a full queue drops its lowest-priority waiter (or refuses the newcomer),
+#      and a waiter that cannot be admitted within its class's max wait gets a fast 503
+# The holder of an admission calls release() once the response (or stream) is finished
+# (release_once() when several code paths may finish it).
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from common.gemini_client import TokenBucket
+from common.telemetry import registry
+
+# === Defaults (overridable through the "admission" section of config.json) ===
+DEFAULT_ADMISSION_SETTINGS = {
+    "enabled": True,
+    "session_rate": 5.0,        # requests/sec per session (refill rate)
+    "session_burst": 20,        # requests a session may send back to back
+    "global_rate": 100.0,       # requests/sec admitted across all sessions
+    "global_burst": 200,
+    "max_concurrent": 64,       # requests handled at once
+    "max_queue": 200,           # requests waiting for admission
+    "max_sessions": 10000,      # session buckets kept (least recently seen dropped first)
+    "max_wait": {"high": 10.0, "normal": 5.0, "low": 3.0},  # seconds a class may wait in the queue
+    # Priority class of the tool the fast router predicts; "default" for everything else (LLM-routed)
+    "priorities": {"weather": "high", "chat": "high", "search": "normal", "think": "low", "query": "low",
+                   "rag": "low", "default": "normal"},
+}
+
+PRIORITY_ORDER = {"high": 0, "normal": 1, "low": 2}
+
+admission_wait_seconds = registry.histogram(
+    "admission_queue_seconds", "Time /ask requests waited for admission.", ("priority", "result"),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+admission_requests = registry.counter(
+    "admission_requests_total",
+    "Admission decisions by priority and result (admitted, queued, shed, timeout; session_limited as \"any\").",
+    ("priority", "result"),
+)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, message: str, retry_after: float, reason: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    def __init__(self, priority: str, future: asyncio.Future):
+        self.priority = priority
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class AdmissionController:
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        settings = {**DEFAULT_ADMISSION_SETTINGS, **(settings or {})}
+        settings["max_wait"] = {**DEFAULT_ADMISSION_SETTINGS["max_wait"], **settings["max_wait"]}
+        self.settings = settings
+        self.enabled = settings["enabled"]
+        self.global_bucket = TokenBucket(settings["global_rate"], settings["global_burst"])
+        self.sessions: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.in_flight = 0
+        self._queue: List[tuple] = []  # heap of (priority rank, sequence, waiter)
+        self._sequence = itertools.count()
+        self._pump_scheduled = False
+        self.counters = {"admitted": 0, "queued": 0, "session_limited": 0, "shed": 0, "timeout": 0}
+
+    def priority_for(self, tool: Optional[str]) -> str:
+        priorities = self.settings["priorities"]
+        return priorities.get(tool or "", priorities.get("default", "normal"))
+
+    def _session_bucket(self, session_id: str) -> TokenBucket:
+        bucket = self.sessions.get(session_id)
+        if bucket is None:
+            bucket = TokenBucket(self.settings["session_rate"], self.settings["session_burst"])
+            self.sessions[session_id] = bucket
+            while len(self.sessions) > self.settings["max_sessions"]:
+                self.sessions.popitem(last=False)
+        self.sessions.move_to_end(session_id)
+        return bucket
+
+    def _count(self, priority: str, result: str):
+        self.counters[result] += 1
+        admission_requests.inc(priority=priority, result=result)
+
+    def check_session(self, session_id: str):
+        """
+        Take one of the session's tokens; raises AdmissionRejected (429) when it has none left.
+        Cheap, so callers run it before any other work on the request.
+        """
+        if not self.enabled:
+            return
+        bucket = self._session_bucket(session_id)
+        if not bucket.try_acquire():
+            self._count("any", "session_limited")
+            raise AdmissionRejected(
+                429, "Too many requests for this session, please slow down.", bucket.seconds_until_token(), "session_rate"
+            )
+
+    async def admit(self, priority: str):
+        """
+        Return once the request may run (then call release()); raises AdmissionRejected otherwise.
+        """
+        if not self.enabled:
+            self.in_flight += 1
+            return
+
+        if not self._queue and self.in_flight < self.settings["max_concurrent"] and self.global_bucket.try_acquire():
+            self.in_flight += 1
+            self._count(priority, "admitted")
+            admission_wait_seconds.observe(0.0, priority=priority, result="admitted")
+            return
+
+        waiter = _Waiter(priority, asyncio.get_running_loop().create_future())
+        self._enqueue(waiter)
+        self._count(priority, "queued")
+        self._pump()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.settings["max_wait"].get(priority, 5.0))
+        except asyncio.TimeoutError:
+            if not waiter.future.done():
+                self._remove(waiter)
+                self._count(priority, "timeout")
+                admission_wait_seconds.observe(time.perf_counter() - waiter.enqueued, priority=priority, result="timeout")
+                raise AdmissionRejected(503, "The router is overloaded, please retry.", self._retry_after(), "timeout")
+            # Admitted or shed just as the wait ran out: settled below, like any other outcome
+        except asyncio.CancelledError:
+            # The client went away: give the slot back if it had just been granted
+            if waiter.future.done() and not waiter.future.cancelled() and not waiter.future.exception():
+                self.release()
+            else:
+                self._remove(waiter)
+            raise
+        except AdmissionRejected:
+            # Shed to make room for a higher-priority request (counted when it was shed)
+            admission_wait_seconds.observe(time.perf_counter() - waiter.enqueued, priority=priority, result="shed")
+            raise
+        if waiter.future.exception() is not None:
+            admission_wait_seconds.observe(time.perf_counter() - waiter.enqueued, priority=priority, result="shed")
+            raise waiter.future.exception()
+        self._count(priority, "admitted")
+        admission_wait_seconds.observe(time.perf_counter() - waiter.enqueued, priority=priority, result="admitted")
+
+    def release(self):
+        self.in_flight -= 1
+        self._pump()
+
+    def release_once(self) -> Callable[[], None]:
+        """
+        A release() for one admission that is safe to call from several places (a stream's
+        generator and the response's background task): only the first call gives the slot back.
+        """
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.release()
+
+        return release
+
+    def _enqueue(self, waiter: _Waiter):
+        rank = PRIORITY_ORDER.get(waiter.priority, 1)
+        if len(self._queue) >= self.settings["max_queue"]:
+            # Shed the lowest-priority, most recent waiter, unless the newcomer ranks no higher
+            worst = max(self._queue)
+            if worst[0] <= rank:
+                self._count(waiter.priority, "shed")
+                raise AdmissionRejected(503, "The router is overloaded, please retry.", self._retry_after(), "shed")
+            self._queue.remove(worst)
+            heapq.heapify(self._queue)
+            self._count(worst[2].priority, "shed")
+            worst[2].future.set_exception(
+                AdmissionRejected(503, "The router is overloaded, please retry.", self._retry_after(), "shed")
+            )
+        heapq.heappush(self._queue, (rank, next(self._sequence), waiter))
+
+    def _remove(self, waiter: _Waiter):
+        for index, entry in enumerate(self._queue):
+            if entry[2] is waiter:
+                self._queue.pop(index)
+                heapq.heapify(self._queue)
+                return
+
+    def _pump(self):
+        """
+        Admit queued requests, best priority first, while slots and global tokens allow.
+        """
+        while self._queue and self.in_flight < self.settings["max_concurrent"]:
+            if self._queue[0][2].future.done():
+                heapq.heappop(self._queue)
+                continue
+            if not self.global_bucket.try_acquire():
+                # Come back when the next token is due
+                if not self._pump_scheduled:
+                    self._pump_scheduled = True
+                    asyncio.get_running_loop().call_later(self.global_bucket.seconds_until_token(), self._scheduled_pump)
+                return
+            _, _, waiter = heapq.heappop(self._queue)
+            self.in_flight += 1
+            waiter.future.set_result(None)
+
+    def _scheduled_pump(self):
+        self._pump_scheduled = False
+        self._pump()
+
+    def _retry_after(self) -> float:
+        """
+        Rough time for the current queue to drain at the global rate.
+        """
+        return max(1.0, math.ceil(len(self._queue) / self.settings["global_rate"]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "queued_now": len(self._queue),
+            "sessions": len(self.sessions),
+        }
@@ -0,0 +1,63 @@
+# ✅ Multi-tool fan-out – run several tool calls concurrently under one deadline and merge them
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+# === Defaults (overridable through the "fanout" section of config.json) ===
+DEFAULT_FANOUT_SETTINGS = {
+    "deadline": 20.0,   # seconds for the whole fan-out; slower tools are reported as timed out
+    "max_tools": 3,     # tool calls accepted from one routing decision
+}
+
+ToolRunner = Callable[[str, Dict[str, Any]], Awaitable[Any]]
+
+
+async def fan_out(calls: List[Dict[str, Any]], run_call: ToolRunner, deadline: float) -> List[Dict[str, Any]]:
+    """
+    Run every {"tool", "parameters"} call concurrently and return one result per call, in order.
+    Calls still running at the deadline are cancelled and reported with status "timeout".
+    """
+    started = time.perf_counter()
+    finished_at: Dict[int, float] = {}
+
+    async def timed(index: int, call: Dict[str, Any]):
+        try:
+            return await run_call(call["tool"], call["parameters"])
+        finally:
+            finished_at[index] = time.perf_counter()
+
+    tasks = [asyncio.ensure_future(timed(i, call)) for i, call in enumerate(calls)]
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+
+    results = []
+    for index, (call, task) in enumerate(zip(calls, tasks)):
+        result = {"tool": call["tool"], "parameters": call["parameters"]}
+        if task in pending:
+            result.update(status="timeout", elapsed_ms=round(deadline * 1000, 1))
+        else:
+            result["elapsed_ms"] = round((finished_at[index] - started) * 1000, 1)
+            if task.exception() is not None:
+                result.update(status="error", details=str(task.exception()))
+            else:
+                result.update(status="success", reply=task.result())
+        results.append(result)
+    return results
+
+
+def merge_replies(results: List[Dict[str, Any]], reply_text: Callable[[Any], str]) -> str:
+    """
+    Build one markdown reply with a section per tool, noting tools that failed or timed out.
+    """
+    sections = []
+    for result in results:
+        title = result["tool"].capitalize()
+        if result["status"] == "success":
+            sections.append(f"**{title}**\n{reply_text(result['reply'])}")
+        elif result["status"] == "timeout":
+            sections.append(f"**{title}**\n_No answer within the time limit._")
+        else:
+            sections.append(f"**{title}**\n_Unavailable: {result['details']}_")
+    return "\n\n".join(sections)
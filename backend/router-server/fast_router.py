@@ -0,0 +1,190 @@
+# ✅ Fast-path router – local rules + a small text classifier before the Gemini routing call
+
+import os
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+except ImportError:  # classifier stage is optional
+    make_pipeline = None
+
+# Minimum classifier probability needed to skip the LLM router
+FAST_ROUTER_THRESHOLD = float(os.getenv("FAST_ROUTER_THRESHOLD", "0.6"))
+
+# Which request field each tool expects the raw user message in
+TOOL_MESSAGE_PARAM = {
+    "search": "q",
+    "think": "task",
+    "query": "question",
+    "rag": "question",
+    "weather": "query",
+}
+
+# === Place names ===
+# One to four words of letters ("Paris", "New York, US", "St. Louis") ending the message, and
+# none of them an article, question word, time or unit: "the stock market", "which water boils"
+# and "kelvin for 0 celsius" are not places
+PLACE = (
+    r"(?![^?.!]*\b(?:the|a|an|which|what|who|how|when|is|it|this|that|me|my|now|today|tomorrow|tonight|kelvin|celsius|fahrenheit)\b)"
+    r"[a-z][a-z.'-]*(?:,?\s+[a-z][a-z.'-]*){0,3}"
+)
+WEATHER_IN_PLACE = r"\b(?:weather|forecast)(?:\s+like)?\s+(?:in|at|for)\s+(?P<location>" + PLACE + r")\s*[?.!]*$"
+PLACE_WEATHER = r"^\s*(?P<location>" + PLACE + r")\s+weather\s*[?.!]*$"
+IN_PLACE = r"\b(?:in|at|for)\s+(?P<location>" + PLACE + r")\s*[?.!]*$"
+
+# Words that make "... in <place>" a weather question when the classifier picked weather
+WEATHER_WORDS = re.compile(
+    r"\b(weather|forecast|temperature|humid(ity)?|rain(ing|y)?|snow(ing|y)?|sunny|cloudy|windy|umbrella|hot|cold|warm)\b", re.I
+)
+
+
+def _unnamed(pattern: str) -> str:
+    return pattern.replace("(?P<location>", "(?:")
+
+
+# === Stage 1: Rules (unambiguous phrasings only) ===
+RULES: List[Tuple[str, re.Pattern]] = [
+    # Weather or forecast wording followed by a place, or "<place> weather"
+    ("weather", re.compile(_unnamed(WEATHER_IN_PLACE) + "|" + _unnamed(PLACE_WEATHER), re.I)),
+    # Only possessive or upload phrasings: "the report from the IPCC" is a web question
+    ("query", re.compile(r"\b(uploaded|attached|my)\s+(pdf|document|doc|file|paper|report)s?\b", re.I)),
+    ("think", re.compile(r"\b(step[- ]by[- ]step|reason through|think through|prove that)\b", re.I)),
+    ("search", re.compile(r"\b(latest|news|today'?s|search (for|the web)|look up)\b", re.I)),
+    ("chat", re.compile(r"^\s*(hi|hello|hey|thanks|thank you|good (morning|evening|night)|bye)\b[\s!.?]*$", re.I)),
+]
+
+# Where one clause of a message ends and the next begins ("weather in Paris and the latest news on AI")
+CLAUSE_JOINERS = re.compile(r"\s*(?:[;,]|\b(?:and|also|plus|then)\b)\s*", re.I)
+
+
+def rule_tools(message: str) -> Set[str]:
+    return {tool for tool, pattern in RULES if pattern.search(message)}
+
+
+def is_multi_intent(message: str) -> bool:
+    """
+    True when the message asks for more than one tool: several rules match it, or several of
+    its clauses match a rule each. Such messages go to the LLM, which can return tool_calls.
+    """
+    if len(rule_tools(message)) > 1:
+        return True
+    clauses = [clause for clause in CLAUSE_JOINERS.split(message) if clause.strip()]
+    return sum(1 for clause in clauses if rule_tools(clause)) > 1
+
+
+# Location phrasings the weather server's extract_location_from_query understands
+LOCATION_PATTERNS = [re.compile(WEATHER_IN_PLACE, re.I), re.compile(PLACE_WEATHER, re.I)]
+# "is it raining in London": a place after in/at/for, only trusted next to weather wording
+WORDED_LOCATION_PATTERN = re.compile(IN_PLACE, re.I)
+
+
+def extract_location(message: str) -> Optional[str]:
+    patterns = list(LOCATION_PATTERNS)
+    if WEATHER_WORDS.search(message):
+        patterns.append(WORDED_LOCATION_PATTERN)
+    for pattern in patterns:
+        match = pattern.search(message)
+        if match:
+            return match.group("location").strip()
+    return None
+
+
+# === Stage 2: Seed examples for the local classifier ===
+SEED_EXAMPLES: Dict[str, List[str]] = {
+    "weather": [
+        "weather in Kolkata", "what's the weather like in Paris", "is it raining in London",
+        "temperature in Tokyo right now", "will it be sunny in Berlin", "how hot is it in Delhi",
+        "Mumbai weather", "do I need an umbrella in Seattle", "how cold is it in Moscow today",
+        "what's the temperature in Rome", "current temperature in Chicago", "what is the forecast for Cairo",
+        "humidity in Singapore",
+    ],
+    "search": [
+        "who won the match yesterday", "what is the capital of Sweden", "current price of bitcoin",
+        "who is the CEO of Google", "when was the Eiffel Tower built", "latest news about AI",
+        "population of Canada", "release date of the new iPhone", "find reviews for the Pixel phone",
+    ],
+    "think": [
+        "solve this equation for x", "plan a three week study schedule", "compare these two algorithms and pick one",
+        "explain why the proof works", "design a database schema for a library", "break down how to migrate our app",
+        "what are the trade offs between SQL and NoSQL", "calculate the compound interest over ten years",
+        "help me reason about this logic puzzle",
+    ],
+    "query": [
+        "what does the document say about pricing", "summarize the uploaded pdf", "according to my file what is the deadline",
+        "find the warranty terms in the report", "what does section 3 of the paper cover", "list the authors in the document",
+        "in the contract what is the notice period", "what are the key findings in the attached report",
+        "search my documents for the invoice number",
+    ],
+    "chat": [
+        "hello there", "how are you doing", "tell me a joke", "thanks for the help", "good morning",
+        "what's your name", "nice to meet you", "can you be my friend", "I'm feeling bored",
+    ],
+}
+
+
+class FastRouter:
+    """
+    Cheap pre-routing: regex rules first, then a TF-IDF + logistic regression classifier.
+    Returns None when neither stage is confident, or when the message asks for several tools
+    (only the LLM can fan out), so the caller falls back to the LLM.
+    """
+
+    def __init__(self, threshold: float = FAST_ROUTER_THRESHOLD, tool_names: Optional[List[str]] = None):
+        self.threshold = threshold
+        self.tool_names = set(tool_names) if tool_names else None
+        self.classifier = self._train() if make_pipeline else None
+
+    def _train(self):
+        texts, labels = [], []
+        for tool, examples in SEED_EXAMPLES.items():
+            texts.extend(examples)
+            labels.extend([tool] * len(examples))
+        classifier = make_pipeline(
+            TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True),
+            LogisticRegression(C=10.0, max_iter=1000),
+        )
+        classifier.fit(texts, labels)
+        return classifier
+
+    def decision_for(self, tool: str, message: str, confidence: str, stage: str, score: float) -> Optional[Dict[str, Any]]:
+        """
+        Build a routing decision for a tool chosen by any stage, deriving its parameters from the message.
+        """
+        if self.tool_names is not None and tool not in self.tool_names:
+            return None
+        if tool == "weather":
+            # Hand the weather server a phrasing it can always parse, or defer to the LLM
+            location = extract_location(message)
+            if not location:
+                return None
+            message = f"weather in {location}"
+        param = TOOL_MESSAGE_PARAM.get(tool)
+        return {
+            "tool": tool,
+            "parameters": {param: message} if param else None,
+            "confidence": confidence,
+            "stage": stage,
+            "score": round(score, 3),
+        }
+
+    def route(self, message: str) -> Optional[Dict[str, Any]]:
+        if is_multi_intent(message):
+            return None
+
+        for tool, pattern in RULES:
+            if pattern.search(message):
+                return self.decision_for(tool, message, "high", "rules", 1.0)
+
+        if self.classifier is None:
+            return None
+
+        probabilities = self.classifier.predict_proba([message])[0]
+        best = probabilities.argmax()
+        score = float(probabilities[best])
+        if score < self.threshold:
+            return None
+        confidence = "high" if score >= 0.85 else "medium"
+        return self.decision_for(str(self.classifier.classes_[best]), message, confidence, "classifier", score)
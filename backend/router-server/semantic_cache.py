@@ -0,0 +1,196 @@
+# ✅ Semantic cache – reuse routing decisions (and safe replies) for paraphrased queries
+
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # fall back to a brute-force numpy index
+    faiss = None
+
+# === Defaults (overridable through the "semantic_cache" section of config.json) ===
+DEFAULT_SEMANTIC_SETTINGS = {
+    "enabled": False,
+    "embedder": "local",           # "local" (offline hashing) or "gemini"
+    "dim": 512,                    # local embedder dimension
+    "threshold": 0.9,              # cosine similarity needed to reuse a routing decision
+    "reply_threshold": 0.95,       # stricter similarity needed to reuse a reply
+    "reply_tools": ["search", "think"],  # tools whose replies are safe to share between paraphrases
+    "max_entries": 2000,
+}
+
+
+# Words that don't change what a query asks for ("what's Paris weather" = "weather in Paris?")
+STOP_WORDS = frozenset(
+    "a an the is are was were be been what whats which who whom how when where why of in on at for to "
+    "from by with about do does did can could would will should please tell me my i you your it its s "
+    "there this that these those and or some any like right now".split()
+)
+
+
+class LocalEmbedder:
+    """
+    Deterministic offline stand-in: hashed content words + their character trigrams, L2-normalised.
+    Word order and stop words are ignored, so rephrasings of the same words score ~1.0 and clear
+    the default thresholds, while a different place or entity ("Paris" vs "London") stays below
+    ~0.7. The flip side: "flights from Paris to London" and "... London to Paris" look identical,
+    so keep tools whose replies depend on word order out of reply_tools when using it.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[Tuple[str, float]]:
+        features = []
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            if word in STOP_WORDS:
+                continue
+            padded = f" {word} "
+            features.append((f"w:{word}", 2.0))
+            features.extend((f"c:{padded[i:i + 3]}", 1.0) for i in range(len(padded) - 2))
+        return features
+
+    async def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype="float32")
+        for feature, weight in self._features(text):
+            bucket = int.from_bytes(hashlib.md5(feature.encode()).digest()[:4], "little")
+            vector[bucket % self.dim] += weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class GeminiEmbedder:
+    """
+    Gemini text embeddings, normalised for cosine similarity.
+    """
+
+    def __init__(self, model: str = "models/embedding-001"):
+        from common.gemini_client import get_gemini_client
+
+        self.client = get_gemini_client()
+        self.model = model
+        self.dim = 768
+
+    async def embed(self, text: str) -> np.ndarray:
+        result = await self.client.embed_content_async(model=self.model, content=text)
+        vector = np.asarray(result["embedding"], dtype="float32")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class VectorIndex:
+    """
+    Inner-product index with id-based removal; FAISS when installed, numpy otherwise.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        if faiss is not None:
+            self._faiss = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        else:
+            self._faiss = None
+            self._vectors: Dict[int, np.ndarray] = {}
+
+    def add(self, entry_id: int, vector: np.ndarray):
+        if self._faiss is not None:
+            self._faiss.add_with_ids(vector.reshape(1, -1), np.array([entry_id], dtype="int64"))
+        else:
+            self._vectors[entry_id] = vector
+
+    def remove(self, entry_id: int):
+        if self._faiss is not None:
+            self._faiss.remove_ids(np.array([entry_id], dtype="int64"))
+        else:
+            self._vectors.pop(entry_id, None)
+
+    def nearest(self, vector: np.ndarray) -> Optional[Tuple[int, float]]:
+        if self._faiss is not None:
+            if self._faiss.ntotal == 0:
+                return None
+            scores, ids = self._faiss.search(vector.reshape(1, -1), 1)
+            return int(ids[0][0]), float(scores[0][0])
+        if not self._vectors:
+            return None
+        ids = list(self._vectors)
+        scores = np.stack([self._vectors[i] for i in ids]) @ vector
+        best = int(scores.argmax())
+        return ids[best], float(scores[best])
+
+
+class SemanticCache:
+    """
+    Maps query embeddings to the routing decision (and, for reply_tools, the reply) they produced.
+    Bounded by max_entries with least-recently-used eviction.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        settings = {**DEFAULT_SEMANTIC_SETTINGS, **(config or {})}
+        self.settings = settings
+        self.enabled = bool(settings["enabled"])
+        if settings["embedder"] == "gemini":
+            self.embedder = GeminiEmbedder()
+        else:
+            self.embedder = LocalEmbedder(settings["dim"])
+        self.index = VectorIndex(self.embedder.dim)
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+
+        self.hits = 0
+        self.reply_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def embed(self, message: str) -> np.ndarray:
+        return await self.embedder.embed(message)
+
+    def lookup(self, vector: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Return {"tool_call", "reply", "similarity"} for the nearest cached query above threshold.
+        "reply" is only set when the match is close enough and the tool is reply-safe.
+        """
+        match = self.index.nearest(vector)
+        if match is None or match[1] < self.settings["threshold"]:
+            self.misses += 1
+            return None
+
+        entry_id, similarity = match
+        entry = self._entries[entry_id]
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+
+        reply = None
+        if (
+            entry["reply"] is not None
+            and similarity >= self.settings["reply_threshold"]
+            and entry["tool_call"].get("tool") in self.settings["reply_tools"]
+        ):
+            reply = entry["reply"]
+            self.reply_hits += 1
+
+        return {"tool_call": entry["tool_call"], "message": entry["message"], "reply": reply, "similarity": similarity}
+
+    def add(self, vector: np.ndarray, message: str, tool_call: Dict[str, Any], reply: Any = None):
+        entry_id = self._next_id
+        self._next_id += 1
+        self.index.add(entry_id, vector)
+        self._entries[entry_id] = {"message": message, "tool_call": tool_call, "reply": reply}
+
+        while len(self._entries) > self.settings["max_entries"]:
+            evicted_id, _ = self._entries.popitem(last=False)
+            self.index.remove(evicted_id)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "reply_hits": self.reply_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
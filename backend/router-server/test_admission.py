@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+import admission as admission_module
+from admission import AdmissionController, AdmissionRejected, _Waiter
+
+
+def controller(**settings) -> AdmissionController:
+    return AdmissionController({"global_rate": 1000.0, "global_burst": 1000, **settings})
+
+
+def test_release_once_gives_the_slot_back_a_single_time():
+    async def run():
+        admission = controller(max_concurrent=2)
+        await admission.admit("normal")
+        release = admission.release_once()
+        release()
+        release()  # e.g. the stream's finally and the response's background task
+        assert admission.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_shed_waiter_is_counted_once():
+    async def run():
+        admission = controller(max_concurrent=1, max_queue=1)
+        await admission.admit("high")
+        low = asyncio.create_task(admission.admit("low"))
+        await asyncio.sleep(0)
+        high = asyncio.create_task(admission.admit("high"))
+        with pytest.raises(AdmissionRejected) as rejected:
+            await low
+        assert rejected.value.reason == "shed"
+        admission.release()
+        await high
+        assert admission.counters["shed"] == 1 and admission.counters["timeout"] == 0
+        assert admission.counters["admitted"] == 2
+
+    asyncio.run(run())
+
+
+def test_shed_racing_the_timeout_counts_as_shed_only(monkeypatch):
+    async def run():
+        admission = controller(max_concurrent=1, max_queue=1)
+        await admission.admit("high")
+
+        async def shed_then_time_out(awaitable, timeout):
+            awaitable.cancel()
+            admission._enqueue(_Waiter("high", asyncio.get_running_loop().create_future()))
+            raise asyncio.TimeoutError
+
+        monkeypatch.setattr(admission_module.asyncio, "wait_for", shed_then_time_out)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.admit("low")
+        assert rejected.value.reason == "shed"
+        assert admission.counters["shed"] == 1 and admission.counters["timeout"] == 0
+
+    asyncio.run(run())
+
+
+def test_admission_racing_the_timeout_counts_as_admitted_only(monkeypatch):
+    async def run():
+        admission = controller(max_concurrent=1)
+        await admission.admit("high")
+
+        async def admit_then_time_out(awaitable, timeout):
+            awaitable.cancel()
+            admission.release()  # frees the slot: the pump admits the waiter
+            raise asyncio.TimeoutError
+
+        monkeypatch.setattr(admission_module.asyncio, "wait_for", admit_then_time_out)
+        await admission.admit("low")
+        assert admission.in_flight == 1
+        assert admission.counters["admitted"] == 2 and admission.counters["timeout"] == 0
+
+    asyncio.run(run())
+
+
+def test_waiter_times_out_when_no_slot_frees():
+    async def run():
+        admission = controller(max_concurrent=1, max_wait={"low": 0.01})
+        await admission.admit("high")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.admit("low")
+        assert rejected.value.reason == "timeout" and rejected.value.status_code == 503
+        assert admission.counters["timeout"] == 1 and not admission.stats()["queued_now"]
+
+    asyncio.run(run())
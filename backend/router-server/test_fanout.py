@@ -0,0 +1,39 @@
+import asyncio
+
+from fanout import fan_out, merge_replies
+
+
+def test_fan_out_keeps_order_and_reports_errors_and_timeouts():
+    async def run():
+        async def run_call(tool, parameters):
+            if tool == "search":
+                raise RuntimeError("search is down")
+            if tool == "think":
+                await asyncio.sleep(10)
+            return f"{tool} ok"
+
+        calls = [{"tool": name, "parameters": {"q": "x"}} for name in ("weather", "search", "think")]
+        results = await fan_out(calls, run_call, deadline=0.05)
+        assert [result["status"] for result in results] == ["success", "error", "timeout"]
+        assert results[0]["reply"] == "weather ok" and results[1]["details"] == "search is down"
+
+        merged = merge_replies(results, str)
+        assert "**Weather**\nweather ok" in merged
+        assert "_Unavailable: search is down_" in merged
+        assert "_No answer within the time limit._" in merged
+
+    asyncio.run(run())
+
+
+def test_fan_out_runs_calls_concurrently():
+    async def run():
+        async def run_call(tool, parameters):
+            await asyncio.sleep(0.1)
+            return tool
+
+        started = asyncio.get_running_loop().time()
+        results = await fan_out([{"tool": f"t{i}", "parameters": None} for i in range(3)], run_call, deadline=5.0)
+        assert asyncio.get_running_loop().time() - started < 0.25
+        assert all(result["status"] == "success" for result in results)
+
+    asyncio.run(run())
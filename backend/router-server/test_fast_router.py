@@ -0,0 +1,93 @@
+import pytest
+
+from fast_router import RULES, FastRouter, extract_location, is_multi_intent
+
+
+def rule_for(message: str):
+    return next((tool for tool, pattern in RULES if pattern.search(message)), None)
+
+
+@pytest.mark.parametrize("message, tool", [
+    ("weather in Kolkata", "weather"),
+    ("Mumbai weather?", "weather"),
+    ("what's the weather like in New York, US", "weather"),
+    ("forecast for St. Louis", "weather"),
+    ("summarize the uploaded pdf", "query"),
+    ("what are the key findings in the attached report", "query"),
+    ("search my documents for the invoice number", "query"),
+    ("explain step by step how a hash map works", "think"),
+    ("prove that the square root of 2 is irrational", "think"),
+    ("latest news about AI", "search"),
+    ("hello!", "chat"),
+])
+def test_rules_route_unambiguous_phrasings(message, tool):
+    assert rule_for(message) == tool
+
+
+@pytest.mark.parametrize("message", [
+    "what did the report from the IPCC say",
+    "summarize the paper on transformers",
+    "who wrote this paper on attention",
+    "work out a budget for my trip",
+    "how do I work out at home",
+    "hello, can you explain quantum computing",
+    "what is the temperature at which water boils",
+    "what is the forecast for the stock market in 2025",
+    "what is the temperature in kelvin for 0 celsius",
+    "what time is it in Tokyo",
+    "what is the weather?",
+])
+def test_rules_leave_ambiguous_messages_to_later_stages(message):
+    assert rule_for(message) is None
+
+
+def test_web_questions_about_a_report_are_not_sent_to_the_document_tool_by_rule():
+    decision = FastRouter(threshold=1.1).route("what did the report from the IPCC say")
+    assert decision is None  # no rule fired and the classifier is never confident enough
+
+
+def test_weather_without_a_parseable_location_defers_to_the_llm():
+    assert FastRouter().decision_for("weather", "is it cold", "high", "rules", 1.0) is None
+
+
+@pytest.mark.parametrize("message", [
+    "what is the temperature at which water boils",
+    "what is the forecast for the stock market in 2025",
+    "what is the temperature in kelvin for 0 celsius",
+    "what time is it in Tokyo",
+])
+def test_questions_that_are_not_about_weather_never_reach_the_weather_tool(message):
+    decision = FastRouter().route(message)
+    assert decision is None or decision["tool"] != "weather"
+
+
+def test_weather_decisions_carry_only_the_place():
+    assert FastRouter().route("is it raining in London")["parameters"] == {"query": "weather in London"}
+    assert extract_location("temperature in Tokyo right now") is None
+    assert extract_location("what time is it in Tokyo") is None
+
+
+@pytest.mark.parametrize("city", ["London", "New York", "Sydney", "Delhi"])
+def test_temperature_questions_about_a_place_still_take_the_fast_path(city):
+    decision = FastRouter().route(f"what's the temperature in {city}")
+    assert decision["tool"] == "weather"
+    assert decision["parameters"] == {"query": f"weather in {city}"}
+
+
+@pytest.mark.parametrize("message", [
+    "weather in paris and the latest news on AI",
+    "weather in Paris, weather in London",
+    "latest news about AI then explain step by step how it works",
+])
+def test_messages_asking_for_several_tools_skip_the_fast_path(message):
+    assert is_multi_intent(message)
+    assert FastRouter().route(message) is None
+
+
+@pytest.mark.parametrize("message", [
+    "weather in Kolkata",
+    "compare SQL and NoSQL",
+    "latest news on trade and tariffs",
+])
+def test_single_intent_messages_with_conjunctions_keep_the_fast_path(message):
+    assert not is_multi_intent(message)
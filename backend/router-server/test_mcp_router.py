@@ -0,0 +1,99 @@
+import asyncio
+import importlib
+import os
+import time
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def router(monkeypatch):
+    # The router reads config.json from the working directory and must not need a Gemini key
+    monkeypatch.chdir(BACKEND_DIR)
+    monkeypatch.setenv("LLM_PROVIDER", "mock")
+    return importlib.import_module("0_mcp_router_true")
+
+
+def test_multi_intent_message_reaches_the_llm_and_fans_out(router, monkeypatch):
+    message = "weather in paris and the latest news on AI"
+    prompts = []
+    called = []
+
+    async def route_with_llm(msg, prompt):
+        prompts.append(msg)
+        return {
+            "tool": "weather", "parameters": {"query": "weather in paris"}, "confidence": "high",
+            "tool_calls": [
+                {"tool": "weather", "parameters": {"query": "weather in paris"}},
+                {"tool": "search", "parameters": {"q": "latest news on AI"}},
+            ],
+        }
+
+    async def run_cached_tool(tool_name, params):
+        called.append(tool_name)
+        return {"answer": f"{tool_name} reply"}
+
+    monkeypatch.setattr(router, "route_with_llm", route_with_llm)
+    monkeypatch.setattr(router, "run_cached_tool", run_cached_tool)
+
+    async def run():
+        req = router.UserQuery(session_id="fanout-test", message=message)
+        return await router.answer(req, time.perf_counter(), router.fast_router.route(message))
+
+    body = asyncio.run(run())
+    assert prompts == [message]
+    assert sorted(called) == ["search", "weather"]
+    assert body["data"]["routed_by"] == "llm"
+    assert body["data"]["tool_used"] == ["weather", "search"]
+
+
+def test_semantic_reply_hit_honors_the_cached_reply_format(router, monkeypatch):
+    from semantic_cache import SemanticCache
+
+    semantic = SemanticCache({"enabled": True})
+    monkeypatch.setattr(router, "semantic_cache", semantic)
+
+    async def run():
+        cached = "capital of Sweden?"
+        semantic.add(
+            await semantic.embed(cached), cached,
+            {"tool": "search", "parameters": {"q": cached}, "reply_format": "markdown"}, "Stockholm",
+        )
+        req = router.UserQuery(session_id="semantic-test", message="what is the capital of Sweden")
+        return await router.answer(req, time.perf_counter(), None)
+
+    body = asyncio.run(run())
+    assert body["cached"] is True and body["data"]["routed_by"] == "semantic"
+    assert body["data"]["reply"] == "```\nStockholm\n```"
+
+
+def test_semantic_hit_on_a_fan_out_decision_goes_to_the_llm(router, monkeypatch):
+    from semantic_cache import SemanticCache
+
+    semantic = SemanticCache({"enabled": True})
+    monkeypatch.setattr(router, "semantic_cache", semantic)
+    routed = []
+
+    async def route_with_llm(msg, prompt):
+        routed.append(msg)
+        return {"tool": "chat", "parameters": None, "confidence": "high"}
+
+    async def handle_general_chat(session_id):
+        return "hi"
+
+    monkeypatch.setattr(router, "route_with_llm", route_with_llm)
+    monkeypatch.setattr(router, "handle_general_chat", handle_general_chat)
+
+    async def run():
+        cached = "Paris weather plus AI headlines"
+        semantic.add(await semantic.embed(cached), cached, {
+            "tool": "weather", "parameters": {"query": "weather in Paris"},
+            "tool_calls": [{"tool": "weather"}, {"tool": "search"}],
+        })
+        req = router.UserQuery(session_id="semantic-test", message="AI headlines plus Paris weather")
+        return await router.answer(req, time.perf_counter(), None)
+
+    asyncio.run(run())
+    assert routed == ["AI headlines plus Paris weather"]
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from semantic_cache import LocalEmbedder, SemanticCache, VectorIndex
+
+
+def embed(text: str):
+    return asyncio.run(LocalEmbedder().embed(text))
+
+
+def cache(**settings) -> SemanticCache:
+    return SemanticCache({"enabled": True, **settings})
+
+
+@pytest.mark.parametrize("first, second", [
+    ("weather in Paris?", "what's Paris weather"),
+    ("what is the capital of Sweden", "capital of Sweden?"),
+    ("who is the CEO of Google", "who is Google's CEO"),
+])
+def test_local_embedder_scores_paraphrases_above_the_default_threshold(first, second):
+    assert float(embed(first) @ embed(second)) >= SemanticCache().settings["threshold"]
+
+
+@pytest.mark.parametrize("first, second", [
+    ("weather in Paris?", "weather in London"),
+    ("capital of Sweden", "capital of Norway"),
+    ("price of bitcoin today", "price of ethereum today"),
+])
+def test_local_embedder_keeps_different_entities_apart(first, second):
+    assert float(embed(first) @ embed(second)) < 0.8
+
+
+def test_paraphrase_hits_and_unrelated_query_misses():
+    semantic = cache()
+    semantic.add(embed("weather in Paris?"), "weather in Paris?", {"tool": "weather"})
+
+    match = semantic.lookup(embed("what's Paris weather"))
+    assert match["tool_call"] == {"tool": "weather"} and match["similarity"] > 0.99
+    assert semantic.lookup(embed("weather in London")) is None
+    assert semantic.stats()["hits"] == 1 and semantic.stats()["misses"] == 1
+
+
+def test_replies_are_reused_only_above_reply_threshold_and_for_reply_tools():
+    semantic = cache(threshold=0.5, reply_threshold=0.95, reply_tools=["search"])
+    semantic.add(embed("capital of Sweden"), "capital of Sweden", {"tool": "search"}, "Stockholm")
+    semantic.add(embed("weather in Paris"), "weather in Paris", {"tool": "weather"}, "18C")
+
+    assert semantic.lookup(embed("what is the capital of Sweden?"))["reply"] == "Stockholm"
+    # Close enough to reuse the routing decision, not the reply
+    near = semantic.lookup(embed("capital city of Sweden"))
+    assert near is not None and near["similarity"] < 0.95 and near["reply"] is None
+    # Weather replies go stale: the decision is reused, the reply never
+    assert semantic.lookup(embed("Paris weather"))["reply"] is None
+    assert semantic.stats()["reply_hits"] == 1
+
+
+def test_least_recently_used_entries_are_evicted():
+    semantic = cache(max_entries=2)
+    for text in ("capital of Sweden", "weather in Paris"):
+        semantic.add(embed(text), text, {"tool": "search"})
+    semantic.lookup(embed("capital of Sweden"))  # now the most recently used
+    semantic.add(embed("latest AI news"), "latest AI news", {"tool": "search"})
+
+    assert semantic.stats()["size"] == 2 and semantic.stats()["evictions"] == 1
+    assert semantic.lookup(embed("weather in Paris")) is None
+    assert semantic.lookup(embed("capital of Sweden")) is not None
+
+
+def test_vector_index_removes_ids():
+    index = VectorIndex(512)
+    index.add(1, embed("capital of Sweden"))
+    index.add(2, embed("weather in Paris"))
+    index.remove(2)
+    assert index.nearest(embed("weather in Paris"))[0] == 1
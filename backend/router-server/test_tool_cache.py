@@ -0,0 +1,57 @@
+import asyncio
+
+import fakeredis
+
+from tool_cache import RedisBackend, ToolCache, make_cache_key
+
+
+def test_keys_ignore_case_spacing_and_trailing_punctuation():
+    assert make_cache_key("search", {"q": "Weather  in Paris?"}) == make_cache_key("search", {"q": "weather in paris"})
+    assert make_cache_key("search", {"q": "paris"}) != make_cache_key("weather", {"q": "paris"})
+
+
+def test_per_tool_ttls_and_uncacheable_replies():
+    async def run():
+        cache = ToolCache({"ttl": {"think": 0, "weather": 600}})
+        assert not cache.is_cacheable("think") and cache.ttl_for("weather") == 600
+
+        await cache.set("weather", {"query": "Paris"}, {"reply": {"temp": 20}})
+        assert await cache.get("weather", {"query": "paris"}) == {"reply": {"temp": 20}}
+
+        await cache.set("query", {"question": "q"}, {"reply": {"answer": "a", "cacheable": False}})
+        assert await cache.get("query", {"question": "q"}) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    asyncio.run(run())
+
+
+def test_invalidate_drops_only_the_sessions_entries():
+    async def run():
+        cache = ToolCache()
+        await cache.set("query", {"question": "q", "session_id": "a"}, {"reply": "for a"})
+        await cache.set("query", {"question": "q", "session_id": "b"}, {"reply": "for b"})
+        assert await cache.invalidate("query", session_id="a") == 1
+        assert await cache.get("query", {"question": "q", "session_id": "a"}) is None
+        assert await cache.get("query", {"question": "q", "session_id": "b"}) == {"reply": "for b"}
+
+    asyncio.run(run())
+
+
+def test_redis_stats_count_only_cache_keys_in_a_shared_database():
+    async def run():
+        backend = RedisBackend("redis://localhost:6379/0", max_ttl=60)
+        backend.client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+        async def info(section):  # not implemented by fakeredis; covers the whole database in Redis
+            return {"evicted_keys": 7, "expired_keys": 3}
+
+        backend.client.info = info
+        await backend.client.set("session:abc", "[]")  # e.g. the Redis session store
+        await backend.set(make_cache_key("search", {"q": "paris"}), {"reply": "r"}, 60)
+        stats = await backend.stats()
+        await backend.close()
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats["size"] == 1
+    assert (stats["db_evictions"], stats["db_expirations"]) == (7, 3)
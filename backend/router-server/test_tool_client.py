@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from tool_client import ToolBusyError, ToolClient
+
+URL = "http://tool-a:9000/run"
+
+
+def client_with(handler) -> ToolClient:
+    client = ToolClient({"search": URL}, registry_config={"open_seconds": 30.0})
+    replica = client.registry.replicas("search")[0]
+    replica.pool.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def half_open(client: ToolClient):
+    breaker = client.registry.replicas("search")[0].host.breaker
+    breaker.state = "open"
+    breaker.opened_at = time.monotonic() - breaker.open_seconds
+    assert breaker.available()
+    return breaker
+
+
+def test_half_open_trial_is_released_after_a_429():
+    async def run():
+        client = client_with(lambda request: httpx.Response(429, headers={"Retry-After": "1"}))
+        breaker = half_open(client)
+        with pytest.raises(ToolBusyError):
+            await client.call("search", {"query": "q"})
+        assert breaker.state == "half_open" and breaker.available()
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_half_open_trial_is_released_after_a_rejected_stream():
+    async def run():
+        client = client_with(lambda request: httpx.Response(422, json={"detail": "bad"}))
+        breaker = half_open(client)
+        with pytest.raises(httpx.HTTPStatusError):
+            async for _ in client.stream("search", {"query": "q"}):
+                pass
+        assert breaker.available()
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_half_open_trial_is_released_when_the_call_is_cancelled():
+    async def run():
+        never = asyncio.Event()
+
+        async def handler(request):
+            await never.wait()
+
+        client = client_with(handler)
+        breaker = half_open(client)
+        for call in (client.call("search", {"query": "q"}), client.stream("search", {"query": "q"}).__anext__()):
+            task = asyncio.create_task(call)
+            await asyncio.sleep(0.01)
+            assert not breaker.available()  # the trial is in flight
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert breaker.available()
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_successful_trial_closes_the_circuit():
+    async def run():
+        client = client_with(lambda request: httpx.Response(200, json={"ok": True}))
+        breaker = half_open(client)
+        assert await client.call("search", {"query": "q"}) == {"ok": True}
+        assert breaker.state == "closed" and not breaker.trial_in_flight
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_tools_on_one_url_share_a_pool_only_with_matching_limits():
+    async def run():
+        http_config = {"tools": {"rag": {"max_in_flight": 2}, "query": {"timeout": 60.0}}}
+        client = ToolClient({"rag": URL, "query": URL, "search": URL}, http_config)
+        rag, query, search = (client.registry.replicas(tool)[0] for tool in ("rag", "query", "search"))
+        assert rag.pool is not query.pool
+        assert query.pool is search.pool  # only the per-call timeout differs
+        assert rag.pool.settings["max_in_flight"] == 2 and query.pool.settings["max_in_flight"] == 32
+
+        # A reload that changes a tool's limits gives it a fresh pool
+        client.configure({"rag": URL, "query": URL, "search": URL}, {"tools": {"rag": {"max_in_flight": 4}}})
+        assert client.registry.replicas("rag")[0].pool.settings["max_in_flight"] == 4
+        assert rag.pool in client.registry._retired
+        await client.close()
+
+    asyncio.run(run())
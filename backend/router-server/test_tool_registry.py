@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from tool_registry import CircuitBreaker, ToolRegistry, ToolUnavailableError
+
+
+class FakePool:
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        self.waiting = 0
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def registry(**settings) -> ToolRegistry:
+    return ToolRegistry(lambda url, tool: FakePool(url), settings)
+
+
+def test_breaker_opens_then_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=2, open_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.available()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.available()
+
+    time.sleep(0.06)
+    assert breaker.available() and breaker.state == "half_open"
+    breaker.on_call()
+    assert not breaker.available()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_pick_prefers_the_least_loaded_replica_and_skips_open_circuits():
+    tools = registry(failure_threshold=1)
+    tools.configure({"search": ["http://a:1/search", "http://b:1/search"]})
+    a, b = tools.replicas("search")
+    a.pool.in_flight = 3
+    assert tools.pick("search") is b
+
+    b.host.breaker.record_failure()
+    assert tools.pick("search") is a
+    with pytest.raises(ToolUnavailableError):
+        tools.pick("search", exclude=[a.url])
+
+
+def test_sticky_tools_keep_a_session_on_one_host():
+    tools = registry()
+    tools.configure({"query": ["http://a:1/query", "http://b:1/query", "http://c:1/query"]})
+    picks = {tools.pick("query", affinity="session-1").url for _ in range(5)}
+    assert len(picks) == 1
+    sessions = {tools.pick("query", affinity=f"session-{i}").url for i in range(30)}
+    assert len(sessions) > 1
+
+
+def test_registrations_expire_and_removed_replicas_are_closed():
+    async def run():
+        tools = registry(registration_ttl=0.05, health_path="/health")
+        tools.register("search", "http://a:1/search")
+        replica = tools.replicas("search")[0]
+        await asyncio.sleep(0.06)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+        await tools.probe(client)
+        assert tools.tools() == [] and replica.pool.closed
+        await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_probe_marks_failing_hosts_unhealthy_but_keeps_them_as_a_last_resort():
+    async def run():
+        tools = registry()
+        tools.configure({"search": ["http://a:1/search", "http://b:1/search"]})
+
+        def handler(request):
+            return httpx.Response(503 if request.url.host == "a" else 200)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await tools.probe(client)
+        a, b = tools.replicas("search")
+        assert not a.host.healthy and b.host.healthy
+        assert tools.pick("search") is b
+        assert tools.pick("search", exclude=[b.url]) is a
+        await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_retired_pools_stay_open_until_their_calls_finish():
+    async def run():
+        tools = ToolRegistry(lambda url, tool: FakePool(url), pool_key=lambda url, tool: (url, limits[0]))
+        limits = [32]
+        tools.configure({"think": "http://a:1/think"})
+        old = tools.replicas("think")[0].pool
+        old.in_flight = 1  # e.g. a long NDJSON stream
+
+        limits[0] = 64  # a config reload changed the pool limits: the replica is re-keyed
+        tools.configure({"think": "http://a:1/think"})
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+        await tools.probe(client)
+        assert not old.closed and tools.replicas("think")[0].pool is not old
+
+        old.in_flight = 0
+        await tools.probe(client)
+        assert old.closed
+        await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_stats_do_not_create_pools():
+    created = []
+    tools = ToolRegistry(lambda url, tool: created.append(url) or FakePool(url))
+    tools.configure({"search": "http://a:1/search"})
+    assert tools.stats() == {"search": []}
+    assert created == []
+    tools.replicas("search")
+    assert [replica["url"] for replica in tools.stats()["search"]] == ["http://a:1/search"]
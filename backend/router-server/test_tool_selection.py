@@ -0,0 +1,57 @@
+from tool_selection import build_system_instruction, decision_schema, extract_json, validate_decision
+
+TOOLS = [
+    {"name": "chat", "description": "Casual conversation", "parameters": {"type": "object", "properties": {}}},
+    {"name": "search", "description": "Web search", "parameters": {
+        "type": "object", "properties": {"q": {"type": "string"}, "session_id": {"type": "string"}}, "required": ["q"],
+    }},
+    {"name": "weather", "description": "Current weather", "parameters": {
+        "type": "object", "properties": {"query": {"type": "string"}}, "required": ["query"],
+    }},
+]
+TOOLS_BY_NAME = {tool["name"]: tool for tool in TOOLS}
+
+
+def test_prompt_and_schema_leave_out_router_filled_parameters():
+    assert "session_id" not in build_system_instruction(TOOLS)
+    schema = decision_schema(TOOLS)
+    assert set(schema["properties"]["parameters"]["properties"]) == {"q", "query"}
+    assert schema["properties"]["tool"]["enum"] == ["chat", "search", "weather"]
+
+
+def test_extract_json_tolerates_fences_prose_and_trailing_commas():
+    assert extract_json('```json\n{"tool": "chat",}\n```') == {"tool": "chat"}
+    assert extract_json('Sure! {"tool": "search"} hope that helps') == {"tool": "search"}
+    assert extract_json("no json here") is None
+
+
+def test_valid_decision_is_returned_unchanged():
+    decision, errors, repaired = validate_decision(
+        '{"tool": "search", "parameters": {"q": "news"}, "confidence": "high"}', TOOLS_BY_NAME, "news"
+    )
+    assert decision["tool"] == "search" and decision["parameters"] == {"q": "news"}
+    assert errors == [] and not repaired
+
+
+def test_fixable_problems_are_repaired():
+    decision, errors, repaired = validate_decision(
+        '{"tool": "Weather", "parameters": {"city": "Paris"}, "confidence": "sure"}', TOOLS_BY_NAME, "weather in Paris"
+    )
+    assert decision["tool"] == "weather"
+    assert decision["parameters"] == {"query": "weather in Paris"}  # unknown param dropped, required one filled
+    assert decision["confidence"] == "low" and repaired and errors == []
+
+
+def test_unknown_tools_are_reported():
+    decision, errors, _ = validate_decision('{"tool": "email", "confidence": "high"}', TOOLS_BY_NAME, "mail bob")
+    assert decision is None and errors == ["unknown tool 'email'"]
+
+
+def test_tool_calls_keep_the_valid_calls():
+    decision, errors, repaired = validate_decision(
+        '{"tool": "search", "confidence": "high", "tool_calls": ['
+        '{"tool": "weather", "parameters": {"query": "Paris"}}, {"tool": "email"}]}',
+        TOOLS_BY_NAME, "weather in Paris and mail bob",
+    )
+    assert [call["tool"] for call in decision["tool_calls"]] == ["weather"]
+    assert repaired and errors == []
@@ -0,0 +1,229 @@
+# ✅ Tool result cache – LRU + per-tool TTL, in-memory or shared through Redis
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "toolcache"
+
+# === Defaults (overridable through the "cache" section of config.json) ===
+DEFAULT_CACHE_SETTINGS = {
+    "backend": "memory",             # "memory" or "redis"
+    "redis_url": "redis://redis:6379/0",
+    "max_entries": 1024,             # LRU bound for the memory backend
+    "default_ttl": 300,              # seconds, for tools without an explicit TTL
+    "max_ttl": 7 * 24 * 3600,        # cap for "never expires" entries stored in Redis
+    "ttl": {},                       # per-tool TTL: seconds, null = never expires, 0 = never cached
+}
+
+
+def normalize_params(params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Lower-case and collapse whitespace in string values so trivial variations share a key.
+    """
+    normalized = {}
+    for key, value in (params or {}).items():
+        if isinstance(value, str):
+            value = re.sub(r"\s+", " ", value).strip().lower().rstrip("?!.")
+        normalized[key] = value
+    return normalized
+
+
+def session_scope(session_id: Optional[str]) -> str:
+    """
+    Key segment grouping a session's entries (hashed, so any session id is safe in a key pattern).
+    """
+    if not session_id:
+        return "global"
+    return hashlib.sha256(str(session_id).encode()).hexdigest()[:16]
+
+
+def make_cache_key(tool_name: str, params: Optional[Dict[str, Any]]) -> str:
+    digest = hashlib.sha256(
+        json.dumps(normalize_params(params), sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f"{KEY_PREFIX}:{tool_name}:{session_scope((params or {}).get('session_id'))}:{digest}"
+
+
+class MemoryBackend:
+    """
+    Process-local LRU with per-entry expiry.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[float]):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete_prefix(self, prefix: str) -> int:
+        stale = [key for key in self._entries if key.startswith(prefix)]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    async def close(self):
+        pass
+
+
+class RedisBackend:
+    """
+    Shared cache for several router replicas; eviction is left to Redis' own expiry and LRU policy.
+    """
+
+    def __init__(self, url: str, max_ttl: int):
+        import redis.asyncio as aioredis  # only needed when the Redis backend is selected
+
+        self.client = aioredis.Redis.from_url(url, decode_responses=True)
+        self.max_ttl = max_ttl
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float]):
+        expiry = int(ttl) if ttl is not None else self.max_ttl
+        await self.client.set(key, json.dumps(value, default=str), ex=max(expiry, 1))
+
+    async def delete_prefix(self, prefix: str) -> int:
+        deleted = 0
+        async for key in self.client.scan_iter(match=f"{prefix}*", count=500):
+            deleted += await self.client.unlink(key)
+        return deleted
+
+    async def stats(self) -> Dict[str, Any]:
+        """
+        Size counts this cache's keys only (the database is shared, e.g. with the session store);
+        Redis only keeps eviction and expiry counters for the whole database, hence the db_ prefix.
+        """
+        size = 0
+        async for _ in self.client.scan_iter(match=f"{KEY_PREFIX}:*", count=500):
+            size += 1
+        info = await self.client.info("stats")
+        return {
+            "size": size,
+            "db_evictions": info.get("evicted_keys", 0),
+            "db_expirations": info.get("expired_keys", 0),
+        }
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class ToolCache:
+    """
+    Caches tool replies by tool name + normalized parameters.
+    Backend failures are logged and treated as misses so the cache never breaks /ask.
+    """
+
+    def __init__(self, cache_config: Optional[Dict[str, Any]] = None):
+        settings = {**DEFAULT_CACHE_SETTINGS, **(cache_config or {})}
+        settings["backend"] = os.getenv("TOOL_CACHE_BACKEND", settings["backend"])
+        settings["redis_url"] = os.getenv("REDIS_URL", settings["redis_url"])
+        self.settings = settings
+        self.ttls: Dict[str, Optional[float]] = settings["ttl"]
+
+        if settings["backend"] == "redis":
+            self.backend = RedisBackend(settings["redis_url"], settings["max_ttl"])
+        else:
+            self.backend = MemoryBackend(settings["max_entries"])
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def ttl_for(self, tool_name: str) -> Optional[float]:
+        return self.ttls.get(tool_name, self.settings["default_ttl"])
+
+    def is_cacheable(self, tool_name: str) -> bool:
+        return self.ttl_for(tool_name) != 0
+
+    async def get(self, tool_name: str, params: Optional[Dict[str, Any]]) -> Optional[Any]:
+        if not self.is_cacheable(tool_name):
+            return None
+        try:
+            value = await self.backend.get(make_cache_key(tool_name, params))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Tool cache read failed: {e}")
+            return None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, tool_name: str, params: Optional[Dict[str, Any]], value: Any):
+        if not self.is_cacheable(tool_name):
+            return
+        # Tool servers can mark a reply as not cacheable (e.g. RAG answers while uploads are indexing)
+        reply = value.get("reply") if isinstance(value, dict) else None
+        if isinstance(reply, dict) and reply.get("cacheable") is False:
+            return
+        try:
+            await self.backend.set(make_cache_key(tool_name, params), value, self.ttl_for(tool_name))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Tool cache write failed: {e}")
+
+    async def invalidate(self, tool_name: str, session_id: Optional[str] = None) -> int:
+        """
+        Drop cached replies for one tool (optionally only one session's), e.g. RAG answers after a new upload.
+        """
+        prefix = f"{KEY_PREFIX}:{tool_name}:"
+        if session_id:
+            prefix += f"{session_scope(session_id)}:"
+        return await self.backend.delete_prefix(prefix)
+
+    async def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        stats = {
+            "backend": self.settings["backend"],
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+        try:
+            stats.update(await self.backend.stats())
+        except Exception as e:
+            logger.warning(f"Tool cache stats failed: {e}")
+        return stats
+
+    async def close(self):
+        await self.backend.close()
@@ -0,0 +1,274 @@
+# ✅ Async tool dispatch – pooled keep-alive HTTP clients for the router, with failover across replicas
+
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+import httpx
+
+from common.telemetry import forward_request_id
+from tool_registry import Replica, ToolRegistry, ToolUnavailableError
+
+# === Defaults (overridable through the "http" section of config.json) ===
+DEFAULT_HTTP_SETTINGS = {
+    "timeout": 30.0,          # seconds for the whole tool call
+    "connect_timeout": 5.0,   # seconds to open a connection
+    "max_connections": 20,    # open sockets per endpoint
+    "max_keepalive": 10,      # idle sockets kept warm per endpoint
+    "max_in_flight": 32,      # concurrent requests per endpoint
+    "max_queue": 64,          # requests allowed to wait for a free slot
+}
+
+# Settings fixed when an EndpointPool is created (the call timeout is passed per request)
+POOL_SETTINGS = ("connect_timeout", "max_connections", "max_keepalive", "max_in_flight", "max_queue")
+
+
+class ToolBusyError(Exception):
+    """Raised when an endpoint's in-flight queue is full."""
+
+
+def busy_error(error: httpx.HTTPStatusError) -> ToolBusyError:
+    """
+    A 429 from a tool server: the replica is shedding load, not failing.
+    """
+    retry_after = error.response.headers.get("Retry-After")
+    hint = f", retry after {retry_after}s" if retry_after else ""
+    return ToolBusyError(f"{error.request.url} is busy{hint}")
+
+
+class EndpointPool:
+    """
+    One keep-alive connection pool plus a bounded in-flight queue for a single endpoint.
+    """
+
+    def __init__(self, url: str, settings: Dict[str, Any]):
+        self.url = url
+        self.settings = settings
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings["timeout"], connect=settings["connect_timeout"]),
+            limits=httpx.Limits(
+                max_connections=settings["max_connections"],
+                max_keepalive_connections=settings["max_keepalive"],
+            ),
+            event_hooks={"request": [forward_request_id]},  # the tool server logs the caller's request id
+        )
+        self._slots = asyncio.Semaphore(settings["max_in_flight"])
+        self.in_flight = 0
+        self.waiting = 0
+
+    async def _acquire(self):
+        if self.waiting >= self.settings["max_queue"]:
+            raise ToolBusyError(f"Too many queued requests for {self.url}")
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    async def post(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> httpx.Response:
+        await self._acquire()
+        try:
+            kwargs = {"timeout": timeout} if timeout is not None else {}
+            response = await self.client.post(self.url, json=payload, **kwargs)
+            response.raise_for_status()
+            return response
+        finally:
+            self._release()
+
+    async def post_form(self, data: Dict[str, Any], files: Dict[str, Any], timeout: Optional[float] = None) -> httpx.Response:
+        """
+        POST a multipart form (e.g. a file upload) through the same pool and in-flight limits.
+        """
+        await self._acquire()
+        try:
+            kwargs = {"timeout": timeout} if timeout is not None else {}
+            response = await self.client.post(self.url, data=data, files=files, **kwargs)
+            response.raise_for_status()
+            return response
+        finally:
+            self._release()
+
+    async def stream(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        POST the payload and yield each NDJSON event of the streamed response; the slot is held until it ends.
+        """
+        await self._acquire()
+        try:
+            kwargs = {"timeout": timeout} if timeout is not None else {}
+            async with self.client.stream("POST", self.url, json=payload, **kwargs) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.strip():
+                        yield json.loads(line)
+        finally:
+            self._release()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class ToolClient:
+    """
+    Dispatches tool calls to the tool's replicas through the ToolRegistry (one EndpointPool per
+    replica URL and pool limits: tools sharing a URL share a pool only if their limits match).
+    A replica that fails at the transport level, answers 5xx or has a full queue (ours, or its
+    own 429) is skipped and the call moves on to the next one.
+    """
+
+    def __init__(self, endpoints: Dict[str, Union[str, List[str]]], http_config: Optional[Dict[str, Any]] = None,
+                 registry_config: Optional[Dict[str, Any]] = None):
+        self.registry = ToolRegistry(self._new_pool, registry_config, pool_key=self._pool_key)
+        self.configure(endpoints, http_config)
+
+    def configure(self, endpoints: Dict[str, Union[str, List[str]]], http_config: Optional[Dict[str, Any]] = None):
+        """
+        (Re)load endpoints and HTTP settings. Timeouts apply to the next call; a replica whose pool
+        limits changed gets a new pool (the old one is closed on the next health probe).
+        """
+        http_config = http_config or {}
+        self.defaults = {**DEFAULT_HTTP_SETTINGS, **http_config.get("defaults", {})}
+        overrides = http_config.get("tools", {})
+        self.settings = {name: {**self.defaults, **overrides.get(name, {})} for name in set(endpoints) | set(overrides)}
+        self.registry.configure(endpoints)
+
+    def _settings(self, tool_name: str) -> Dict[str, Any]:
+        return self.settings.get(tool_name, self.defaults)
+
+    def _pool_key(self, url: str, tool_name: str) -> tuple:
+        settings = self._settings(tool_name)
+        return (url, *(settings[name] for name in POOL_SETTINGS))
+
+    def _new_pool(self, url: str, tool_name: str) -> EndpointPool:
+        return EndpointPool(url, self._settings(tool_name))
+
+    async def _attempts(self, tool_name: str, payload: Dict[str, Any]) -> AsyncIterator[Replica]:
+        """
+        Yield replicas to try in turn, at most failover_attempts of them; raises when none is left.
+        """
+        tried = []
+        while True:
+            try:
+                replica = self.registry.pick(tool_name, affinity=payload.get("session_id"), exclude=tried)
+            except ToolUnavailableError:
+                if not tried:
+                    raise
+                return
+            tried.append(replica.url)
+            yield replica
+            if len(tried) >= self.registry.settings["failover_attempts"]:
+                return
+
+    async def _send(self, tool_name: str, payload: Dict[str, Any], send) -> httpx.Response:
+        last_error: Optional[Exception] = None
+        async for replica in self._attempts(tool_name, payload):
+            started = time.perf_counter()
+            try:
+                response = await send(replica.pool)
+            except ToolBusyError as e:
+                last_error = e
+                continue
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 429:  # the replica's own queue is full
+                    last_error = busy_error(e)
+                    continue
+                server_error = e.response.status_code >= 500
+                replica.host.record((time.perf_counter() - started) * 1000, ok=not server_error)
+                if not server_error:
+                    raise  # the request itself was rejected; another replica would say the same
+                last_error = e
+                continue
+            except httpx.TransportError as e:
+                replica.host.record((time.perf_counter() - started) * 1000, ok=False)
+                last_error = e
+                continue
+            finally:
+                # A half-open host must not stay reserved for a trial that ended without a verdict
+                replica.host.breaker.release_trial()
+            replica.host.record((time.perf_counter() - started) * 1000, ok=True)
+            return response
+        raise last_error
+
+    async def call(self, tool_name: str, payload: Dict[str, Any]) -> Any:
+        """
+        POST the payload to one of the tool's replicas and return the decoded JSON body.
+        """
+        timeout = self._settings(tool_name)["timeout"]
+        response = await self._send(tool_name, payload, lambda pool: pool.post(payload, timeout=timeout))
+        return response.json()
+
+    async def upload(self, endpoint_name: str, data: Dict[str, Any], files: Dict[str, Any]) -> Any:
+        """
+        Forward a multipart upload to the named endpoint and return the decoded JSON body.
+        Not retried on another replica: the file stream has been consumed by then.
+        """
+        timeout = self._settings(endpoint_name)["timeout"]
+        replica = self.registry.pick(endpoint_name, affinity=data.get("session_id"))
+        started = time.perf_counter()
+        try:
+            response = await replica.pool.post_form(data, files, timeout=timeout)
+        except httpx.HTTPStatusError as e:
+            replica.host.record((time.perf_counter() - started) * 1000, ok=e.response.status_code < 500)
+            raise
+        except httpx.TransportError:
+            replica.host.record((time.perf_counter() - started) * 1000, ok=False)
+            raise
+        finally:
+            replica.host.breaker.release_trial()
+        replica.host.record((time.perf_counter() - started) * 1000, ok=True)
+        return response.json()
+
+    async def stream(self, tool_name: str, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        POST the payload with streaming enabled and yield the tool's NDJSON events.
+        Fails over to another replica only until the first event has been relayed.
+        """
+        timeout = self._settings(tool_name)["timeout"]
+        last_error: Optional[Exception] = None
+        async for replica in self._attempts(tool_name, payload):
+            started = time.perf_counter()
+            relayed = False
+            try:
+                async for event in replica.pool.stream({**payload, "stream": True}, timeout=timeout):
+                    if not relayed:
+                        # Time to first event is what the latency-weighted balancing compares
+                        replica.host.record((time.perf_counter() - started) * 1000, ok=True)
+                        relayed = True
+                    yield event
+                if not relayed:
+                    replica.host.record((time.perf_counter() - started) * 1000, ok=True)
+                return
+            except ToolBusyError as e:
+                last_error = e
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                if not relayed and isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429:
+                    last_error = busy_error(e)
+                    continue
+                server_error = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code >= 500
+                if relayed or not server_error:
+                    if server_error:
+                        replica.host.breaker.record_failure()
+                    raise
+                replica.host.record((time.perf_counter() - started) * 1000, ok=False)
+                last_error = e
+            finally:
+                replica.host.breaker.release_trial()
+        raise last_error
+
+    def start(self):
+        """
+        Start the periodic health probes (needs a running event loop).
+        """
+        self.registry.start()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.registry.stats()
+
+    async def close(self):
+        await self.registry.close()
@@ -0,0 +1,293 @@
+# ✅ Tool registry – replicas per tool, health probes, circuit breakers and load balancing
+#
+# Each tool maps to one or more replica URLs: from config.json (a URL or a list of URLs, re-read
+# when the file changes) and from tool servers that register themselves (POST /tools/register,
+# expiring without a heartbeat). Replicas on the same server (scheme://host:port) share a
+# Host: its health probe result, circuit breaker and latency estimate. Calls go to a healthy
+# replica whose circuit is not open: the least loaded one, or the one with the best
+# latency-weighted load; tools listed as sticky pick by session instead, because each RAG
+# replica keeps its own document index.
+
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Union
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# === Defaults (overridable through the "registry" section of config.json) ===
+DEFAULT_REGISTRY_SETTINGS = {
+    "balance": "least_loaded",     # "least_loaded" or "latency" (latency EWMA x in-flight)
+    "health_interval": 10.0,       # seconds between health probes
+    "health_timeout": 2.0,
+    "health_path": "/health",      # any response below 500 counts as up
+    "failure_threshold": 3,        # consecutive failures that open a host's circuit
+    "open_seconds": 30.0,          # an open circuit rejects calls this long, then allows one trial call
+    "reload_interval": 5.0,        # seconds between config.json change checks
+    "registration_ttl": 30.0,      # registered replicas expire without a heartbeat
+    "failover_attempts": 2,        # replicas tried per call before giving up
+    "sticky_tools": ["query", "rag", "upload"],  # same session -> same replica
+}
+
+# Weight of the newest sample in the latency estimate
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class ToolUnavailableError(Exception):
+    """Raised when a tool has no replica that is up and accepting calls."""
+
+
+def base_url(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class CircuitBreaker:
+    """
+    closed -> (failure_threshold consecutive failures) -> open -> (open_seconds) -> half_open,
+    where one trial call either closes the circuit again or re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def available(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = "half_open"
+        if self.state == "half_open":
+            return not self.trial_in_flight
+        return self.state == "closed"
+
+    def on_call(self):
+        if self.state == "half_open":
+            self.trial_in_flight = True
+
+    def release_trial(self):
+        """
+        End a trial call that finished without a verdict (429, rejected request, cancellation),
+        so the next call can be the trial instead.
+        """
+        self.trial_in_flight = False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class Host:
+    """
+    Shared state of one tool server (all replicas with the same scheme://host:port).
+    """
+
+    def __init__(self, url: str, settings: Dict[str, Any]):
+        self.url = url
+        self.breaker = CircuitBreaker(settings["failure_threshold"], settings["open_seconds"])
+        self.healthy = True  # until a probe says otherwise
+        self.latency_ms: Optional[float] = None
+
+    def record(self, latency_ms: float, ok: bool):
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        self.latency_ms = latency_ms if self.latency_ms is None else (
+            LATENCY_EWMA_ALPHA * latency_ms + (1 - LATENCY_EWMA_ALPHA) * self.latency_ms
+        )
+
+
+class Replica:
+    def __init__(self, url: str, pool, host: Host):
+        self.url = url
+        self.pool = pool
+        self.host = host
+
+    def accepting_calls(self) -> bool:
+        return self.host.breaker.available()
+
+    def load(self) -> int:
+        return self.pool.in_flight + self.pool.waiting
+
+
+class ToolRegistry:
+    def __init__(self, pool_factory, settings: Optional[Dict[str, Any]] = None, pool_key=None):
+        """
+        pool_factory(url, tool_name) builds the connection pool for a new replica URL;
+        pool_key(url, tool_name) says which tools on a URL can share one (by default all of them).
+        """
+        self.settings = {**DEFAULT_REGISTRY_SETTINGS, **(settings or {})}
+        self.pool_factory = pool_factory
+        self.pool_key = pool_key or (lambda url, tool: url)
+        self.configured: Dict[str, List[str]] = {}
+        self.registered: Dict[str, Dict[str, float]] = {}  # tool -> {url: expires_at}
+        self._replicas: Dict[Any, Replica] = {}  # pool_key -> replica
+        self._hosts: Dict[str, Host] = {}
+        self._retired: List[Any] = []  # pools of removed replicas, closed by a probe once idle
+        self._health_task: Optional[asyncio.Task] = None
+
+    # === Membership ===
+    def configure(self, endpoints: Dict[str, Union[str, List[str]]]):
+        """
+        Replace the configured replicas (config.json); registered ones are kept.
+        """
+        self.configured = {
+            tool: [urls] if isinstance(urls, str) else list(urls)
+            for tool, urls in endpoints.items() if urls
+        }
+        self._prune()
+
+    def register(self, tool: str, url: str) -> float:
+        expires_at = time.monotonic() + self.settings["registration_ttl"]
+        if url not in self.registered.setdefault(tool, {}):
+            logger.info(f"Registered {url} for tool '{tool}'")
+        self.registered[tool][url] = expires_at
+        return self.settings["registration_ttl"]
+
+    def deregister(self, tool: str, url: str) -> bool:
+        removed = self.registered.get(tool, {}).pop(url, None) is not None
+        self._prune()
+        return removed
+
+    def tools(self) -> List[str]:
+        return sorted(set(self.configured) | {tool for tool, urls in self.registered.items() if urls})
+
+    def urls(self, tool: str) -> List[str]:
+        now = time.monotonic()
+        registered = [url for url, expires_at in self.registered.get(tool, {}).items() if expires_at > now]
+        return list(dict.fromkeys(self.configured.get(tool, []) + registered))
+
+    def replicas(self, tool: str) -> List[Replica]:
+        replicas = []
+        for url in self.urls(tool):
+            key = self.pool_key(url, tool)
+            if key not in self._replicas:
+                host = self._hosts.setdefault(base_url(url), Host(base_url(url), self.settings))
+                self._replicas[key] = Replica(url, self.pool_factory(url, tool), host)
+            replicas.append(self._replicas[key])
+        return replicas
+
+    def _existing_replicas(self, tool: str) -> List[Replica]:
+        keys = [self.pool_key(url, tool) for url in self.urls(tool)]
+        return [self._replicas[key] for key in keys if key in self._replicas]
+
+    def _prune(self):
+        now = time.monotonic()
+        for urls in self.registered.values():
+            for url in [url for url, expires_at in urls.items() if expires_at <= now]:
+                del urls[url]
+        live = {url for tool in self.tools() for url in self.urls(tool)}
+        live_keys = {self.pool_key(url, tool) for tool in self.tools() for url in self.urls(tool)}
+        for key in [key for key in self._replicas if key not in live_keys]:
+            replica = self._replicas.pop(key)
+            logger.info(f"Removed replica {replica.url}")
+            self._retired.append(replica.pool)
+        live_hosts = {base_url(url) for url in live}
+        for host in [host for host in self._hosts if host not in live_hosts]:
+            del self._hosts[host]
+
+    # === Selection ===
+    def pick(self, tool: str, affinity: Optional[str] = None, exclude: Iterable[str] = ()) -> Replica:
+        replicas = self.replicas(tool)
+        if not replicas:
+            raise ToolUnavailableError(f"No endpoint is configured for tool '{tool}'")
+        candidates = [replica for replica in replicas if replica.url not in exclude and replica.accepting_calls()]
+        if not candidates:
+            raise ToolUnavailableError(f"Every endpoint for tool '{tool}' is failing ({len(replicas)} configured)")
+        # A failed probe may be stale (e.g. the router started first): with no host up, try the rest
+        candidates = [replica for replica in candidates if replica.host.healthy] or candidates
+
+        if affinity is not None and tool in self.settings["sticky_tools"]:
+            # Rendezvous hashing on the host: /query and /upload for a session land on the same server
+            replica = max(candidates, key=lambda r: hashlib.sha256(f"{affinity}|{r.host.url}".encode()).digest())
+        elif self.settings["balance"] == "latency":
+            replica = min(candidates, key=lambda r: (r.host.latency_ms or 0.0) * (r.load() + 1))
+        else:
+            replica = min(candidates, key=lambda r: (r.load(), r.host.latency_ms or 0.0))
+        replica.host.breaker.on_call()
+        return replica
+
+    # === Health probes ===
+    def start(self, client: Optional[httpx.AsyncClient] = None):
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._probe_forever(client))
+
+    async def _probe_forever(self, client: Optional[httpx.AsyncClient]):
+        client = client or httpx.AsyncClient(timeout=self.settings["health_timeout"])
+        try:
+            while True:
+                await self.probe(client)
+                await asyncio.sleep(self.settings["health_interval"])
+        finally:
+            await client.aclose()
+
+    async def probe(self, client: httpx.AsyncClient):
+        """
+        Probe every known host once; also expires stale registrations and closes retired pools
+        that no call (or stream) is still using.
+        """
+        self._prune()
+        for tool in self.tools():
+            self.replicas(tool)  # make sure every live URL has a host to probe
+
+        async def check(host: Host):
+            try:
+                response = await client.get(host.url + self.settings["health_path"])
+                up = response.status_code < 500
+            except httpx.HTTPError:
+                up = False
+            if up != host.healthy:
+                logger.warning(f"Tool host {host.url} is {'up' if up else 'down'}")
+            host.healthy = up
+
+        await asyncio.gather(*(check(host) for host in list(self._hosts.values())))
+        idle = [pool for pool in self._retired if pool.in_flight + pool.waiting == 0]
+        self._retired = [pool for pool in self._retired if pool.in_flight + pool.waiting > 0]
+        await asyncio.gather(*(pool.close() for pool in idle), return_exceptions=True)
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        pools = [replica.pool for replica in self._replicas.values()] + self._retired
+        await asyncio.gather(*(pool.close() for pool in pools), return_exceptions=True)
+        self._replicas.clear()
+        self._retired = []
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        State of the replicas that already exist (reading it never creates a pool or host).
+        """
+        return {
+            tool: [
+                {
+                    "url": replica.url,
+                    "healthy": replica.host.healthy,
+                    "circuit": replica.host.breaker.state,
+                    "in_flight": replica.pool.in_flight,
+                    "waiting": replica.pool.waiting,
+                    "latency_ms": round(replica.host.latency_ms, 1) if replica.host.latency_ms is not None else None,
+                    "registered": replica.url in self.registered.get(tool, {}),
+                }
+                for replica in self._existing_replicas(tool)
+            ]
+            for tool in self.tools()
+        }
@@ -0,0 +1,162 @@
+# ✅ Tool selection – precompiled router prompt, schema-constrained output, validation and repair
+#
+# The tool list is fixed while the router runs, so the instructions and tool block are built
+# once and sent as the routing model's system instruction; each request only adds the history
+# and the query. The model answers in JSON constrained by a response schema derived from the
+# tools' "parameters". Its output is still validated: fixable problems (code fences, stray text,
+# unknown or missing parameters) are repaired locally, the rest is reported so the caller can retry.
+
+import copy
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Filled in by the router itself, never chosen by the model
+ROUTER_FILLED_PARAMS = {"session_id"}
+
+# The chat tool takes the conversation, not parameters
+CHAT_TOOL = "chat"
+
+CONFIDENCE_LEVELS = ["high", "medium", "low"]
+REPLY_FORMATS = ["markdown", "text"]
+
+
+def model_params(tool: Dict[str, Any]) -> List[str]:
+    if tool["name"] == CHAT_TOOL:
+        return []
+    return [name for name in tool["parameters"]["properties"] if name not in ROUTER_FILLED_PARAMS]
+
+
+def build_system_instruction(tools: List[Dict[str, Any]]) -> str:
+    """
+    The static part of the router prompt: role, tool catalogue and answer rules.
+    """
+    tool_block = "\n\n".join(
+        f"Tool: {tool['name']}\nDescription: {tool['description']}\nParams: {', '.join(model_params(tool)) or 'none'}"
+        for tool in tools
+    )
+    return (
+        "You are an intelligent tool router for an AI system. "
+        "Pick the tool that best answers the user's latest query, given the conversation.\n\n"
+        f"Available tools:\n{tool_block}\n\n"
+        "Answer with the tool, its parameters (text parameters take the user's own wording), your confidence "
+        "(high, medium or low) and the reply format. If the query needs several independent tools at once "
+        "(e.g. weather plus a web search), list them in tool_calls instead."
+    )
+
+
+def build_request_prompt(user_query: str, history_text: str) -> str:
+    """
+    The per-request part of the router prompt.
+    """
+    return f"Conversation history:\n{history_text}\n\nUser query: \"{user_query}\""
+
+
+def decision_schema(tools: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Response schema for the routing decision (the OpenAPI subset Gemini accepts).
+    Parameters are the union of the tools' own; validate_decision checks them per tool.
+    """
+    properties = {}
+    for tool in tools:
+        for name in model_params(tool):
+            properties[name] = {"type": tool["parameters"]["properties"][name].get("type", "string")}
+    parameters = {"type": "object", "properties": properties, "nullable": True}
+    tool_name = {"type": "string", "format": "enum", "enum": [tool["name"] for tool in tools]}
+    return {
+        "type": "object",
+        "properties": {
+            "tool": copy.deepcopy(tool_name),
+            "parameters": copy.deepcopy(parameters),
+            "confidence": {"type": "string", "format": "enum", "enum": CONFIDENCE_LEVELS},
+            "reply_format": {"type": "string", "format": "enum", "enum": REPLY_FORMATS},
+            "tool_calls": {
+                "type": "array",
+                "nullable": True,
+                "items": {
+                    "type": "object",
+                    "properties": {"tool": copy.deepcopy(tool_name), "parameters": copy.deepcopy(parameters)},
+                    "required": ["tool"],
+                },
+            },
+        },
+        "required": ["tool", "confidence"],
+    }
+
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """
+    The JSON object in a model reply, tolerating code fences, surrounding prose and trailing commas.
+    """
+    text = re.sub(r"^```(?:json)?|```$", "", text.strip(), flags=re.IGNORECASE | re.MULTILINE).strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        return None
+    candidate = text[start:end + 1]
+    for attempt in (candidate, re.sub(r",\s*([}\]])", r"\1", candidate)):
+        try:
+            value = json.loads(attempt)
+        except ValueError:
+            continue
+        return value if isinstance(value, dict) else None
+    return None
+
+
+def repair_call(call: Dict[str, Any], tools_by_name: Dict[str, Dict[str, Any]], message: str) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    Validate one {"tool", "parameters"} call against its tool's schema and fix what can be fixed:
+    tool names are matched case-insensitively, unknown parameters dropped, values made strings,
+    and a missing required parameter takes the user's message.
+    """
+    name = str(call.get("tool") or "").strip().lower()
+    tool = tools_by_name.get(name)
+    if tool is None:
+        return None, [f"unknown tool '{call.get('tool')}'"]
+
+    raw = call.get("parameters")
+    raw = raw if isinstance(raw, dict) else {}
+    allowed = model_params(tool)
+    parameters = {key: value if isinstance(value, str) else json.dumps(value) for key, value in raw.items() if key in allowed}
+    for key in tool["parameters"].get("required", []):
+        if key in allowed and not str(parameters.get(key, "")).strip():
+            parameters[key] = message
+    return {**call, "tool": name, "parameters": parameters or None}, []
+
+
+def validate_decision(text: str, tools_by_name: Dict[str, Dict[str, Any]], message: str) -> Tuple[Optional[Dict[str, Any]], List[str], bool]:
+    """
+    Parse and validate a routing reply. Returns (decision, errors, repaired);
+    decision is None when the reply is unusable and errors say why.
+    """
+    decision = extract_json(text)
+    if decision is None:
+        return None, ["the reply is not a JSON object"], False
+    repaired = False
+    try:
+        repaired = json.loads(text) != decision
+    except ValueError:
+        repaired = True
+
+    if decision.get("confidence") not in CONFIDENCE_LEVELS:
+        decision["confidence"] = "low"
+        repaired = True
+
+    if decision.get("tool_calls"):
+        calls, errors = [], []
+        for call in decision["tool_calls"] if isinstance(decision["tool_calls"], list) else []:
+            fixed, call_errors = repair_call(call if isinstance(call, dict) else {}, tools_by_name, message)
+            errors.extend(call_errors)
+            if fixed is not None:
+                calls.append(fixed)
+                repaired = repaired or fixed != call
+        if calls:
+            return {**decision, "tool_calls": calls}, [], repaired or bool(errors)
+        if not decision.get("tool"):
+            return None, errors or ["tool_calls is empty"], False
+
+    fixed, errors = repair_call(decision, tools_by_name, message)
+    if fixed is None:
+        return None, errors, False
+    if fixed["tool"] == CHAT_TOOL:
+        fixed["parameters"] = None
+    return fixed, [], repaired or fixed != decision
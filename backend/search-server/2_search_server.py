@@ -1,62 +1,128 @@
 # # ✅ MCP Server 2 – DuckDuckGo Search + Gemini Flash 1.5
 
+import time
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from duckduckgo_search import DDGS
-import google.generativeai as genai  # Gemini SDK
-import os
+from typing import Optional
+import httpx
+from common.streaming import NDJSON_MEDIA_TYPE, elapsed_ms, gemini_text_chunks, ndjson_stream, single_event_stream
+from common.singleflight import SingleFlight, normalize_text
+from common.ttl_cache import TTLCache
+from common.gemini_client import get_gemini_client
+from common.telemetry import count_cache, install_telemetry, record_stage
+from common.registration import install_registration
+from grounding import gather_context, search_settings_from_env
+from search_backends import backend_from_env
 
 app = FastAPI()
+install_telemetry(app, "search")
+install_registration(app, {"search": "/search"})  # opt-in: ROUTER_URL + PUBLIC_URL
 
-# Set your Gemini API Key here (use environment variable ideally)
-genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+# Shared Gemini client (rate limit, concurrency, retries, deadlines)
+gemini = get_gemini_client()
+model = gemini.model("gemini-1.5-flash")
+
+# Search backend (SEARCH_BACKEND=fake runs offline) with a pooled client for page fetches
+search_settings = search_settings_from_env()
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(search_settings["fetch_deadline"]),
+    limits=httpx.Limits(max_connections=20),
+    headers={"User-Agent": "Mozilla/5.0 (compatible; GeminiRouterSearch/1.0)"},
+)
+search_backend = backend_from_env(http_client)
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await http_client.aclose()
+
+# Grounded answers reused for the same question (and options) until they expire
+answer_cache = TTLCache(search_settings["max_entries"], search_settings["cache_ttl"])
+cache_stats = {"hits": 0, "misses": 0}
+
+# Identical concurrent questions share one search + Gemini call; streamed answers are generated
+# per client, but share the search and page fetches (with each other and with plain requests)
+search_flights = SingleFlight()
+grounding_flights = SingleFlight()
 
 class Query(BaseModel):
     q: str
+    stream: bool = False
+    # Per-request overrides of the SEARCH_* settings
+    fetch_pages: Optional[bool] = None
+    max_results: Optional[int] = None
 
 @app.post("/search")
-def grounded_response(query: Query):
-    # Step 1: Get search results from DuckDuckGo
-    with DDGS() as ddgs:
-        raw_results = ddgs.text(query.q, max_results=5)
-
-    # Format sources for grounding
-    sources = []
-    context_chunks = []
-    for result in raw_results:
-        title = result.get("title", "")
-        snippet = result.get("body", "")
-        url = result.get("href", "")
-        context_chunks.append(f"{title}\n{snippet}\nSource: {url}")
-        sources.append(url)
-
-    # Prepare context for Gemini
-    context = "\n\n---\n\n".join(context_chunks)
+async def grounded_response(query: Query):
+    started = time.perf_counter()
+    overrides = {"fetch_pages": query.fetch_pages, "max_results": query.max_results}
+    settings = {**search_settings, **{key: value for key, value in overrides.items() if value is not None}}
+    cache_key = f"{normalize_text(query.q)}|{settings['fetch_pages']}|{settings['max_results']}"
+
+    cached = answer_cache.get(cache_key)
+    count_cache("answer", "miss" if cached is None else "hit")
+    if cached is not None:
+        cache_stats["hits"] += 1
+        result = {**cached[0], "cached": True}
+        if query.stream:
+            return StreamingResponse(single_event_stream(result, result["answer"], started), media_type=NDJSON_MEDIA_TYPE)
+        return result
+    cache_stats["misses"] += 1
+
+    if query.stream:
+        grounding = await ground(query.q, settings, cache_key)
+        generate_started = time.perf_counter()
+
+        def finish(answer):
+            result = build_result(query.q, answer, grounding, generate_started)
+            answer_cache.set(cache_key, result)
+            return result
+
+        return StreamingResponse(
+            ndjson_stream(stream_answer(grounding["prompt"]), finish, started), media_type=NDJSON_MEDIA_TYPE
+        )
+
+    return await search_flights.do(cache_key, lambda: answer_question(query.q, settings, cache_key))
+
+async def answer_question(question: str, settings: dict, cache_key: str):
+    # Step 1: Search (and read the top pages) for grounding context
+    grounding = await ground(question, settings, cache_key)
 
     # Step 2: Ask Gemini to generate a grounded answer
-    prompt = (
-        f"Based on the following search results, answer the question: \"{query.q}\".\n\n"
-        f"Use the information provided, and cite the sources in your response using the URLs.\n\n"
-        f"{context}"
-    )
+    generate_started = time.perf_counter()
+    response = await model.generate_content_async(grounding["prompt"])
 
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    response = model.generate_content(prompt)
+    result = build_result(question, response.text, grounding, generate_started)
+    answer_cache.set(cache_key, result)
+    return result
 
+async def ground(question: str, settings: dict, cache_key: str):
+    grounding = await grounding_flights.do(cache_key, lambda: gather_context(search_backend, question, settings))
+    for name, duration_ms in grounding["timings"].items():  # search_ms, fetch_ms -> search, fetch
+        record_stage(name[:-3], duration_ms)
+    return grounding
+
+def build_result(question: str, answer: str, grounding: dict, generate_started: float):
     return {
-        "question": query.q,
-        "answer": response.text,
-        "sources": sources
+        "question": question,
+        "answer": answer,
+        "sources": grounding["sources"],
+        "context_tokens": grounding["context_tokens"],
+        "pages": grounding["pages"],
+        "timings": {**grounding["timings"], "generate_ms": elapsed_ms(generate_started)},
     }
 
-class SearchRequest(BaseModel):
-    q: str
+async def stream_answer(prompt):
+    response = await model.generate_content_async(prompt, stream=True)
+    async for text in gemini_text_chunks(response):
+        yield text
 
-@app.post("/search")
-def search(req: SearchRequest):
-    # Simulate a search response
+@app.get("/stats")
+def search_stats():
     return {
-        "question": req.q,
-        "answer": f"Simulated search result for '{req.q}'",
-        "sources": ["https://example.com"]
+        "backend": search_backend.name,
+        "cache": {**cache_stats, "size": len(answer_cache)},
+        "coalescing": search_flights.stats(),
+        "grounding_coalescing": grounding_flights.stats(),
+        "gemini": gemini.stats(),
     }
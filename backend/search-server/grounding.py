@@ -0,0 +1,116 @@
+# ✅ Grounding – search, optional page fetching under a deadline, and token-budgeted context
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+from common.session_store import estimate_tokens
+from common.streaming import elapsed_ms
+
+logger = logging.getLogger(__name__)
+
+# === Defaults (overridable through SEARCH_* environment variables) ===
+DEFAULT_SEARCH_SETTINGS = {
+    "max_results": 5,        # search results used for grounding
+    "cache_ttl": 900,        # seconds a grounded answer is reused for the same question
+    "max_entries": 1024,     # answers kept in the cache
+    "fetch_pages": False,    # also fetch and read the top result pages (per-request override)
+    "pages_to_fetch": 3,     # top-N pages fetched concurrently
+    "fetch_deadline": 4.0,   # seconds for all page fetches together; slower pages are skipped
+    "context_tokens": 1500,  # budget for the search context in the Gemini prompt
+}
+
+
+def search_settings_from_env() -> Dict[str, Any]:
+    settings = dict(DEFAULT_SEARCH_SETTINGS)
+    for key, default in DEFAULT_SEARCH_SETTINGS.items():
+        value = os.getenv(f"SEARCH_{key.upper()}")
+        if value:
+            settings[key] = value.lower() in ("1", "true", "yes") if isinstance(default, bool) else type(default)(value)
+    return settings
+
+
+async def fetch_pages(backend, urls: List[str], deadline: float) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """
+    Fetch pages concurrently; whatever has not arrived by the deadline is cancelled and skipped.
+    Returns ({url: text}, {"fetched", "failed", "timed_out"}).
+    """
+    tasks = {asyncio.ensure_future(backend.fetch_page(url)): url for url in urls}
+    if not tasks:
+        return {}, {"fetched": 0, "failed": 0, "timed_out": 0}
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+
+    pages, failed = {}, 0
+    for task in done:
+        if task.exception() is not None:
+            failed += 1
+            logger.info(f"Skipping page {tasks[task]}: {task.exception()}")
+        elif task.result():
+            pages[tasks[task]] = task.result()
+    return pages, {"fetched": len(pages), "failed": failed, "timed_out": len(pending)}
+
+
+def trim_to_budget(text: str, max_tokens: int) -> str:
+    """
+    Cut text to roughly max_tokens (by the ~4 chars/token estimate), on a word boundary.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max_tokens * 4]
+    return cut[:cut.rfind(" ")] + " …" if " " in cut else cut
+
+
+def build_context(results: List[Dict[str, str]], pages: Dict[str, str], token_budget: int) -> str:
+    """
+    One block per source (fetched page text when available, else the snippet),
+    each trimmed to an equal share of the token budget.
+    """
+    if not results:
+        return ""
+    share = max(1, token_budget // len(results))
+    blocks = []
+    for result in results:
+        body = result["snippet"]
+        if pages.get(result["url"]):
+            body = f"{body}\n{pages[result['url']]}"
+        blocks.append(f"{result['title']}\n{trim_to_budget(body, share)}\nSource: {result['url']}")
+    return "\n\n---\n\n".join(blocks)
+
+
+def build_prompt(question: str, context: str) -> str:
+    return (
+        f"Based on the following search results, answer the question: \"{question}\".\n\n"
+        f"Use the information provided, and cite the sources in your response using the URLs.\n\n"
+        f"{context}"
+    )
+
+
+async def gather_context(backend, question: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run the search (and page fetches) for a question: returns sources, prompt and stage timings.
+    """
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    results = await backend.search(question, settings["max_results"])
+    timings["search_ms"] = elapsed_ms(started)
+
+    pages: Dict[str, str] = {}
+    page_stats = None
+    if settings["fetch_pages"]:
+        started = time.perf_counter()
+        urls = [result["url"] for result in results[:settings["pages_to_fetch"]] if result["url"]]
+        pages, page_stats = await fetch_pages(backend, urls, settings["fetch_deadline"])
+        timings["fetch_ms"] = elapsed_ms(started)
+
+    context = build_context(results, pages, settings["context_tokens"])
+    return {
+        "sources": [result["url"] for result in results],
+        "prompt": build_prompt(question, context),
+        "context_tokens": estimate_tokens(context) if context else 0,
+        "pages": page_stats,
+        "timings": timings,
+    }
@@ -0,0 +1,112 @@
+# ✅ Search backends – where grounding results and page text come from
+#
+#   duckduckgo   DuckDuckGo text search; result pages fetched over HTTP
+#   fake         deterministic offline results and pages (optional latency), for benchmarks
+#
+# A backend returns results as {"title", "snippet", "url"} dicts and can fetch a result page's text.
+
+import asyncio
+import hashlib
+import html
+import os
+import re
+from typing import Dict, List, Optional
+
+import httpx
+
+try:
+    from duckduckgo_search import DDGS
+except ImportError:  # only needed by the duckduckgo backend
+    DDGS = None
+
+SearchResult = Dict[str, str]
+
+
+def html_to_text(markup: str) -> str:
+    """
+    Visible text of an HTML page (scripts, styles and tags dropped, whitespace collapsed).
+    """
+    markup = re.sub(r"(?is)<(script|style|noscript|head|nav|footer)\b.*?</\1>", " ", markup)
+    text = html.unescape(re.sub(r"(?s)<[^>]+>", " ", markup))
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class DuckDuckGoBackend:
+    name = "duckduckgo"
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, max_page_bytes: int = 500_000):
+        self.client = client
+        self.max_page_bytes = max_page_bytes
+
+    async def search(self, query: str, max_results: int) -> List[SearchResult]:
+        def run():
+            with DDGS() as ddgs:
+                return ddgs.text(query, max_results=max_results)
+
+        # The DuckDuckGo client is blocking; keep it off the event loop
+        raw_results = await asyncio.to_thread(run)
+        return [
+            {"title": result.get("title", ""), "snippet": result.get("body", ""), "url": result.get("href", "")}
+            for result in raw_results or []
+        ]
+
+    async def fetch_page(self, url: str) -> str:
+        async with self.client.stream("GET", url, follow_redirects=True) as response:
+            response.raise_for_status()
+            if "html" not in response.headers.get("content-type", "html"):
+                return ""
+            body = b""
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) >= self.max_page_bytes:
+                    break
+        return html_to_text(body.decode(response.encoding or "utf-8", errors="ignore"))
+
+
+class FakeSearchBackend:
+    """
+    Offline backend: every query gets the same deterministic results and pages.
+    latency / page_latency (seconds) simulate the network so caching and deadlines can be measured.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0, page_latency: float = 0.0):
+        self.latency = latency
+        self.page_latency = page_latency
+        self.searches = 0
+        self.page_fetches = 0
+
+    async def search(self, query: str, max_results: int) -> List[SearchResult]:
+        self.searches += 1
+        await asyncio.sleep(self.latency)
+        slug = re.sub(r"\W+", "-", query.lower()).strip("-") or "query"
+        return [
+            {
+                "title": f"Result {i + 1} about {query}",
+                "snippet": f"Snippet {i + 1}: background on {query}, with figures and dates relevant to the question.",
+                "url": f"https://fake.search/{slug}/{i + 1}",
+            }
+            for i in range(max_results)
+        ]
+
+    async def fetch_page(self, url: str) -> str:
+        self.page_fetches += 1
+        # Pages get deterministic, varying latencies so some miss a tight deadline
+        seed = int(hashlib.md5(url.encode()).hexdigest(), 16)
+        await asyncio.sleep(self.page_latency * (0.5 + seed % 100 / 100))
+        return " ".join(f"Paragraph {n} of {url} discusses the topic in detail." for n in range(200))
+
+
+def backend_from_env(client: Optional[httpx.AsyncClient] = None):
+    """
+    Backend selected by SEARCH_BACKEND ("duckduckgo" or "fake").
+    """
+    if os.getenv("SEARCH_BACKEND", "duckduckgo").lower() == "fake":
+        return FakeSearchBackend(
+            latency=float(os.getenv("FAKE_SEARCH_LATENCY", "0")),
+            page_latency=float(os.getenv("FAKE_SEARCH_PAGE_LATENCY", "0")),
+        )
+    if DDGS is None:
+        raise RuntimeError("duckduckgo_search is not installed; set SEARCH_BACKEND=fake to run offline.")
+    return DuckDuckGoBackend(client)
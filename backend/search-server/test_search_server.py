@@ -0,0 +1,35 @@
+import asyncio
+import importlib
+import json
+
+import httpx
+import pytest
+
+from search_backends import FakeSearchBackend
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv("SEARCH_BACKEND", "fake")
+    monkeypatch.setenv("LLM_PROVIDER", "mock")
+    module = importlib.import_module("2_search_server")
+    monkeypatch.setattr(module, "search_backend", FakeSearchBackend(latency=0.05))
+    return module
+
+
+def test_identical_streamed_searches_share_one_search(server):
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            payload = {"q": "history of the transistor", "stream": True, "fetch_pages": False}
+            streamed = await asyncio.gather(*(client.post("/search", json=payload) for _ in range(3)))
+            plain = await client.post("/search", json={**payload, "q": "History of the transistor?", "stream": False})
+        return streamed, plain
+
+    streamed, plain = asyncio.run(run())
+    for response in streamed:
+        events = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+        assert events[-1]["type"] == "done"
+    assert server.search_backend.searches == 1
+    assert server.grounding_flights.stats()["coalesced"] == 2
+    assert plain.json()["cached"] is True  # the first finished stream filled the answer cache
@@ -1,21 +1,119 @@
 # ✅ MCP Server 3 – Deep Thinking / Agentic Reasoning using Gemini Flash 1.5
-from fastapi import FastAPI
+import asyncio
+import time
+from typing import Optional
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-import google.generativeai as genai  # updated import
-import os
+from common.gemini_client import get_gemini_client
+from common.telemetry import count_cache, count_error, install_telemetry
+from common.registration import install_registration
+from common.streaming import NDJSON_MEDIA_TYPE, gemini_text_chunks, ndjson_stream
+from think_jobs import QueueFullError, ThinkPool, task_key, think_settings_from_env
 
-# Correct way to configure the API key
-genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-
-model = genai.GenerativeModel("gemini-1.5-flash")
+# Shared Gemini client (rate limit, concurrency, retries, deadlines)
+gemini = get_gemini_client()
+MODEL_NAME = "gemini-1.5-flash"
+model = gemini.model(MODEL_NAME)
 
 app = FastAPI()
+install_telemetry(app, "think")
+install_registration(app, {"think": "/think"})  # opt-in: ROUTER_URL + PUBLIC_URL
 
 class ThinkRequest(BaseModel):
     task: str
+    stream: bool = False
+    background: bool = False          # answer 202 with a job id right away; poll /jobs/{job_id}
+    deadline: Optional[float] = None  # seconds; capped by THINK_DEADLINE
+
+SYSTEM_PROMPT = "You are an expert reasoning agent. Break down the task step-by-step."
+
+async def reason(task: str):
+    contents = [{"role": "user", "parts": [SYSTEM_PROMPT + "\n" + task]}]
+    response = await model.generate_content_async(contents, stream=True)
+    async for text in gemini_text_chunks(response):
+        yield text
+
+# Bounded worker pool + content-addressed result cache (settings from THINK_* variables)
+think_pool = ThinkPool(reason, think_settings_from_env())
+
+@app.on_event("startup")
+async def start_think_pool():
+    await think_pool.start()
+
+@app.on_event("shutdown")
+async def stop_think_pool():
+    await think_pool.stop()
+
+def busy_response(e: QueueFullError) -> JSONResponse:
+    count_error("queue_full")
+    return JSONResponse(
+        status_code=429,
+        headers={"Retry-After": str(int(e.retry_after + 0.999))},
+        content={"status": "error", "message": str(e), "details": {"queue_depth": think_pool.queue_depth()}},
+    )
+
+def job_stream(job, started: float, timeout: Optional[float] = None) -> StreamingResponse:
+    return StreamingResponse(
+        ndjson_stream(job.stream(timeout), lambda thoughts: {"thoughts": thoughts, "cached": job.cached}, started),
+        media_type=NDJSON_MEDIA_TYPE,
+    )
 
 @app.post("/think")
-def think(req: ThinkRequest):
-    system_prompt = "You are an expert reasoning agent. Break down the task step-by-step."
-    response = model.generate_content([{"role": "user", "parts": [system_prompt + "\n" + req.task]}])
-    return {"thoughts": response.text}
\ No newline at end of file
+async def think(req: ThinkRequest):
+    """
+    Reason about a task. By default waits for the thoughts (streamed with stream=true);
+    background=true returns a job id to poll at /jobs/{job_id} or stream at /jobs/{job_id}/stream.
+    """
+    started = time.perf_counter()
+    deadline = think_pool.deadline_for(req.deadline)
+    try:
+        job = think_pool.submit(req.task, task_key(req.task, MODEL_NAME, SYSTEM_PROMPT), deadline)
+    except QueueFullError as e:
+        return busy_response(e)
+    count_cache("thoughts", "hit" if job.cached else "miss")
+
+    if req.background:
+        return JSONResponse(status_code=202, content={
+            "status": job.status, "job_id": job.id, "result_url": f"/jobs/{job.id}"
+        })
+    # A joined job may have been submitted with a longer deadline than this request's
+    if req.stream:
+        return job_stream(job, started, deadline)
+
+    try:
+        await job.wait(deadline - (time.perf_counter() - started))
+    except asyncio.TimeoutError:
+        count_error("deadline")
+        return JSONResponse(status_code=504, content={
+            "status": "error", "message": "Reasoning failed.", "details": f"Deadline of {deadline:g}s exceeded."
+        })
+    if job.status == "failed":
+        return JSONResponse(status_code=504 if job.timed_out else 502, content={
+            "status": "error", "message": "Reasoning failed.", "details": job.error
+        })
+    return {"thoughts": job.thoughts, "cached": job.cached}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """
+    State of a reasoning job; "thoughts" is set once it is done.
+    """
+    job = think_pool.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/stream")
+def job_events(job_id: str):
+    """
+    The job's thoughts as NDJSON token events, from the beginning, then a done (or error) event.
+    """
+    job = think_pool.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    return job_stream(job, time.perf_counter())
+
+@app.get("/stats")
+def think_stats():
+    return {"jobs": think_pool.stats(), "gemini": gemini.stats()}
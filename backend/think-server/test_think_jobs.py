@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import pytest
+
+from think_jobs import ThinkPool, task_key
+
+
+def slow_reasoner(seconds: float):
+    async def reason(task: str):
+        yield f"thinking about {task}"
+        await asyncio.sleep(seconds)
+        yield "... done"
+    return reason
+
+
+def test_joining_caller_waits_no_longer_than_its_own_deadline():
+    async def run():
+        pool = ThinkPool(slow_reasoner(0.5), {"workers": 1, "deadline": 90.0})
+        await pool.start()
+        key = task_key("plan a trip")
+        first = pool.submit("plan a trip", key)
+        joined = pool.submit("plan a trip", key, deadline=0.05)
+        assert joined is first and pool.counters["joined"] == 1
+
+        started = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await joined.wait(0.05)
+        assert time.monotonic() - started < 0.3
+
+        # The shared job is unaffected and still finishes for the caller that started it
+        await first.wait(5.0)
+        assert first.status == "done" and first.thoughts.endswith("... done")
+        await pool.stop()
+
+    asyncio.run(run())
+
+
+def test_joining_stream_stops_at_its_deadline():
+    async def run():
+        pool = ThinkPool(slow_reasoner(0.5), {"workers": 1})
+        await pool.start()
+        job = pool.submit("plan a trip", task_key("plan a trip"))
+        received = []
+        with pytest.raises(asyncio.TimeoutError):
+            async for text in job.stream(0.05):
+                received.append(text)
+        assert received == ["thinking about plan a trip"]
+        await pool.stop()
+
+    asyncio.run(run())
+
+
+def test_deadline_is_capped_and_counts_queueing():
+    async def run():
+        pool = ThinkPool(slow_reasoner(0.2), {"workers": 1, "deadline": 0.1})
+        assert pool.deadline_for(None) == 0.1 and pool.deadline_for(60) == 0.1
+        await pool.start()
+        first = pool.submit("a", task_key("a"))
+        queued = pool.submit("b", task_key("b"))
+        await asyncio.gather(first.wait(), queued.wait())
+        assert first.timed_out and queued.timed_out
+        assert "while queued" in queued.error
+        await pool.stop()
+
+    asyncio.run(run())
+
+
+def test_finished_task_is_answered_from_the_cache():
+    async def run():
+        pool = ThinkPool(slow_reasoner(0.0), {"workers": 1})
+        await pool.start()
+        await pool.submit("Plan a trip", task_key("Plan a trip")).wait()
+        again = pool.submit("plan  a trip", task_key("plan  a trip"))
+        assert again.cached and again.status == "done"
+        await pool.stop()
+
+    asyncio.run(run())
+
+
+def test_task_raising_an_exception_without_a_message_fails():
+    async def failing(task: str):
+        raise Exception()
+        yield  # an async generator, like every reasoner
+
+    async def run():
+        pool = ThinkPool(failing, {"workers": 1})
+        await pool.start()
+        job = await pool.submit("explain entropy", task_key("explain entropy")).wait(1.0)
+        await pool.stop()
+        return job, pool
+
+    job, pool = asyncio.run(run())
+    assert job.status == "failed" and job.error == "Exception()"
+    assert job.thoughts is None and pool.counters["failed"] == 1
+    assert len(pool.cache) == 0
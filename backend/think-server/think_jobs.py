@@ -0,0 +1,284 @@
+# ✅ Reasoning jobs – bounded worker pool, content-addressed result cache and per-task deadlines
+#
+# Every /think task becomes a job on a bounded queue served by a fixed number of workers, so
+# long reasoning tasks cannot take every connection; when the queue is full, submit() raises
+# QueueFullError with a Retry-After estimate. Jobs are keyed by a hash of the model, prompt
+# and normalized task: a finished key is answered from the cache, and a key already queued or
+# running is joined instead of computed twice. A job's deadline counts from submission,
+# so time spent queued is part of it; a caller joining a job still waits no longer than its
+# own deadline (the job keeps running for the others).
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from common.singleflight import normalize_text
+from common.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# === Defaults (overridable through THINK_* environment variables) ===
+DEFAULT_THINK_SETTINGS = {
+    "workers": 4,              # tasks reasoned about concurrently
+    "max_queue": 32,           # queued tasks before /think answers 429
+    "deadline": 90.0,          # seconds per task, queueing included (requests may ask for less)
+    "cache_ttl": 3600.0,       # seconds a result is reused for the same task
+    "max_entries": 512,        # cached results (least recently used evicted first)
+    "max_jobs_kept": 1000,     # finished jobs remembered for /jobs
+    "retry_after": 5.0,        # Retry-After (seconds) before any task has finished
+}
+
+# Generates the thoughts for a task, yielding text chunks as they arrive
+Reasoner = Callable[[str], AsyncIterator[str]]
+
+
+def think_settings_from_env() -> Dict[str, Any]:
+    settings = dict(DEFAULT_THINK_SETTINGS)
+    for key, default in DEFAULT_THINK_SETTINGS.items():
+        value = os.getenv(f"THINK_{key.upper()}")
+        if value:
+            settings[key] = type(default)(value)
+    return settings
+
+
+def task_key(task: str, *context: str) -> str:
+    """
+    Content address of a task: the same question (modulo case and spacing) under the same
+    model and prompt maps to the same key.
+    """
+    return hashlib.sha256("\n".join([*context, normalize_text(task)]).encode()).hexdigest()
+
+
+class QueueFullError(Exception):
+    """Raised when the reasoning queue cannot take another task."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ThinkJob:
+    def __init__(self, task: str, key: str, deadline: float):
+        self.id = uuid.uuid4().hex
+        self.task = task
+        self.key = key
+        self.deadline = deadline
+        self.status = "queued"
+        self.cached = False
+        self.timed_out = False
+        self.chunks: List[str] = []
+        self.thoughts: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def add_chunk(self, text: str):
+        self.chunks.append(text)
+        self._notify()
+
+    def finish(self, thoughts: Optional[str] = None, error: Optional[str] = None):
+        self.status = "failed" if error is not None else "done"
+        self.thoughts = thoughts
+        self.error = error
+        self.finished = time.time()
+        self._notify()
+
+    async def wait(self, timeout: Optional[float] = None) -> "ThinkJob":
+        """
+        Wait for the job to finish; raises asyncio.TimeoutError after timeout seconds.
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while not self.done:
+            await self._wait_changed(self._changed, end)
+        return self
+
+    async def stream(self, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Yield the thoughts as they are produced (from the start, whenever the caller joins);
+        raises RuntimeError if the job fails, asyncio.TimeoutError after timeout seconds.
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self.chunks):
+                yield self.chunks[sent]
+                sent += 1
+            if self.done:
+                break
+            await self._wait_changed(changed, end)
+        if self.status == "failed":
+            raise RuntimeError(self.error)
+
+    async def _wait_changed(self, changed: asyncio.Event, end: Optional[float]):
+        if end is None:
+            await changed.wait()
+            return
+        try:
+            await asyncio.wait_for(changed.wait(), timeout=max(0.0, end - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"Deadline exceeded waiting for reasoning job {self.id}.") from None
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started is not None:
+            elapsed = (self.finished or time.time()) - self.started
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "cached": self.cached,
+            "thoughts": self.thoughts,
+            "error": self.error,
+            "queued_sec": round((self.started or self.finished or time.time()) - self.created, 2),
+            "elapsed_sec": round(elapsed, 2) if elapsed is not None else None,
+        }
+
+
+class ThinkPool:
+    """
+    Bounded queue + worker tasks running a Reasoner, with the result cache in front of it.
+    """
+
+    def __init__(self, reasoner: Reasoner, settings: Optional[Dict[str, Any]] = None):
+        self.reasoner = reasoner
+        self.settings = {**DEFAULT_THINK_SETTINGS, **(settings or {})}
+        self.cache = TTLCache(self.settings["max_entries"], self.settings["cache_ttl"])
+        self.jobs: Dict[str, ThinkJob] = {}
+        self._active: Dict[str, ThinkJob] = {}  # key -> queued or running job
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._durations: List[float] = []  # recent task durations, for Retry-After
+        self.counters = {"submitted": 0, "cache_hits": 0, "joined": 0, "rejected": 0, "timeouts": 0, "failed": 0}
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.settings["max_queue"])
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.settings["workers"])]
+
+    async def stop(self):
+        # wait_for() can swallow a cancellation that lands just as a job finishes: repeat until they exit
+        while self._workers:
+            for worker in self._workers:
+                worker.cancel()
+            done, pending = await asyncio.wait(self._workers, timeout=0.1)
+            self._workers = list(pending)
+
+    def submit(self, task: str, key: str, deadline: Optional[float] = None) -> ThinkJob:
+        """
+        A job for the task: already done on a cache hit, shared with an identical job in progress,
+        or newly queued. Raises QueueFullError when the queue is full.
+        """
+        self.counters["submitted"] += 1
+        deadline = self.deadline_for(deadline)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.counters["cache_hits"] += 1
+            job = ThinkJob(task, key, deadline)
+            job.cached = True
+            job.chunks = [cached[0]]
+            job.finish(thoughts=cached[0])
+            return self._remember(job)
+
+        active = self._active.get(key)
+        if active is not None:
+            self.counters["joined"] += 1
+            return active
+
+        job = ThinkJob(task, key, deadline)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            raise QueueFullError("Too many reasoning tasks queued, please retry later.", self.retry_after())
+        self._active[key] = job
+        return self._remember(job)
+
+    def deadline_for(self, requested: Optional[float]) -> float:
+        """
+        The deadline a request gets: what it asked for, capped by the configured one.
+        """
+        return min(requested or self.settings["deadline"], self.settings["deadline"])
+
+    def get(self, job_id: str) -> Optional[ThinkJob]:
+        return self.jobs.get(job_id)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def retry_after(self) -> float:
+        """
+        Seconds until a queue slot is likely to free up: one average task per worker ahead.
+        """
+        if not self._durations:
+            return self.settings["retry_after"]
+        average = sum(self._durations) / len(self._durations)
+        return max(1.0, round(average * max(1, self.queue_depth()) / self.settings["workers"], 1))
+
+    def _remember(self, job: ThinkJob) -> ThinkJob:
+        self.jobs[job.id] = job
+        finished = [old for old in self.jobs.values() if old.done]
+        for old in finished[:max(0, len(self.jobs) - self.settings["max_jobs_kept"])]:
+            del self.jobs[old.id]
+        return job
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._active.pop(job.key, None)
+                self._queue.task_done()
+
+    async def _run(self, job: ThinkJob):
+        remaining = job.deadline - (time.time() - job.created)
+        if remaining <= 0:
+            self.counters["timeouts"] += 1
+            job.timed_out = True
+            job.finish(error=f"Deadline of {job.deadline:g}s exceeded while queued.")
+            return
+
+        job.status = "running"
+        job.started = time.time()
+        try:
+            await asyncio.wait_for(self._reason(job), timeout=remaining)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            job.timed_out = True
+            job.finish(error=f"Deadline of {job.deadline:g}s exceeded.")
+        except Exception as e:
+            logger.error(f"Reasoning job {job.id} failed: {e!r}")
+            self.counters["failed"] += 1
+            job.finish(error=str(e) or repr(e))  # an exception without a message still fails the job
+
+    async def _reason(self, job: ThinkJob):
+        async for text in self.reasoner(job.task):
+            job.add_chunk(text)
+        thoughts = "".join(job.chunks)
+        self.cache.set(job.key, thoughts)
+        job.finish(thoughts=thoughts)
+        self._durations = (self._durations + [job.finished - job.started])[-50:]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "queue_depth": self.queue_depth(),
+            "running": sum(1 for job in self._active.values() if job.status == "running"),
+            "workers": self.settings["workers"],
+            "cache_size": len(self.cache),
+            "retry_after": self.retry_after(),
+        }
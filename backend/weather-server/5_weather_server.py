@@ -1,9 +1,17 @@
+import asyncio
 import os
-import requests
+import httpx
 from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel
+from typing import List
 import logging
+from weather_client import LocationNotFound, OpenWeatherClient, weather_settings_from_env
+from common.telemetry import count_cache, count_error, install_telemetry, stage
+from common.registration import install_registration
 
 app = FastAPI()
+install_telemetry(app, "weather")
+install_registration(app, {"weather": "/query-weather"})  # opt-in: ROUTER_URL + PUBLIC_URL
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -11,7 +19,19 @@ logger = logging.getLogger(__name__)
 
 # Load OpenWeather API key
 OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY', '6b0b649e44a49690efe1b52931cd09d6')
-OPENWEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+# Pooled async OpenWeather client with geocode + weather caches
+# (WEATHER_API_ROOT points it at fake_openweather.py for offline runs)
+weather_settings = weather_settings_from_env()
+weather_client = OpenWeatherClient(OPENWEATHER_API_KEY, weather_settings)
+
+@app.on_event("startup")
+async def start_weather_client():
+    await weather_client.start()
+
+@app.on_event("shutdown")
+async def close_weather_client():
+    await weather_client.close()
 
 @app.post("/query-weather")
 async def query_weather(request: Request):
@@ -40,23 +60,60 @@ async def query_weather(request: Request):
     logger.info(f"Extracted location: {location}")
     
     # Fetch and format weather data
+    weather_data, cache_status = await fetch_weather(location)
+    return {"response": format_weather_response(weather_data), "cache": cache_status}
+
+class BulkWeatherQuery(BaseModel):
+    queries: List[str]
+
+@app.post("/query-weather/bulk")
+async def query_weather_bulk(req: BulkWeatherQuery):
+    """
+    Weather for several locations in one request, fetched concurrently.
+    Each result carries its own "response" or "error", so one bad location does not fail the rest.
+    """
+    if len(req.queries) > weather_settings["max_bulk"]:
+        raise HTTPException(status_code=400, detail=f"At most {weather_settings['max_bulk']} locations per request.")
+
+    async def one(query: str):
+        location = extract_location_from_query(query)
+        if not location:
+            return {"query": query, "error": "Could not extract location from the query."}
+        try:
+            weather_data, cache_status = await fetch_weather(location)
+        except HTTPException as e:
+            return {"query": query, "location": location, "error": e.detail}
+        return {"query": query, "location": location, "response": format_weather_response(weather_data), "cache": cache_status}
+
+    return {"results": await asyncio.gather(*(one(query) for query in req.queries))}
+
+@app.get("/stats")
+def weather_stats():
+    return weather_client.stats()
+
+async def fetch_weather(location):
+    """
+    Current weather for a location through the cached client, with upstream errors mapped to HTTP errors.
+    """
     try:
-        response = requests.get(OPENWEATHER_BASE_URL, params={
-            "q": location,
-            "appid": OPENWEATHER_API_KEY,
-            "units": "metric"
-        })
-        response.raise_for_status()
-        weather_data = response.json()
-        formatted_response = format_weather_response(weather_data)
-    except requests.exceptions.HTTPError as http_err:
+        with stage("weather_lookup"):
+            weather_data, cache_status = await weather_client.current(location)
+        count_cache("weather", cache_status)
+        return weather_data, cache_status
+    except LocationNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except httpx.TimeoutException as e:
+        logger.error(f"OpenWeather timed out: {e}")
+        count_error("upstream_timeout")
+        raise HTTPException(status_code=504, detail="OpenWeather API timed out.")
+    except httpx.HTTPStatusError as http_err:
         logger.error(f"HTTP error occurred: {http_err}")
+        count_error("upstream_http")
         raise HTTPException(status_code=500, detail="Failed to fetch weather data from OpenWeather API.")
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
+        count_error("unexpected")
         raise HTTPException(status_code=500, detail="An unexpected error occurred while processing the request.")
-    
-    return {"response": formatted_response}
 
 def format_weather_response(weather_data):
     """
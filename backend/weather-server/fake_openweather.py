@@ -0,0 +1,68 @@
+# ✅ Fake OpenWeather – offline stand-in for the geocoding and current-weather APIs
+#
+#   uvicorn fake_openweather:app --port 8099
+#   WEATHER_API_ROOT=http://localhost:8099 uvicorn 5_weather_server:app --port 8005
+#
+# Readings are deterministic per place; FAKE_OPENWEATHER_LATENCY (seconds) adds a delay to
+# every call so caching and coalescing can be measured. GET /fake/stats counts upstream calls.
+
+import asyncio
+import hashlib
+import os
+
+from fastapi import FastAPI, HTTPException
+
+app = FastAPI()
+
+LATENCY = float(os.getenv("FAKE_OPENWEATHER_LATENCY", "0"))
+
+# name -> (canonical name, country, lat, lon)
+PLACES = {
+    "kolkata": ("Kolkata", "IN", 22.5726, 88.3639),
+    "delhi": ("Delhi", "IN", 28.6517, 77.2219),
+    "mumbai": ("Mumbai", "IN", 19.0760, 72.8777),
+    "london": ("London", "GB", 51.5073, -0.1276),
+    "paris": ("Paris", "FR", 48.8589, 2.3200),
+    "new york": ("New York", "US", 40.7127, -74.0059),
+    "tokyo": ("Tokyo", "JP", 35.6828, 139.7595),
+    "sydney": ("Sydney", "AU", -33.8698, 151.2082),
+}
+DESCRIPTIONS = ["clear sky", "few clouds", "scattered clouds", "light rain", "mist", "overcast clouds"]
+
+calls = {"geocode": 0, "weather": 0}
+
+
+@app.get("/geo/1.0/direct")
+async def geocode(q: str, limit: int = 1, appid: str = ""):
+    calls["geocode"] += 1
+    await asyncio.sleep(LATENCY)
+    place = PLACES.get(q.split(",")[0].strip().lower())
+    if place is None:
+        return []
+    name, country, lat, lon = place
+    return [{"name": name, "country": country, "lat": lat, "lon": lon}][:limit]
+
+
+@app.get("/data/2.5/weather")
+async def weather(lat: float, lon: float, units: str = "metric", appid: str = ""):
+    calls["weather"] += 1
+    await asyncio.sleep(LATENCY)
+    seed = int(hashlib.md5(f"{lat:.2f},{lon:.2f}".encode()).hexdigest(), 16)
+    for name, country, place_lat, place_lon in PLACES.values():
+        if abs(place_lat - lat) < 0.01 and abs(place_lon - lon) < 0.01:
+            break
+    else:
+        raise HTTPException(status_code=404, detail="city not found")
+    temp = round(-5 + seed % 400 / 10, 1)
+    return {
+        "name": name,
+        "sys": {"country": country},
+        "coord": {"lat": lat, "lon": lon},
+        "weather": [{"description": DESCRIPTIONS[seed % len(DESCRIPTIONS)]}],
+        "main": {"temp": temp, "feels_like": round(temp - 1.5, 1), "humidity": 30 + seed % 60},
+    }
+
+
+@app.get("/fake/stats")
+def fake_stats():
+    return calls
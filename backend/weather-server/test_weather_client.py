@@ -0,0 +1,59 @@
+import asyncio
+
+import httpx
+import pytest
+
+import fake_openweather
+from weather_client import LocationNotFound, OpenWeatherClient, weather_settings_from_env
+
+
+def client_for_fake(**settings) -> OpenWeatherClient:
+    client = OpenWeatherClient("test-key", settings)
+    client.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_openweather.app), base_url="http://fake")
+    return client
+
+
+def test_geocode_and_weather_are_cached_per_canonical_place():
+    async def run():
+        client = client_for_fake()
+        _, first = await client.current("Kolkata")
+        data, second = await client.current("kolkata, in")
+        assert (first, second) == ("miss", "hit")
+        assert data["name"] == "Kolkata"
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_unknown_locations_are_negatively_cached():
+    async def run():
+        client = client_for_fake(not_found_ttl=60)
+        for _ in range(3):
+            with pytest.raises(LocationNotFound):
+                await client.geocode("Atlantis")
+        assert client.counters["upstream_calls"] == 1
+        assert client.counters["geocode_misses"] == 1
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_negative_cache_entries_expire():
+    async def run():
+        client = client_for_fake(not_found_ttl=0.05)
+        with pytest.raises(LocationNotFound):
+            await client.geocode("Atlantis")
+        await asyncio.sleep(0.1)
+        with pytest.raises(LocationNotFound):
+            await client.geocode("Atlantis")
+        assert client.counters["upstream_calls"] == 2
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_ttl_settings_accept_fractional_seconds(monkeypatch):
+    monkeypatch.setenv("WEATHER_NOT_FOUND_TTL", "0.5")
+    monkeypatch.setenv("WEATHER_TTL", "90")
+    settings = weather_settings_from_env()
+    assert settings["not_found_ttl"] == 0.5 and settings["ttl"] == 90.0
@@ -0,0 +1,157 @@
+# ✅ OpenWeather client – pooled async HTTP, geocode cache, TTL cache with stale-while-revalidate
+#
+# A location string is first resolved to a canonical place (name, country, lat/lon) through
+# OpenWeather's geocoding API; weather is then cached per canonical place, so "Kolkata"
+# and "kolkata, in" share one cache entry once geocoded.
+#
+# Cache entries are fresh for `ttl` seconds. Until `stale_ttl` they are still served
+# immediately while a background refresh fetches new data; after that they are refetched inline.
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from common.singleflight import SingleFlight, normalize_text
+from common.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# === Defaults (overridable through WEATHER_* environment variables) ===
+DEFAULT_WEATHER_SETTINGS = {
+    "api_root": "https://api.openweathermap.org",  # point at a fake server to run offline
+    "timeout": 5.0,            # seconds per OpenWeather call
+    "connect_timeout": 2.0,
+    "max_connections": 20,
+    "ttl": 600.0,              # seconds a weather reading is fresh
+    "stale_ttl": 3600.0,       # seconds a reading may be served while refreshing in the background
+    "geocode_ttl": 7 * 86400.0,  # place names rarely move
+    "not_found_ttl": 300.0,    # seconds an unknown location is answered without asking the geocoder
+    "max_entries": 2048,       # per cache
+    "max_bulk": 20,            # locations accepted by one bulk request
+}
+
+
+def weather_settings_from_env() -> Dict[str, Any]:
+    settings = dict(DEFAULT_WEATHER_SETTINGS)
+    for key, default in DEFAULT_WEATHER_SETTINGS.items():
+        value = os.getenv(f"WEATHER_{key.upper()}")
+        if value:
+            settings[key] = type(default)(value)
+    return settings
+
+
+class LocationNotFound(Exception):
+    """Raised when the geocoder has no match for a location."""
+
+
+class OpenWeatherClient:
+    def __init__(self, api_key: str, settings: Optional[Dict[str, Any]] = None):
+        self.api_key = api_key
+        self.settings = {**DEFAULT_WEATHER_SETTINGS, **(settings or {})}
+        self.client: Optional[httpx.AsyncClient] = None
+        self.weather_cache = TTLCache(self.settings["max_entries"], self.settings["stale_ttl"])
+        self.geocode_cache = TTLCache(self.settings["max_entries"], self.settings["geocode_ttl"])
+        self.not_found_cache = TTLCache(self.settings["max_entries"], self.settings["not_found_ttl"])
+        self.flights = SingleFlight()
+        self._refreshes = set()
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0, "geocode_hits": 0, "geocode_misses": 0, "upstream_calls": 0}
+
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            base_url=self.settings["api_root"],
+            timeout=httpx.Timeout(self.settings["timeout"], connect=self.settings["connect_timeout"]),
+            limits=httpx.Limits(max_connections=self.settings["max_connections"]),
+        )
+
+    async def close(self):
+        for task in list(self._refreshes):
+            task.cancel()
+        if self.client is not None:
+            await self.client.aclose()
+
+    async def _get(self, path: str, params: Dict[str, Any]) -> Any:
+        self.counters["upstream_calls"] += 1
+        response = await self.client.get(path, params={**params, "appid": self.api_key})
+        response.raise_for_status()
+        return response.json()
+
+    async def geocode(self, location: str) -> Dict[str, Any]:
+        """
+        Canonical place for a free-text location: {"name", "country", "lat", "lon"}.
+        """
+        key = normalize_text(location)
+        cached = self.geocode_cache.get(key)
+        if cached is not None:
+            self.counters["geocode_hits"] += 1
+            return cached[0]
+        if self.not_found_cache.get(key) is not None:
+            # Misspelled or made-up places are asked about repeatedly too: remember the miss briefly
+            self.counters["geocode_hits"] += 1
+            raise LocationNotFound(f"Could not find location '{location}'.")
+        self.counters["geocode_misses"] += 1
+
+        async def lookup():
+            matches = await self._get("/geo/1.0/direct", {"q": location, "limit": 1})
+            if not matches:
+                self.not_found_cache.set(key, True)
+                raise LocationNotFound(f"Could not find location '{location}'.")
+            match = matches[0]
+            place = {"name": match.get("name", location), "country": match.get("country"),
+                     "lat": round(match["lat"], 2), "lon": round(match["lon"], 2)}
+            self.geocode_cache.set(key, place)
+            return place
+
+        return await self.flights.do(f"geocode:{key}", lookup)
+
+    async def current(self, location: str) -> Tuple[Dict[str, Any], str]:
+        """
+        Current weather for a location plus how it was served: "hit", "stale" or "miss".
+        """
+        place = await self.geocode(location)
+        key = f"{place['lat']},{place['lon']}"
+        cached = self.weather_cache.get(key)
+        if cached is not None:
+            data, age = cached
+            if age <= self.settings["ttl"]:
+                self.counters["hits"] += 1
+                return data, "hit"
+            self.counters["stale_hits"] += 1
+            self._refresh_in_background(key, place)
+            return data, "stale"
+
+        self.counters["misses"] += 1
+        return await self._fetch(key, place), "miss"
+
+    async def _fetch(self, key: str, place: Dict[str, Any]) -> Dict[str, Any]:
+        async def fetch():
+            data = await self._get("/data/2.5/weather", {"lat": place["lat"], "lon": place["lon"], "units": "metric"})
+            data["name"] = place["name"]  # canonical name, not the weather station's
+            self.weather_cache.set(key, data)
+            return data
+
+        return await self.flights.do(f"weather:{key}", fetch)
+
+    def _refresh_in_background(self, key: str, place: Dict[str, Any]):
+        async def refresh():
+            try:
+                await self._fetch(key, place)
+            except Exception as e:
+                logger.warning(f"Background weather refresh for {place['name']} failed: {e}")
+
+        task = asyncio.ensure_future(refresh())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["stale_hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round((self.counters["hits"] + self.counters["stale_hits"]) / lookups, 3) if lookups else 0.0,
+            "cached_locations": len(self.weather_cache),
+            "cached_geocodes": len(self.geocode_cache),
+            "refreshing": len(self._refreshes),
+            "coalescing": self.flights.stats(),
+        }
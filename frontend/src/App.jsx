@@ -59,6 +59,7 @@ function App() {
 
     const formData = new FormData();
     formData.append("file", file);
+    formData.append("session_id", sessionId); // uploads are only searchable from this session
     setFileUploading(true); // Start spinner
 
     try {
@@ -68,7 +69,7 @@ function App() {
       });
 
       if (response.ok) {
-        alert("PDF uploaded successfully.");
+        alert("PDF uploaded successfully. It will be searchable once indexing finishes.");
       } else {
         const errorData = await response.json();
         alert(`Error uploading PDF: ${errorData.message || response.statusText}`);